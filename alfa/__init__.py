@@ -1,2 +1,9 @@
-from .main import Alfa
 __version__ = '0.1.0'
+
+
+def __getattr__(name):
+    '''alfa.Alfa is imported on first use, so that "import alfa" (and the alfa command) starts fast'''
+    if name == 'Alfa':
+        from .main import Alfa
+        return Alfa
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
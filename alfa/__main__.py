@@ -1,9 +1,6 @@
-import pandas as pd
 from .cmdline import Parser
 from .config import CONFIG_DIR
 
-pd.set_option('display.max_colwidth', None)
-
 with open(f'{CONFIG_DIR}/logo') as f:
     logo = f.read()
 
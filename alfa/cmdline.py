@@ -1,28 +1,31 @@
 #!/bin/python3
 '''
 holds the parser configuration for the command line
+
+Only argparse is imported up front: each subcommand imports what it uses when it runs, so that
+"alfa --help" or "alfa init" do not wait for pandas, the Google API client or IPython.
 '''
 from argparse import ArgumentParser
-from .project_creator import Project
-from .main import *
-from IPython import embed
-import os.path, yaml
-
-from pprint import pprint
-from tabulate import tabulate
-
-from .utils.dates import normalize_datetime
-from .utils.summary import summary
+import json, os.path
 
 banner = '''
 use 'A' to access the Alfa object. A? for more info
 '''
 
+def normalize_datetime(value):
+    '''the dates of the arguments, see utils.dates.normalize_datetime'''
+    from .utils.dates import normalize_datetime
+    return normalize_datetime(value)
+
+def shard_count(value: str):
+    '''--shards is a number of windows or "auto"'''
+    return value if value == 'auto' else int(value)
+
 class Parser:
     def __init__(self):
         self.parser = ArgumentParser()
         self.subparsers = self.parser.add_subparsers(title='subcommands',required=True,dest='subcommand',
-                metavar='init, acquire, analyze, load')
+                metavar='init, acquire, analyze, load, watch, batch')
         self.parser_init = self.subparsers.add_parser('init',
                 help='intialize a project directory')
         self.parser_acquire = self.subparsers.add_parser('acquire',aliases=['a','ac'],
@@ -31,17 +34,29 @@ class Parser:
                 help='acquire and analyze audit log data, dropping into an interactive shell')
         self.parser_load = self.subparsers.add_parser('load',aliases=['l'],
                 help='load offline data, analyze and drop into a shell')
+        self.parser_watch = self.subparsers.add_parser('watch',aliases=['w'],
+                help='poll the audit logs for new activities and print the kill chains as they are found')
+        self.parser_batch = self.subparsers.add_parser('batch',aliases=['b'],
+                help='analyse many saved datasets without a shell, writing their subchains and a summary table')
 
         self.add_init_args()
         self.add_load_args()
         self.add_default_args(self.parser_acquire)
         self.add_default_args(self.parser_analyze)
         self.add_analyze_args()
+        self.add_watch_args()
+        self.add_batch_args()
+        self.add_profile_args(self.parser_load)
+        self.add_profile_args(self.parser_analyze)
+        self.add_compact_args(self.parser_load)
+        self.add_compact_args(self.parser_analyze)
 
         self.parser_init.set_defaults(func=self.handle_init)
         self.parser_acquire.set_defaults(func=self.handle_acquire)
         self.parser_analyze.set_defaults(func=self.handle_analyze)
         self.parser_load.set_defaults(func=self.handle_load)
+        self.parser_watch.set_defaults(func=self.handle_watch)
+        self.parser_batch.set_defaults(func=self.handle_batch)
 
     def add_init_args(self):
         self.parser_init.add_argument('path',type=str,
@@ -53,6 +68,8 @@ class Parser:
                 help='log type to load e.g. "drive"')
         self.parser_load.add_argument('-p','--path', type=str, required=True,
                 help='directory to load, e.g. --path data/foo')
+        self.parser_load.add_argument('-w','--workers', type=int, default=None,
+                help='load and analyse the logs in this many processes (default: 1, the current process)')
         pass
 
     def add_analyze_args(self):
@@ -60,6 +77,51 @@ class Parser:
                 help='save data to data/ to load later')
         pass
 
+    def add_watch_args(self):
+        self.parser_watch.add_argument('-l','--logtype',type=str,default='all',
+                help='log type to watch e.g. "drive"')
+        self.parser_watch.add_argument('--user', required=False, type=str, default='all')
+        self.parser_watch.add_argument('--no-filter', required=False, action='store_false', dest='filter',
+                help='disable filtering of benign activities')
+        self.parser_watch.add_argument('-st','--start-time',type=normalize_datetime,required=False,default=None,
+                help='watch from date (default: now, same formats as acquire)')
+        self.parser_watch.add_argument('-i','--interval',type=float,default=60,
+                help='seconds between polls (default 60)')
+        self.parser_watch.add_argument('--overlap',type=float,default=0,
+                help='seconds listed again on every poll, to pick up activities the API lists late (default 0)')
+        self.parser_watch.add_argument('--export',type=str,default=None,metavar='FILE',
+                help='append every subchain found to FILE, one JSON object per line')
+        pass
+
+    def add_batch_args(self):
+        self.parser_batch.add_argument('paths',type=str,nargs='+',metavar='PATH',
+                help='dataset directories or glob patterns, e.g. "data/*"')
+        self.parser_batch.add_argument('-o','--output',type=str,default='batch',
+                help='directory to write <dataset>/subchains.json, <dataset>/aoi.json and summary.csv to (default: batch)')
+        self.parser_batch.add_argument('-w','--workers',type=int,default=None,
+                help='analyse this many datasets at once (default: one per CPU)')
+        self.parser_batch.add_argument('-l','--logtype',type=str,default='all',
+                help='log type to analyse e.g. "drive"')
+        self.parser_batch.add_argument('--no-filter', required=False, action='store_false', dest='filter',
+                help='disable filtering of benign activities from the datasets')
+        self.parser_batch.add_argument('--no-compact', action='store_false', dest='compact',
+                help='keep the datasets in the default dtypes instead of the compact ones (more memory per worker)')
+        pass
+
+    def add_compact_args(self, subparser):
+        subparser.add_argument('--compact',action='store_true',
+                help='keep the activities and events in compact dtypes (categoricals, datetimes), which takes about half the memory')
+        pass
+
+    def add_profile_args(self, subparser):
+        subparser.add_argument('--profile',action='store_true',
+                help='print the wall time, CPU time, rows and peak memory of every stage of the analysis (slower)')
+        subparser.add_argument('--profile-report',type=str,default=None,metavar='FILE',
+                help='write the --profile stats to FILE as JSON')
+        subparser.add_argument('--cprofile',type=str,default=None,metavar='STAGE',
+                help='run one stage under cProfile (e.g. "label", "normalize", "subchains") and save it to STAGE.prof')
+        pass
+
     def add_default_args(self, subparser):
         subparser.add_argument('-l','--logtype',type=str,default='all',
                 help='log type to load e.g. "drive"')
@@ -79,21 +141,50 @@ class Parser:
         subparser.add_argument('-q','--query',type=str,
                 help='supply a yaml file containing query information. e.g. logtype, save path etc.')
         subparser.add_argument('--nd',action='store_true',help='save data as newline delimited')
+        subparser.add_argument('--resume',action='store_true',
+                help='continue an interrupted acquisition in --path from its checkpoints, instead of starting over')
+        subparser.add_argument('--columnar',action='store_true',
+                help='also write a columnar copy of the data next to the json files: about twice as fast to load, slower to acquire')
+        subparser.add_argument('--async',action='store_true',dest='use_async',
+                help='collect with the asyncio engine, which keeps many more requests in flight than the default threads')
+        subparser.add_argument('--compress',type=str,required=False,default=None,choices=['gzip','lzma'],
+                help='save the logs compressed (<logtype>.json.gz or .json.xz), loading reads them transparently')
+        subparser.add_argument('--shards',type=shard_count,required=False,default=None,
+                help='fetch each log in this many time windows concurrently, or "auto" to choose from the volume of the first page')
+        subparser.add_argument('--shard-size',type=str,required=False,default=None,
+                help='fetch each log in time windows of at most this length concurrently, e.g. "1D" or "6h"')
+        subparser.add_argument('--pool-size',type=int,required=False,default=None,
+                help='send the requests through one pool of this many keep-alive connections shared by the threads, instead of a connection per thread')
 
     def handle_init(self, args):
+        from .project_creator import Project
         project = Project(args.path)
         print('---')
         print('Please copy your credentials.json to config/credentials.json and run "alfa acquire"!')
         pass
 
     def handle_load(self, args):
-        A = Alfa.load(args.logtype, path=args.path)
+        from .main.alfa import Alfa
+        profiler = self.make_profiler(args)
+        A = Alfa.load(args.logtype, path=args.path, profiler=profiler, workers=args.workers, compact=args.compact)
+        self.report_profile(profiler, args)
         # code.interact(banner=banner,local=locals())
+        self.shell(A)
+        pass
+
+    def shell(self, A):
+        '''drops into IPython with A, the classes of alfa.main and summary in scope'''
+        import pandas as pd
+        from IPython import embed
+        from .main import Alfa, Analyser, KillChain, Collector, AsyncCollector, Profiler, Watcher
+        from .utils.summary import summary
+        pd.set_option('display.max_colwidth', None)
         print(banner)
         embed(display_banner=False)
         pass
 
     def handle_acquire(self, args):
+        from .main.alfa import Alfa
         if args.query:
             query = self.load_query(args.query)
             query['save'] = True
@@ -107,16 +198,74 @@ class Parser:
         pass
 
     def handle_analyze(self, args):
+        from .main.alfa import Alfa
+        profiler = self.make_profiler(args)
         if args.query:
             query = self.load_query(args.query)
-            A = Alfa.query(**query)
+            A = Alfa.query(**query, profiler=profiler)
         else:
-            A = Alfa.query(**vars(args))
-        print(banner)
-        embed(display_banner=False)
+            query = {k: v for k, v in vars(args).items() if k not in ('profile','profile_report','cprofile')}
+            A = Alfa.query(**query, profiler=profiler)
+        self.report_profile(profiler, args)
+        self.shell(A)
+        pass
+
+    def handle_batch(self, args):
+        from tabulate import tabulate
+        from .main.batch import analyse_datasets, SUMMARY_COLUMNS
+        summaries = analyse_datasets(args.paths, output=args.output, workers=args.workers,
+                                     progress=lambda s: print(f"{s['dataset']:>30}: {s['error'] or 'done'} ({s['seconds']}s)"),
+                                     logtype=args.logtype, filter=args.filter, compact=args.compact)
+        if not summaries:
+            print('no datasets found in', ' '.join(args.paths))
+            return
+        print(tabulate([[s[c] for c in SUMMARY_COLUMNS] for s in summaries], headers=SUMMARY_COLUMNS))
+        print('saved to', args.output)
+        pass
+
+    def handle_watch(self, args):
+        from .main.watch import Watcher
+        W = Watcher(args.logtype, user=args.user, start_time=args.start_time, interval=args.interval,
+                    overlap=args.overlap, filter=args.filter)
+        print('watching', ', '.join(W.logtypes) if len(W.logtypes) < 5 else f'{len(W.logtypes)} logtypes',
+              'from', W.last_time.isoformat(), '(ctrl-c to stop)')
+        try:
+            for subchain, events in W.run():
+                self.report_subchain(subchain, events, args.export)
+        except KeyboardInterrupt:
+            for subchain, events in W.flush():
+                self.report_subchain(subchain, events, args.export)
         pass
 
+    def report_subchain(self, subchain, events, export=None):
+        start, end, kcs = subchain
+        first, last = events['activity_time'].min(), events['activity_time'].max()
+        actors = sorted(events['actor.email'].dropna().unique())
+        print(f'{first} - {last}  kcs: {kcs:.2f}  events: {end - start}  actors: {", ".join(actors)}')
+        if export:
+            record = {'start': start, 'end': end, 'kcs': kcs, 'first_time': first.isoformat(),
+                      'last_time': last.isoformat(), 'actors': actors, 'events': events['name'].tolist()}
+            with open(export, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+    def make_profiler(self, args):
+        if not (args.profile or args.profile_report or args.cprofile):
+            return None
+        from .main.profiler import Profiler
+        return Profiler(memory=args.profile or bool(args.profile_report), cprofile=args.cprofile)
+
+    def report_profile(self, profiler, args):
+        if profiler is None:
+            return
+        print(profiler.table())
+        if args.profile_report:
+            profiler.report(args.profile_report)
+            print('profile saved to', args.profile_report)
+        if args.cprofile:
+            print('cProfile of', args.cprofile, 'saved to', profiler.cprofile_path)
+
     def load_query(self,filename: str) -> dict:
+      import yaml
       if not os.path.exists(filename):
         print('cannot find file:',filename)
         return dict()
@@ -124,7 +273,9 @@ class Parser:
         query = yaml.safe_load(f)
       return query
 
-    def do_summary(self,A: Alfa):
+    def do_summary(self,A):
+        from pprint import pprint
+        from tabulate import tabulate
         print('\n\n---------- Events ---------------\n\n')
         pprint(A.events[['type','attack.category']].head())
         print('\n\n')
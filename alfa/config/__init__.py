@@ -1,11 +1,21 @@
 from ..utils.path import rel_path, CONFIG_DIR
-import yaml, os.path
+import os.path
 
 relative_config = './config/config.yml' # used when inside of a project directory
-if os.path.exists(relative_config):
-    config = yaml.safe_load(
-            open(relative_config))
-else:
-    config = yaml.safe_load(
-      open(rel_path(CONFIG_DIR,'config.yml'))
-      )
+
+
+def load_config() -> dict:
+    import yaml
+    if os.path.exists(relative_config):
+        with open(relative_config) as f:
+            return yaml.safe_load(f)
+    with open(rel_path(CONFIG_DIR,'config.yml')) as f:
+        return yaml.safe_load(f)
+
+
+def __getattr__(name):
+    '''config is read on first use (from ..config import config), not when the package is imported'''
+    if name == 'config':
+        globals()['config'] = load_config()
+        return globals()['config']
+    raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
@@ -1,2 +1,28 @@
-from .alfa import Alfa, Analyser, KillChain
-from .collector import Collector
\ No newline at end of file
+'''
+the classes below are imported on first use (alfa.main.Alfa, from alfa.main import Collector, ...), so that
+importing one module of alfa.main does not import pandas and the Google API client with all the others
+'''
+from importlib import import_module
+
+_modules = {
+    'Alfa': 'alfa',
+    'Analyser': 'analyser',
+    'KillChain': 'kill_chain',
+    'Collector': 'collector',
+    'AsyncCollector': 'async_collector',
+    'Profiler': 'profiler',
+    'Watcher': 'watch',
+}
+__all__ = list(_modules)
+
+
+def __getattr__(name):
+    if name not in _modules:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    value = getattr(import_module('.' + _modules[name], __name__), name)
+    globals()[name] = value
+    return value
+
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -1,5 +1,7 @@
+from pandas import to_datetime
 from pandas.core.series import Series
 from pandas.core.frame import DataFrame
+from .compact import categorize
 
 
 class Activity(Series):
@@ -35,3 +37,15 @@ class Activities(DataFrame):
         super().__init__(*args, **kwargs)
         if 'id.uniqueQualifier' in self.columns:
             self.set_index('id.uniqueQualifier',inplace=True)
+
+    def compact(self) -> 'Activities':
+        '''
+        returns a copy with id.time as datetime64 (UTC) and the low cardinality string columns
+        (actor.email, id.applicationName, ...) as categoricals, see compact.py
+        '''
+        df = self.copy(deep=False)
+        if 'id.time' in df and df['id.time'].dtype.kind != 'M':
+            df['id.time'] = to_datetime(df['id.time'], format='ISO8601', utc=True)
+        for column, series in categorize(df, exclude=('id.time', 'events')).items():
+            df[column] = series
+        return df
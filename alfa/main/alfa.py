@@ -1,16 +1,22 @@
 #!/bin/python3
-import os
+import numpy as np
 import pandas as pd
+from contextlib import nullcontext
+from itertools import chain
 from .analyser import Analyser
 from .activity import Activities, Activity
 from .event import Events
 from pandas.core.series import Series
 from pandas import to_datetime
-from typing import Tuple, Union
+from typing import Union
 
 from ..config import config
 from .kill_chain import KillChain
 from .collector import Collector
+from .async_collector import AsyncCollector
+from .profiler import Profiler, profile, active_profiler
+from .parallel import dataset_chunks, load_parallel, map_parallel, group_subchains
+from functools import partial
 
 class Alfa:
     '''Takes all suspicious activities and creates a separate "events"
@@ -20,53 +26,88 @@ class Alfa:
     Can be initialized as empty, or with an Activities dataframe.
     Typically will be initialized through static methods:
         Alfa.load, Alfa.load_unfiltered, or Alfa.query
+
+    compact: store the activities and events in compact dtypes (categoricals, datetime64, Int8 attack.index,
+        shared label tuples) instead of filling every missing value with '', see compact.py. Takes
+        about half the memory. Alfa.load and Alfa.query take it too.
+
+    Alfa.load and Alfa.query take a Profiler, which is kept in .profiler: .stats has the wall time, CPU time,
+    rows and peak memory of every stage (see profiler.py), including the later calls to subchains and aoi.
     '''
     activities = Activities(**config['activity_defaults'])
     events = Events()
+    profiler = None
+    compact = False
+    required_columns = ['id.uniqueQualifier', 'id.time', 'actor.email', 'events']
 
-    def __init__(self, activity_list: list = None) -> None:
+    def __init__(self, activity_list: list = None, compact: bool = False) -> None:
         self.collector = Collector()
+        self.compact = compact
         if activity_list is not None:
             self.activities = Activities(activity_list)
+            if compact:
+                self.activities = self.activities.compact()
             self.events = self.initialize_events()
-            self.activities = self.activities.fillna('')
+            if compact:
+                self.events = self.events.compact()
+            else:
+                self.activities = self.activities.fillna('')
         pass
 
-    def __get_events(self, activity: Series) -> list:
-        return activity['events']
-
-    def __get_all_events(self) -> Tuple[list, list]:
-        all_events = []
-        if self.activities.shape[0] == 0:
-            return []
-        for activity in self.activities.iloc:
-            activity_id = activity.name
-            new_events = self.__get_events(activity)
-            for event in new_events:
-                event['activity_id'] = activity_id
-                event['activity_time'] = to_datetime(activity['id.time'])
-            all_events = all_events + new_events
-
-        return all_events
-
-    def __create_events(self, all_events: list) -> Events:
-        E = Events(all_events)
+    def __get_all_events(self) -> Events:
+        '''
+        builds the events table in a single pass: the event lists of all activities are flattened
+        into one frame, and activity_id / activity_pos / activity_time are repeated once per event.
+        activity_pos is the row position of the activity in self.activities, see activity_at.
+        The event dicts of the activities are copied, not modified.
+        '''
+        if self.activities.shape[0] == 0 or 'events' not in self.activities:
+            return Events()
+        with profile('events') as stage:
+            E = self.__flatten_events()
+            stage.rows = E.shape[0]
+        return E
+
+    def __flatten_events(self) -> Events:
+        event_lists = [
+            events if isinstance(events, list) else []
+            for events in self.activities['events'].tolist()
+        ]
+        counts = np.fromiter(map(len, event_lists), dtype=np.intp, count=len(event_lists))
+        E = Events(list(chain.from_iterable(event_lists)))
+        if E.shape[0] == 0:
+            return E
+        activity_times = pd.DatetimeIndex(to_datetime(self.activities['id.time'], format='ISO8601'))
+        E['activity_id'] = self.activities.index.repeat(counts)
+        E['activity_pos'] = np.arange(len(event_lists), dtype=np.intp).repeat(counts)
+        E['activity_time'] = activity_times.repeat(counts)
+        return E
+
+    def __create_events(self, E: Events) -> Events:
         if 'activity_time' not in E:
             print('warning: no data in dataset!')
             E.parent = self
             return E
         # throws an error if dataframe is empty
-        E = E.sort_values('activity_time', ignore_index=True)
+        with profile('sort', E.shape[0]):
+            E = E.sort_values('activity_time', ignore_index=True, kind='stable')
         E.parent = self
         return E
 
     def initialize_events(self) -> Events:
-        all_events = self.__get_all_events()
-        return self.__create_events(all_events)
+        return self.__create_events(self.__get_all_events())
 
     def activity_by_id(self, uid: str) -> Activity:
         return self.activities.loc[uid]
 
+    def activity_at(self, pos: int) -> Activity:
+        '''the activity at row position pos (the activity_pos of its events), without a label lookup'''
+        return self.activities.iloc[int(pos)]
+
+    def activities_at(self, positions) -> Activities:
+        '''the activities at these row positions, in one take, e.g. A.activities_at(A.events['activity_pos'].unique())'''
+        return self.activities.take(np.asarray(positions, dtype=np.intp))
+
     def filter(self, filter_array: Series) -> 'Alfa':
         '''
     Filters on *activities* and returns a new Alfa object.
@@ -75,7 +116,7 @@ class Alfa:
     will return activities whose email starts with 'attacker'
         '''
         filtered_activities = self.activities[filter_array]
-        return Alfa(filtered_activities)
+        return Alfa(filtered_activities, compact=self.compact)
 
     def kcs(self, start_index: int = 0, end_index: int = None):
         '''
@@ -85,50 +126,150 @@ class Alfa:
         E = self.events['attack.index']
         if end_index and end_index > start_index:
             E = E.iloc[slice(start_index, end_index)]
-        return KillChain.generate_kill_chain_statistic(list(E))
+        return KillChain.kill_chain_statistic(E)
+
+    def kcs_windows(self, windows: list = None, window_length: int = None) -> np.ndarray:
+        '''
+        return the kill_chain_statistic for many slices of the events at once.
+        windows: list of [start_index, end_index] e.g. A.subchains()
+        window_length: every slice of this length, e.g. A.kcs_windows(window_length=10)[i] == A.kcs(i, i+10)
+        '''
+        return KillChain.kill_chain_statistics(self.events['attack.index'], windows, window_length)
+
+    @property
+    def stats(self) -> dict:
+        '''the per stage stats of the profiler of this object (see Profiler.stats), empty if it was not profiled'''
+        return self.profiler.stats() if self.profiler is not None else dict()
+
+    def __profiling(self):
+        '''activates the profiler of this object, so that calls made after loading are profiled too'''
+        if self.profiler is None or active_profiler() is self.profiler:
+            return nullcontext()
+        return self.profiler
 
     def subchains(self, min_length=None, min_stat=None):
-        subchains = KillChain.discern_subchains(
-            self.events['attack.index'], min_length, min_stat)
+        with self.__profiling(), profile('subchains') as stage:
+            subchains = KillChain.discern_subchains(
+                self.events['attack.index'], min_length, min_stat)
+            stage.rows = len(subchains)
         return sorted(subchains, key=lambda x: x[2], reverse=True)
 
+    def __group_keys(self, column: str) -> np.ndarray:
+        '''the value of an activity column (e.g. actor.email) for every event'''
+        return self.activities[column].to_numpy()[self.events['activity_pos'].to_numpy()]
+
+    def group_events(self, group, column: str = 'actor.email') -> Events:
+        '''the events of one group, in time order, e.g. A.group_events('bob@example.com'). See subchains_by'''
+        return self.events[self.__group_keys(column) == group]
+
+    def __group_chains(self, column: str, min_size: int, min_labelled: int) -> dict:
+        '''group -> attack indexes of its events, for the groups with more than min_size events and at least min_labelled labelled'''
+        if self.events.shape[0] == 0:
+            return dict()
+        codes, groups = pd.factorize(self.__group_keys(column))  # code -1: no group (missing value)
+        index = KillChain.index_array(self.events['attack.index'])
+        grouped = codes >= 0
+        sizes = np.bincount(codes[grouped], minlength=len(groups))
+        labelled = np.bincount(codes[grouped], weights=~np.isnan(index[grouped]), minlength=len(groups))
+        order = np.argsort(codes, kind='stable')  # the events of each group together, still in time order
+        ends = np.cumsum(sizes) + (~grouped).sum()
+        return {
+            groups[code]: index[order[end - sizes[code]:end]].tolist()
+            for code, end in enumerate(ends)
+            if sizes[code] > min_size and labelled[code] >= min_labelled
+        }
+
+    def __group_results(self, column: str, min_size: int, workers: int, min_labelled: int, **options) -> dict:
+        '''group -> (kcs, subchains) of the chain of each group, see group_subchains for the options'''
+        with self.__profiling(), profile('subchains_by') as stage:
+            chains = self.__group_chains(column, min_size, min_labelled)
+            groups = sorted(chains, key=lambda group: len(chains[group]), reverse=True)  # largest first, balances the workers
+            results = map_parallel(partial(group_subchains, **options), [chains[group] for group in groups], workers or 1)
+            stage.rows = len(groups)
+        return dict(zip(groups, results))
+
+    def subchains_by(self, column: str = 'actor.email', min_length=None, min_stat=None, workers: int = None,
+                     min_labelled: int = 2) -> list:
+        '''
+        subchains of the events of each group (by default each actor) on its own, instead of one timeline of
+        everyone's events: [[group, start, end, kcs], ...], best first. start and end are positions in
+        A.group_events(group, column).
+        workers: run the groups in a pool of that many processes, see parallel.py
+        min_labelled: skip the groups with fewer labelled events. With fewer than 2 there is no transition,
+            so no subchain (for min_stat >= 0)
+        '''
+        if min_length is None:
+            min_length = config['kill_chain']['min_chain_length']
+        results = self.__group_results(column, min_length, workers, min_labelled, min_length=min_length, min_stat=min_stat)
+        subchains = [[group] + subchain for group, (_, chains) in results.items() for subchain in chains]
+        return sorted(subchains, key=lambda x: x[3], reverse=True)
+
+    def kcs_by(self, column: str = 'actor.email', workers: int = None, min_labelled: int = 2) -> dict:
+        '''the kill chain statistic of the events of each group, {group: kcs}, see subchains_by'''
+        results = self.__group_results(column, 1, workers, min_labelled, subchains=False)
+        return {group: kcs for group, (kcs, _) in results.items()}
+
     @staticmethod
-    def acquire(logtype: str, *args, **kwargs) -> Union[list, dict]:
+    def acquire(logtype: str, *args, use_async: bool = False, **kwargs) -> Union[list, dict]:
         '''
         Collect records from API, do not process them
         This is a wrapper around Collector, see Collector.query for for details
+        use_async: collect with AsyncCollector (asyncio) instead of threads
         '''
-        C = Collector()
+        C = AsyncCollector() if use_async else Collector()
         res = C.query(logtype, *args, **kwargs)  # this return a dataframe
         return res
 
     @staticmethod
-    def query(logtype: str, filter=True, *args, **kwargs):
+    def query(logtype: str, filter=True, *args, use_async: bool = False, profiler: Profiler = None,
+              compact: bool = False, **kwargs):
         '''
         Query API directly, returns an Alfa object. See collector
+        profiler: profile the stages of the query and analysis, see Profiler
+        compact: see Alfa
         '''
-        C = Collector()
+        C = AsyncCollector() if use_async else Collector()
         A = Analyser()
-        Q = C.query(logtype, *args, **kwargs)
-        records = A.analyse(Q, filter=filter)
-        return Alfa(Activities(records))
+        with profiler or nullcontext():
+            with profile('collect') as stage:
+                Q = C.query(logtype, *args, **kwargs)
+                stage.rows = len(Q)
+            records = A.analyse(Q, filter=filter)
+            res = Alfa(Activities(records), compact=compact)
+        res.profiler = profiler
+        return res
 
     @staticmethod
-    def load(logtype: str, path: str = None, email: list = None, filter: bool = True) -> None:
+    def load(logtype: str, path: str = None, email: list = None, filter: bool = True,
+             columns: list = None, start_time: str = None, end_time: str = None, profiler: Profiler = None,
+             workers: int = None, compact: bool = False) -> None:
         '''
         load a log (or all logs), the data/ folder label and *filter* and
         return an Alfa object. Optionally filter by email.
+        The logtypes with a columnar copy (written by acquire, see ColumnStore) are read from it instead of their json file:
+            columns: only load these activity columns (the columns needed for the analysis are always loaded)
+            start_time, end_time: only load the days in between (whole days, from the json files too)
+        profiler: profile the stages of the loading and analysis, see Profiler
+        workers: load and label the logtypes (and parts of the large ones) in a pool of that many processes,
+            see parallel.py. The stages that run in the workers are profiled as a whole, as load_parallel
+        compact: see Alfa
         See analyser for details
         '''
         A = Analyser()
-        C = Collector()
-        if logtype == 'all':
-            all_ = C.load_all(path)
-            records = A.analyse(all_, email=None, filter=filter)
-            return Alfa(Activities(records))
-        Q = C.load(os.path.join(path, logtype+'.json'))
-        records = A.analyse(Q, email=None, filter=filter)
-        return Alfa(Activities(records))
+        if columns is not None:
+            columns = list(dict.fromkeys(Alfa.required_columns + list(columns)))
+        with profiler or nullcontext():
+            if workers and workers > 1:
+                with profile('load_parallel') as stage:
+                    records = load_parallel(path, logtype, workers, columns=columns, start_time=start_time,
+                                            end_time=end_time, filter=filter)
+                    stage.rows = records.shape[0]
+            else:
+                chunks = dataset_chunks(path, logtype, columns, start_time, end_time)
+                records = A.analyse_chunks(chunks, email=None, filter=filter)
+            res = Alfa(Activities(records), compact=compact)
+        res.profiler = profiler
+        return res
 
     def __aoi(self, concat: bool = True):
         '''
@@ -136,22 +277,19 @@ class Alfa:
         Automates the following:
             1. get subchains
             2. join subchains that are close by
-            3. grab event slices from those subchains
+            3. grab the events of those subchains
             4. list out the unique activities associated with those subchains
+        Steps 3 and 4 work on the (start, end) intervals directly, see Events.interval_activities
         concat: bool, if True (default) then append
                 the activity slices to one another
         '''
         subchains = self.subchains()
-        long_chains = KillChain.join_subchains_loop(subchains)
-        event_slices = self.events.get_event_slices(long_chains)
-        activity_slices = [e.activities() for e in event_slices]
-        if len(activity_slices) == 0: # prevent possible concat on empty list
-            return activity_slices
-        if concat:
-            res = pd.concat(activity_slices)
-            res = res[~res.index.duplicated()]
-            return res
-        return activity_slices
+        with profile('join', len(subchains)):
+            long_chains = KillChain.join_subchains_loop(subchains)
+        with profile('aoi_activities') as stage:
+            res = self.events.interval_activities(long_chains, concat=concat)
+            stage.rows = len(res) if concat else sum(map(len, res))
+        return res
 
     def aoi(self, export: str = None, nd: bool=False):
         '''
@@ -160,9 +298,12 @@ class Alfa:
         exports data ras a JSON file
         '''
         if len(self.events) != 0:
-            aoi = self.__aoi()
+            with self.__profiling():
+                aoi = self.__aoi()
             if export is not None:
                 aoi['events'] = aoi['events'].apply(self.list_to_string) #parsing to string so the list doesn't crash when parsed to json
+                for column in aoi.columns[[dtype.kind == 'M' for dtype in aoi.dtypes]]: # compact: times as in the logs
+                    aoi[column] = aoi[column].dt.strftime('%Y-%m-%dT%H:%M:%S.%f').str[:-3] + 'Z'
                 if nd:
                     with open(export, 'w') as f:
                         for _, row in aoi.iterrows():
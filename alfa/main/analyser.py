@@ -1,10 +1,14 @@
 #!/bin/python3
-import yaml
+import numpy as np
 import pandas as pd
+from functools import partial
 
-from ..utils.path import rel_path, CONFIG_DIR, DATA_DIR
+from ..utils.path import rel_path, DATA_DIR
 from ..config import config
-from .kill_chain import KillChain
+from .mapping import MitreMapping
+from .parallel import map_parallel
+from .profiler import profile
+from .store import ColumnStore
 
 class Analyser:
   '''
@@ -14,34 +18,52 @@ class Analyser:
   at least 1 event exists within the event_to_mitre yml database.
 
   Each event for each record is given new attributes 'attack.label' 'attack.category' and 'attack.index' for all associated mitre attacks for that event.
+
+  The mapping is compiled once per process and cached on disk, see MitreMapping.
   '''
   def __init__(self) -> None:
-      self.event_mapping = yaml.safe_load(open(rel_path(CONFIG_DIR,'event_to_mitre.yml')))
+      self.mapping = MitreMapping.load()
+      self.event_mapping = self.mapping.labels
   
-  def analyse_all_files(self, email: list=None,filter=True, subdir=None) -> pd.DataFrame:
-    '''Takes all files, analyses and concats into a single DataFrame'''
+  def analyse_all_files(self, email: list=None,filter=True, subdir=None, workers: int=None) -> pd.DataFrame:
+    '''Takes all files, analyses and concats into a single DataFrame.
+    workers: load and analyse the logtypes in a pool of that many processes (see parallel.py)'''
+    if workers and workers > 1:
+      dfs = map_parallel(partial(self.analyse_from_file, email=email, filter=filter, subdir=subdir), config['logs'], workers)
+      return pd.concat(dfs) if dfs else pd.DataFrame()
     dfs = []
     for log in config['logs']:
       log_df = self.analyse_from_file(log,email,filter=filter, subdir=subdir)
       dfs.append(log_df)
     return pd.concat(dfs) if dfs else pd.DataFrame()
 
-  def analyse_all(self,log_dict,email: list=None,filter=True) -> pd.DataFrame:
-    '''takes dict of logs, and analyses and concats them into a single DataFrame'''
+  def analyse_all(self,log_dict,email: list=None,filter=True, workers: int=None) -> pd.DataFrame:
+    '''takes dict of logs, and analyses and concats them into a single DataFrame.
+    workers: analyse the logs in a pool of that many processes. The events of log_dict are then labelled in
+    copies of the DataFrames (the returned ones), not in place'''
+    if workers and workers > 1:
+      dfs = map_parallel(partial(self.analyse, email=email, filter=filter), list(log_dict.values()), workers)
+      return pd.concat(dfs) if dfs else pd.DataFrame()
     dfs = []
     for log in log_dict:
       log_df = self.analyse(log_dict[log],email,filter=filter)
       dfs.append(log_df)
     return pd.concat(dfs) if dfs else pd.DataFrame()
     
+  def analyse_chunks(self,chunks,email: list=None,filter=True) -> pd.DataFrame:
+    '''takes an iterable of DataFrames (e.g. Collector.load_all_chunks), analyses each one as it arrives and concats the results.
+    With filter, only the labelled activities of each chunk are kept in memory'''
+    dfs = [self.analyse(chunk,email,filter=filter) for chunk in chunks]
+    return pd.concat(dfs, ignore_index=True) if dfs else pd.DataFrame()
+
   def load_file(self,logtype,subdir=None):
-    '''Loads file from data/ directory. If a subdir is given, will load from data/<subdir>'''
-    df_name = logtype+'.pkl'
-    if subdir:
-      filename = rel_path(DATA_DIR,subdir,df_name)
-    else:
-      filename = rel_path(DATA_DIR,df_name)
-    return pd.read_pickle(filename)
+    '''Loads file from data/ directory. If a subdir is given, will load from data/<subdir>.
+    Reads the columnar copy of the logtype if there is one (see ColumnStore), else data/<subdir>/<logtype>.pkl'''
+    directory = rel_path(DATA_DIR,subdir) if subdir else DATA_DIR
+    store = ColumnStore(directory)
+    if store.days(logtype):
+      return store.read(logtype)
+    return pd.read_pickle(rel_path(directory,logtype+'.pkl'))
   
   def analyse_from_file(self,logtype: str,email=None,filter=True, subdir=None):
     '''load file and pass to analyse method'''
@@ -57,20 +79,65 @@ class Analyser:
       if row['actor.email'] not in email:
         return None, has_labels
     for event in row['events']:
-      if event['name'] in self.event_mapping:
+      if event['name'] in self.mapping:
         has_labels = True
-        attack_label = self.event_mapping[event['name']]
-        attack_category = [label.split('.')[-1] for label in attack_label]
-        event['attack.label'] = attack_label
-        event['attack.category'] = attack_category
-        event['attack.index'] = KillChain.reduce_category_list(attack_category)
+        event['attack.label'] = self.mapping.labels[event['name']]
+        event['attack.category'] = self.mapping.categories[event['name']]
+        event['attack.index'] = self.mapping.indexes[event['name']]
     return row, has_labels
 
-  def analyse(self,df: pd.DataFrame,email: list=None, filter: bool=True) -> pd.DataFrame:
-    '''takes a DataFrame, outputs labelled, *filtered, DataFrame. Filter will filter out benign events. If email is passed, will only contain events from that email address.'''
+  def analyse(self,df: pd.DataFrame,email: list=None, filter: bool=True, vectorized: bool=True) -> pd.DataFrame:
+    '''takes a DataFrame, outputs labelled, *filtered, DataFrame. Filter will filter out benign events. If email is passed, will only contain events from that email address.
+    vectorized (default) labels all events in bulk, see analyse_vectorized. Set to False to label row by row (analyse_rows)'''
+    with profile('label') as stage:
+      if vectorized:
+        df = self.analyse_vectorized(df,email,filter=filter)
+      else:
+        df = self.analyse_rows(df,email,filter=filter)
+      stage.rows = df.shape[0]
+    return df
+
+  def analyse_rows(self,df: pd.DataFrame,email: list=None, filter: bool=True) -> pd.DataFrame:
+    '''row by row labelling, calls label_row for each activity'''
     mitre_df = []
     for row in df.iloc:
       row, add_row = self.label_row(row,email)
       if (filter and add_row) or not filter:
         mitre_df.append(row)
     return pd.DataFrame(mitre_df)
+
+  def analyse_vectorized(self,df: pd.DataFrame,email: list=None, filter: bool=True) -> pd.DataFrame:
+    '''
+    same output as analyse_rows, but labels every event in one pass:
+      1. explode the events column once (index = row position)
+      2. map event names through the compiled mapping in bulk
+      3. filter activities with a boolean mask of rows that have at least 1 labelled event
+    '''
+    if email:
+      if 'actor.email' not in df:
+        return pd.DataFrame()
+      df = df[df['actor.email'].isin(email)]
+    if 'events' not in df or df.shape[0] == 0:
+      return df.iloc[0:0] if filter else df
+
+    exploded = df['events'].reset_index(drop=True).explode()
+    exploded = exploded[exploded.notna()] # rows with no events
+    names = pd.Series([event.get('name') for event in exploded.values], index=exploded.index, dtype=object)
+    is_labelled = names.isin(self.mapping.labels.keys()).to_numpy()
+
+    labelled_names = names[is_labelled]
+    columns = zip(
+      exploded.values[is_labelled],
+      labelled_names.map(self.mapping.labels).tolist(),
+      labelled_names.map(self.mapping.categories).tolist(),
+      labelled_names.map(self.mapping.indexes).tolist())
+    for event, attack_label, attack_category, attack_index in columns:
+      event['attack.label'] = attack_label
+      event['attack.category'] = attack_category
+      event['attack.index'] = attack_index
+
+    if not filter:
+      return df
+    has_labels = np.zeros(df.shape[0], dtype=bool)
+    has_labels[exploded.index.to_numpy()[is_labelled]] = True
+    return df[has_labels]
@@ -0,0 +1,232 @@
+#!/bin/python3
+
+"""
+asyncio alternative to Collector.query: every logtype, and every window of a sharded logtype, is listed by a coroutine,
+so hundreds of page requests can be in flight from a single thread.
+Pagination, retries, checkpoints (--resume) and the saved files are the same as with Collector.query.
+
+The requests are sent by a transport (see transport.py), which can be replaced e.g. to test against a local server.
+"""
+import asyncio
+import json
+import random
+from urllib.parse import quote, urlencode
+
+import httplib2
+from google.auth.transport.requests import Request
+from googleapiclient.errors import HttpError
+
+from ..utils.compression import check_compression
+from ..utils.dates import normalize_datetime
+from .collector import Collector
+from .listing import Listing
+from .throttle import AsyncThrottle
+from .transport import StreamsTransport
+
+
+class AsyncCollector(Collector):
+    """
+    Collector whose .query runs on asyncio, see Collector for the parameters.
+        transport: sends the requests, default StreamsTransport
+        max_in_flight: maximum number of requests in flight, lowered while the API throttles (see AsyncThrottle)
+        credentials, api_endpoint: see Collector
+    """
+
+    API_ENDPOINT = "https://admin.googleapis.com/"
+    SERVICE_PATH = "admin/reports/v1/"
+    MAX_IN_FLIGHT = 200
+
+    def __init__(self, transport=None, max_in_flight: int = None, credentials=None, api_endpoint: str = None) -> None:
+        super().__init__(credentials, api_endpoint)
+        self.transport = transport
+        self.max_in_flight = max_in_flight or self.MAX_IN_FLIGHT
+        self.creds = credentials
+        self.request_count = 0
+        self._async_throttle = None
+        self._refresh_lock = None
+
+    def query(self, logtype: str, *args, **kwargs):
+        """see Collector.query. Runs its own event loop, from a running loop await query_async instead"""
+        return asyncio.run(self.query_async(logtype, *args, **kwargs))
+
+    async def query_async(
+        self,
+        logtype: str,
+        user: str = "all",
+        max_results: int = 1000,
+        max_pages: int = None,
+        start_time: str = None,
+        end_time: str = None,
+        save=False,
+        nd=False,
+        path=None,
+        return_as_df=True,
+        columnar: bool = False,
+        resume: bool = False,
+        shards=None,
+        shard_size: str = None,
+        compress: str = None,
+        **kwargs,
+    ):
+        """see Collector.query"""
+        if resume and not path:
+            raise ValueError("resume requires the path of the acquisition to continue")
+        check_compression(compress)
+        if self.creds is None:
+            self.creds = self.get_credentials()
+        self._async_throttle = AsyncThrottle(self.max_in_flight, self.throttle.bucket)
+        self._refresh_lock = asyncio.Lock()
+        throttle_before = self._async_throttle.stats()
+
+        logtype = self._logtypes(logtype)
+        start_time = normalize_datetime(start_time)
+        end_time = normalize_datetime(end_time)
+        save_path = self._dataset_path(path)
+        date_ranges = {typ: self._date_range(typ, start_time, end_time, save_path, resume) for typ in logtype}
+        options = dict(
+            user=user, max_results=max_results, max_pages=max_pages, resume=resume, compress=compress
+        )
+
+        transport = self.transport
+        if transport is None:
+            transport = self.transport = StreamsTransport()
+        try:
+            results = await asyncio.gather(
+                *(
+                    self.__query_logtype(save_path, typ, *date_ranges[typ], shards, shard_size, columnar, **options)
+                    for typ in logtype
+                ),
+                return_exceptions=True,
+            )
+        finally:
+            await transport.close()
+
+        errors = [res for res in results if isinstance(res, BaseException)]
+        if errors:
+            raise errors[0]
+
+        print("\n", sum(results), "activities saved to:", save_path)
+        self._print_throttle_stats(self._async_throttle, throttle_before)
+
+        if return_as_df:
+            return self.load_all(f"{save_path}")
+        return {"activities": dict()}
+
+    async def __query_logtype(
+        self, save_path, typ, start_time, end_time, shards, shard_size, columnar, **options
+    ) -> int:
+        """lists a logtype (all its windows if it is sharded) and saves it, returns the number of activities"""
+        try:
+            # the checkpoints are read and written (fsynced) outside of the event loop
+            if shards == "auto" and not (
+                options["resume"] and await asyncio.to_thread(self.read_checkpoint, save_path, typ)
+            ):
+                shards = await self.estimate_shards_async(typ, options["user"], options["max_results"], start_time, end_time)
+            windows = await asyncio.to_thread(
+                self.plan_windows, save_path, typ, options["user"], options["max_results"], options["max_pages"],
+                start_time, end_time, shards, shard_size, options["resume"], options["compress"]
+            )
+            if windows is None:
+                res = await self.query_one_async(save_path, typ, start_time=start_time, end_time=end_time, **options)
+            else:
+                await asyncio.gather(
+                    *(
+                        self.query_one_async(self.shard_path(save_path, typ, index), typ, start_time=start, end_time=end, **options)
+                        for index, (start, end) in enumerate(windows)
+                    )
+                )
+                res = await asyncio.to_thread(self.merge_windows, save_path, typ)
+        except Exception as e:
+            print(f"{typ:>25}: FAILED - {e}")
+            raise
+        return await asyncio.to_thread(self._logtype_saved, save_path, typ, res, columnar)
+
+    async def estimate_shards_async(self, logtype: str, user: str, max_results: int, start_time: str, end_time: str) -> int:
+        """see Collector.estimate_shards"""
+        start, end = self.window_range(start_time, end_time)
+        resp = await self.list_activities(
+            userKey=user, applicationName=logtype, maxResults=max_results, startTime=start, endTime=end
+        )
+        return self.shards_for_page(resp, max_results, start, end)
+
+    async def query_one_async(
+        self,
+        save_path: str,
+        logtype: str,
+        user: str = "all",
+        max_results: int = 1000,
+        max_pages: int = None,
+        start_time: str = None,
+        end_time: str = None,
+        resume: bool = False,
+        compress: str = None,
+    ) -> int:
+        """see Collector.query_one"""
+        # the data file and the checkpoint are written (fsynced) outside of the event loop
+        listing = await asyncio.to_thread(
+            Listing, self, save_path, logtype, user, max_results, max_pages, start_time, end_time, resume, compress
+        )
+        try:
+            while not listing.done:
+                self.request_count += 1
+                try:
+                    resp = await self.list_activities(**listing.request_params())
+                except HttpError as e:
+                    if not listing.restart(e):
+                        raise
+                    continue
+                # the page is fsynced before its checkpoint is written
+                await asyncio.to_thread(listing.save_page, resp)
+        finally:
+            listing.close()
+        return await asyncio.to_thread(listing.finish)
+
+    def activities_url(self, userKey: str, applicationName: str, **params) -> str:
+        """the url of activities.list, params as for googleapiclient (maxResults, startTime, pageToken, ...)"""
+        query = urlencode({name: value for name, value in params.items() if value is not None})
+        return (
+            f"{self.api_endpoint or self.API_ENDPOINT}{self.SERVICE_PATH}activity/users/{quote(str(userKey), safe='')}"
+            f"/applications/{quote(applicationName, safe='')}?{query}"
+        )
+
+    async def list_activities(self, **params) -> dict:
+        """
+        one page of activities.list, with the retries of Collector._execute_with_retry.
+        Errors are raised as googleapiclient HttpError, as with the googleapiclient requests.
+        """
+        url = self.activities_url(**params)
+        throttle = self._async_throttle
+        delay = self.RETRY_INITIAL_DELAY
+        refreshed = False
+        attempt = 1
+        while True:
+            headers = await self.__auth_headers(refresh=False)
+            started = await throttle.acquire()
+            try:
+                status, _, body = await self.transport.get(url, headers)
+            except BaseException:
+                await throttle.release(started)
+                raise
+            throttled = status == 429 or 500 <= status < 600
+            await throttle.release(started, throttled)
+            if 200 <= status < 300:
+                return json.loads(body)
+            if status == 401 and not refreshed:  # the access token expired while in flight
+                await self.__auth_headers(refresh=True)
+                refreshed = True
+                continue
+            error = HttpError(httplib2.Response({"status": status}), body, uri=url)
+            if not throttled or attempt == self.RETRY_MAX_ATTEMPTS:
+                raise error
+            await throttle.backoff(random.uniform(0, delay))
+            delay = min(delay * self.RETRY_BACKOFF_FACTOR, self.RETRY_MAX_DELAY)
+            attempt += 1
+
+    async def __auth_headers(self, refresh: bool) -> dict:
+        async with self._refresh_lock:
+            if refresh or not self.creds.valid:
+                # google.auth refreshes synchronously, keep the event loop running meanwhile
+                await asyncio.to_thread(self.creds.refresh, Request())
+        headers = dict()
+        self.creds.apply(headers)
+        return headers
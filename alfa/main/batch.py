@@ -0,0 +1,129 @@
+#!/bin/python3
+'''
+non-interactive analysis of many saved datasets (data/<timestamp> directories), for alfa batch.
+
+    summaries = analyse_datasets(['data/*'], output='batch', workers=4)
+
+Each dataset is loaded, analysed and written to <output>/<dataset>/ (subchains.json, aoi.json) by one of the
+processes of a single pool, which only sends back a summary row. A worker holds one dataset at a time, so memory
+is bounded by `workers` datasets, however many there are. The mapping is compiled once, before the pool starts
+(see MitreMapping), and shared by the workers.
+<output>/summary.json and <output>/summary.csv have the summaries of all the datasets.
+'''
+import contextlib
+import glob
+import io
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from .alfa import Alfa
+from .collector import Collector
+from .mapping import MitreMapping
+from .parallel import default_workers
+from .store import ColumnStore
+
+SUMMARY_COLUMNS = ['dataset', 'activities', 'events', 'labelled', 'subchains', 'max_kcs', 'aoi', 'actors',
+                   'seconds', 'error']
+
+
+def is_dataset(path: str) -> bool:
+    '''a directory with data files or a columnar copy, as written by alfa acquire'''
+    return os.path.isdir(path) and (ColumnStore(path).exists() or bool(Collector().data_files(path)))
+
+
+def dataset_paths(patterns: list) -> list:
+    '''the dataset directories matching the paths or glob patterns, e.g. ["data/*"], sorted and without duplicates'''
+    paths = []
+    for pattern in patterns:
+        paths += sorted(glob.glob(pattern)) if glob.has_magic(pattern) else [pattern]
+    return [path for path in dict.fromkeys(os.path.normpath(path) for path in paths) if is_dataset(path)]
+
+
+def dataset_names(paths: list) -> dict:
+    '''
+    path -> the name of its output directory: the path relative to the common parent of the datasets, with _ for
+    the separators. A name that is already taken (e.g. x/a/b and x/a_b are both a_b) gets a suffix: a_b_2
+    '''
+    parent = os.path.commonpath([os.path.abspath(path) for path in paths])
+    names = dict()
+    taken = set()
+    for path in paths:
+        relative = os.path.relpath(os.path.abspath(path), parent)
+        name = os.path.basename(os.path.abspath(path)) if relative == '.' else relative.replace(os.sep, '_')
+        unique, count = name, 1
+        while unique in taken:
+            count += 1
+            unique = f'{name}_{count}'
+        taken.add(unique)
+        names[path] = unique
+    return names
+
+
+def analyse_dataset(path: str, output: str, logtype: str = 'all', filter: bool = True, compact: bool = True) -> dict:
+    '''loads and analyses one dataset, writes its subchains and activities of interest to output, returns its summary'''
+    started = time.perf_counter()
+    summary = dict.fromkeys(SUMMARY_COLUMNS)
+    os.makedirs(output, exist_ok=True)
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):  # the progress of load and aoi, from many processes at once
+            A = Alfa.load(logtype, path=path, filter=filter, compact=compact)
+            subchains = A.subchains()
+            with open(os.path.join(output, 'subchains.json'), 'w') as f:
+                json.dump([[int(start), int(end), float(kcs)] for start, end, kcs in subchains], f)
+            aoi = A.aoi(export=os.path.join(output, 'aoi.json')) if subchains else None
+        summary.update(
+            activities=A.activities.shape[0],
+            events=A.events.shape[0],
+            labelled=int(A.events['attack.index'].notna().sum()) if 'attack.index' in A.events else 0,
+            subchains=len(subchains),
+            max_kcs=round(subchains[0][2], 3) if subchains else None,
+            aoi=0 if aoi is None else aoi.shape[0],
+            actors=0 if aoi is None else int(aoi['actor.email'].nunique()),
+        )
+    except Exception as e:
+        summary['error'] = f'{type(e).__name__}: {e}'
+    summary['seconds'] = round(time.perf_counter() - started, 2)
+    return summary
+
+
+def analyse_datasets(patterns: list, output: str = 'batch', workers: int = None, progress=None, **options) -> list:
+    '''
+    analyse_dataset for every dataset matching patterns (see dataset_paths), in a pool of `workers` processes.
+    Returns the summaries in the order of the datasets, and writes them to <output>/summary.json and summary.csv.
+    progress: called with each summary as its dataset is done, e.g. print
+    options: logtype, filter, compact, see analyse_dataset
+    '''
+    paths = dataset_paths(patterns)
+    names = dataset_names(paths) if paths else dict()
+    workers = min(workers or default_workers(), max(len(paths), 1))
+    MitreMapping.load()  # compiled once here, the workers inherit it (or read the cache it writes)
+    summaries = dict()
+
+    def done(path, summary):
+        summary['dataset'] = names[path]
+        summaries[path] = summary
+        if progress is not None:
+            progress(summary)
+
+    if workers <= 1:
+        for path in paths:
+            done(path, analyse_dataset(path, os.path.join(output, names[path]), **options))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {
+                executor.submit(analyse_dataset, path, os.path.join(output, names[path]), **options): path
+                for path in paths
+            }
+            for future in as_completed(futures):
+                done(futures[future], future.result())
+
+    summaries = [summaries[path] for path in paths]
+    os.makedirs(output, exist_ok=True)
+    with open(os.path.join(output, 'summary.json'), 'w') as f:
+        json.dump(summaries, f, indent=2)
+    pd.DataFrame(summaries, columns=SUMMARY_COLUMNS).to_csv(os.path.join(output, 'summary.csv'), index=False)
+    return summaries
@@ -7,26 +7,37 @@ dates: https://www.ietf.org/rfc/rfc3339.txt
 
 """
 import json
-from json.decoder import JSONDecodeError
+import math
 import os
 import os.path
+import random
+import shutil
 import threading
-import time
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
+from functools import partial
+from itertools import islice
 
 import pandas as pd
 from dateutil import parser as dateparser
+from google.auth.credentials import with_scopes_if_required
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import Resource, build
+from googleapiclient.discovery import Resource
 from googleapiclient.errors import HttpError
 
 from ..config import config
 from ..config.__internals__ import internals
+from ..utils.compression import check_compression, compress_bytes, data_file_name, is_data_file, open_text
 from ..utils.dates import normalize_datetime
 from ..utils.path import *
+from .discovery import authorized_http, build_service
+from .http_pool import PooledHttp
+from .listing import Listing
+from .profiler import profile
+from .store import ColumnStore
+from .throttle import shared_throttle
 
 PORT = 8089
 
@@ -69,21 +80,44 @@ class Collector:
     RETRY_BACKOFF_FACTOR = 2
     RETRY_MAX_DELAY = 60
 
+    THROTTLE_RATE = 40  # max requests per second, shared by all threads (see throttle.py)
+    THROTTLE_BURST = 40
+
+    LOAD_CHUNK_SIZE = 50000  # activities per DataFrame when loading from disk
+
     GMAIL_MAX_RANGE_DAYS = 30
     MAX_LOOKBACK_DAYS = 180
 
-    def __init__(self) -> None:
+    SHARD_DIR = "shards"  # per window output of sharded logtypes, until they are merged
+    AUTO_SHARD_PAGES = 10  # adaptive sharding: pages per window to aim for
+    AUTO_MAX_SHARDS = 50
+
+    def __init__(self, credentials=None, api_endpoint: str = None, http=None) -> None:
+        """
+        credentials: google.auth credentials to use instead of the OAuth flow of get_credentials,
+            e.g. google.auth.credentials.AnonymousCredentials() for a local server
+        api_endpoint: root url of the Reports API, e.g. "http://127.0.0.1:8080/" for a local server (default: Google)
+        http: function of the credentials returning the http client shared by all threads, which must be thread-safe,
+            e.g. partial(PooledHttp, pool_size=20) (see http_pool.py). Default: an httplib2 client per thread
+        """
+        self.credentials = credentials
+        self.api_endpoint = api_endpoint
+        self.http = http
         self.api_ready = False
         self._request_count_lock = threading.Lock()
         self._thread_local = threading.local()
+        self._shared_http = None
+        self._shared_http_lock = threading.Lock()
+        self.throttle = shared_throttle(self.THROTTLE_RATE, 10, self.THROTTLE_BURST)
         pass
 
     def __init_api_creds(self):
         """
         should be called before interacting with api
         """
-        self.creds = self.get_credentials()
+        self.creds = with_scopes_if_required(self.credentials or self.get_credentials(), self.SCOPES)
         self.service = self.connect_api()
+        self.activities_api = self.service.activities()  # shared by the threads, see _get_thread_http
         self.request_count = 0
         self.api_ready = True
         pass
@@ -115,36 +149,93 @@ class Collector:
         return creds
 
     def connect_api(self):
-        service = build("admin", "reports_v1", credentials=self.creds)
+        """a service object of the Reports API, built from the discovery document of the process (see discovery.py)"""
+        service = build_service(self.creds, self.api_endpoint)
         return service
 
-    def _get_thread_service(self):
+    def _get_thread_http(self):
         """
-        Returns a service instance private to the calling thread
-        httplib2 (used internally by googleapiclient) is not thread-safe, so concurrent logtype fetches must not share self.service
-        Each thread builds and caches its own connection here
+        Returns the http client the calling thread sends its requests with, see _execute_with_retry
+        With self.http, the client it returns, created once and shared by all threads.
+        Otherwise a client private to the thread: httplib2 (used internally by googleapiclient) is not thread-safe,
+        so concurrent logtype fetches must not share a connection.
         """
-        if not hasattr(self._thread_local, "service"):
-            self._thread_local.service = build("admin", "reports_v1", credentials=self.creds)
-        return self._thread_local.service
+        if self.http is not None:
+            if self._shared_http is None:
+                with self._shared_http_lock:
+                    if self._shared_http is None:
+                        self._shared_http = self.http(self.creds)
+            return self._shared_http
+        if not hasattr(self._thread_local, "http"):
+            self._thread_local.http = authorized_http(self.creds)
+        return self._thread_local.http
+
+    def use_pool(self, pool_size: int = 10):
+        """sends the requests of all threads through a PooledHttp of pool_size connections, from now on"""
+        if getattr(self._shared_http, "pool_size", None) == pool_size:
+            return
+        with self._shared_http_lock:
+            if hasattr(self._shared_http, "close"):
+                self._shared_http.close()
+            self.http = partial(PooledHttp, pool_size=pool_size)
+            self._shared_http = None
 
     def _execute_with_retry(self, req):
         """
         Executes an API request, retrying with exponential backoff on rate limiting (429) and server errors (5xx)
         Other errors (e.g. bad request, invalid applicationName) are raised immediately
+        Every attempt goes through the shared throttle, which lowers the number of concurrent requests when the API throttles.
+        The backoff is randomized (full jitter), so threads throttled together do not retry together.
         """
         delay = self.RETRY_INITIAL_DELAY
         for attempt in range(1, self.RETRY_MAX_ATTEMPTS + 1):
+            started = self.throttle.acquire()
+            throttled = False
             try:
-                return req.execute()
+                return req.execute(http=self._get_thread_http())
             except HttpError as e:
                 status = e.resp.status
-                if status != 429 and not (500 <= status < 600):
-                    raise
-                if attempt == self.RETRY_MAX_ATTEMPTS:
+                throttled = status == 429 or 500 <= status < 600
+                if not throttled or attempt == self.RETRY_MAX_ATTEMPTS:
                     raise
-                time.sleep(delay)
-                delay = min(delay * self.RETRY_BACKOFF_FACTOR, self.RETRY_MAX_DELAY)
+            finally:
+                self.throttle.release(started, throttled)
+            self.throttle.backoff(random.uniform(0, delay))
+            delay = min(delay * self.RETRY_BACKOFF_FACTOR, self.RETRY_MAX_DELAY)
+
+    def _checkpoint_params(self, user, max_results, max_pages, start_time, end_time, compress) -> dict:
+        """the query parameters a checkpoint can only be resumed with"""
+        params = {
+            "user": user,
+            "max_results": max_results,
+            "max_pages": max_pages,
+            "start_time": start_time,
+            "end_time": end_time,
+        }
+        if compress:  # absent for plain json, as in checkpoints written before compression existed
+            params["compress"] = compress
+        return params
+
+    def checkpoint_path(self, save_path: str, logtype: str) -> str:
+        return rel_path(save_path, logtype + ".checkpoint.json")
+
+    def read_checkpoint(self, save_path: str, logtype: str):
+        """returns the checkpoint of a logtype in save_path, or None if there is none"""
+        path = self.checkpoint_path(save_path, logtype)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def write_checkpoint(self, save_path: str, logtype: str, checkpoint: dict):
+        """writes the checkpoint atomically: a crash leaves either the previous or the new checkpoint"""
+        path = self.checkpoint_path(save_path, logtype)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
 
     def query_one(
         self,
@@ -156,53 +247,255 @@ class Collector:
         max_pages: int = None,
         start_time: str = None,
         end_time: str = None,
+        resume: bool = False,
+        compress: str = None,
         **kwargs,
     ) -> list:
         """
         used by the .query method
-        collects activities from a single logtype, and returns them as a list
+        collects activities from a single logtype, appends them to <save_path>/<logtype>.json and returns how many there are.
+        compress: 'gzip' or 'lzma' to write <logtype>.json.gz or <logtype>.json.xz instead, one compressed block per page.
+
+        After each page, a checkpoint is written to <save_path>/<logtype>.checkpoint.json:
+            the query parameters, the next page token, pages and records written, the size of the data file,
+            and the last (oldest, the API returns the newest first) id.time seen with the ids of the activities at that time.
+        resume: continue from the checkpoint instead of starting over. The data file is truncated to the size recorded
+            in the checkpoint, so a page written after the last checkpoint is not duplicated.
+            If the saved page token is rejected, the query restarts at the last id.time seen, skipping activities already written.
+        """
+        listing = Listing(
+            self, save_path, logtype, user, max_results, max_pages, start_time, end_time, resume, compress
+        )
+        try:
+            while not listing.done:
+                with self._request_count_lock:
+                    self.request_count += 1
+                try:
+                    resp = self._execute_with_retry(self.activities_api.list(**listing.request_params()))
+                except HttpError as e:
+                    if not listing.restart(e):
+                        raise
+                    continue
+                listing.save_page(resp)
+        finally:
+            listing.close()
+        return listing.finish()
+
+    def iter_pages(
+        self, logtype: str, user: str = "all", max_results: int = 1000, start_time: str = None, end_time: str = None
+    ):
         """
-        activities = self._get_thread_service().activities()
-        req = activities.list(
+        yields the activities of a single logtype page by page (lists, newest first), without saving them.
+        Used to poll for new activities, see Watcher
+        """
+        if not self.api_ready:
+            self.__init_api_creds()
+        params = {
+            "userKey": user,
+            "applicationName": logtype,
+            "maxResults": max_results,
+            "startTime": normalize_datetime(start_time),
+            "endTime": normalize_datetime(end_time),
+            "pageToken": None,
+        }
+        while True:
+            with self._request_count_lock:
+                self.request_count += 1
+            resp = self._execute_with_retry(self.activities_api.list(**params))
+            yield resp.get("items", [])
+            params["pageToken"] = resp.get("nextPageToken")
+            if not params["pageToken"]:
+                break
+
+    def time_windows(
+        self,
+        start_time: str,
+        end_time: str,
+        shards: int = None,
+        shard_size: str = None,
+        max_days: int = None,
+    ) -> list:
+        """
+        splits [start_time, end_time] into consecutive windows of equal length, newest first (the order the API returns activities in).
+        shards: number of windows
+        shard_size: maximum length of a window, as a pandas Timedelta string e.g. "1D" or "6h"
+        max_days: maximum length of a window in days (e.g. GMAIL_MAX_RANGE_DAYS)
+        The inner boundaries are rounded to the millisecond, the resolution of id.time.
+        """
+        start = pd.Timestamp(start_time)
+        end = pd.Timestamp(end_time)
+        span = end - start
+        if span <= pd.Timedelta(0):
+            return [(start_time, end_time)]
+        count = max(1, int(shards or 1))
+        for limit in (shard_size and pd.Timedelta(shard_size), max_days and pd.Timedelta(days=max_days)):
+            if limit:
+                count = max(count, math.ceil(span / limit))
+        bounds = [start_time] + [(start + span * i / count).floor("ms").isoformat() for i in range(1, count)] + [end_time]
+        return [(bounds[i], bounds[i + 1]) for i in reversed(range(count))]
+
+    def estimate_shards(
+        self,
+        logtype: str,
+        user: str,
+        max_results: int,
+        start_time: str,
+        end_time: str,
+        max_shards: int = None,
+    ) -> int:
+        """
+        adaptive sharding: requests the first page of [start_time, end_time] and extrapolates the number of activities in the range
+        from the time that page covers. Returns the number of windows for about AUTO_SHARD_PAGES pages each.
+        """
+        req = self.activities_api.list(
             userKey=user,
             applicationName=logtype,
             maxResults=max_results,
             startTime=start_time,
             endTime=end_time,
         )
-        page_index = 0
-        result = 0
-
-        if not (save_path[0] == "/" or save_path.startswith("./")):
-            save_path = "./" + save_path
-        if not save_path.endswith("/"):
-            save_path = save_path + "/"
+        with self._request_count_lock:
+            self.request_count += 1
+        resp = self._execute_with_retry(req)
+        return self.shards_for_page(resp, max_results, start_time, end_time, max_shards)
+
+    def shards_for_page(self, resp: dict, max_results: int, start_time: str, end_time: str, max_shards: int = None) -> int:
+        """see estimate_shards, resp is the first page of [start_time, end_time]"""
+        max_shards = max_shards or self.AUTO_MAX_SHARDS
+        items = resp.get("items", [])
+        if not resp.get("nextPageToken") or not items:
+            return 1
+        # the page covers end_time back to its oldest activity
+        covered = pd.Timestamp(end_time) - pd.Timestamp(items[-1]["id"]["time"])
+        if covered <= pd.Timedelta(0):
+            return max_shards
+        estimate = len(items) * ((pd.Timestamp(end_time) - pd.Timestamp(start_time)) / covered)
+        return min(max_shards, max(1, math.ceil(estimate / (max_results * self.AUTO_SHARD_PAGES))))
+
+    def window_range(self, start_time: str = None, end_time: str = None) -> tuple:
+        """the range split in windows: without an end, until now. Without a start, as far back as the API has logs"""
+        now = datetime.now(tz=timezone.utc)
+        # a little inside the retention period, so that it is still valid when the requests are sent
+        start = start_time or (now - pd.Timedelta(days=self.MAX_LOOKBACK_DAYS) + pd.Timedelta(minutes=5)).isoformat()
+        end = end_time or now.isoformat()
+        return start, end
+
+    def shard_path(self, save_path: str, logtype: str, index: int) -> str:
+        """the directory query_one writes a window of a sharded logtype to"""
+        return rel_path(save_path, self.SHARD_DIR, logtype, f"{index:04d}") + "/"
+
+    def plan_windows(
+        self,
+        save_path: str,
+        logtype: str,
+        user: str = "all",
+        max_results: int = 1000,
+        max_pages: int = None,
+        start_time: str = None,
+        end_time: str = None,
+        shards=None,
+        shard_size: str = None,
+        resume: bool = False,
+        compress: str = None,
+    ):
+        """
+        the time windows (see time_windows) a logtype is fetched in, or None if it is fetched by a single query_one.
+        shards: number of windows, or "auto" to choose it from the volume of the first page (see estimate_shards)
+        gmail ranges longer than GMAIL_MAX_RANGE_DAYS are always split.
 
-        f = None
+        The windows are written to the checkpoint of the logtype, a resumed logtype keeps the windows it was started with.
+        An empty list means that the logtype was already merged.
+        """
+        params = self._checkpoint_params(user, max_results, max_pages, start_time, end_time, compress)
+        checkpoint = self.read_checkpoint(save_path, logtype) if resume else None
+        if checkpoint is not None:
+            if "windows" not in checkpoint:
+                return None
+            if checkpoint["params"] != params:
+                raise ValueError(
+                    f"cannot resume {logtype}: the query parameters differ from the checkpoint ({checkpoint['params']})"
+                )
+            return [] if checkpoint["complete"] else checkpoint["windows"]
+
+        max_days = self.GMAIL_MAX_RANGE_DAYS if logtype == "gmail" else None
+        if not (shards or shard_size or max_days):
+            return None
+        start, end = self.window_range(start_time, end_time)
+        if shards == "auto":
+            shards = self.estimate_shards(logtype, user, max_results, start, end)
+        windows = self.time_windows(start, end, shards, shard_size, max_days)
+        if len(windows) == 1:
+            return None
+
+        data_file = rel_path(save_path, data_file_name(logtype, compress))
+        checkpoint = {
+            "logtype": logtype,
+            "params": params,
+            "windows": windows,
+            "records": 0,
+            "offset": os.path.getsize(data_file) if os.path.exists(data_file) else 0,
+            "complete": False,
+        }
+        self.write_checkpoint(save_path, logtype, checkpoint)
+        return windows
+
+    def merge_windows(self, save_path: str, logtype: str) -> int:
+        """
+        appends the data files of the windows of a sharded logtype, newest first, to <save_path>/<logtype>.json
+        and removes them. Returns the number of activities of the logtype.
+        An activity exactly on the boundary of two windows can be returned for both, the copy of the older window is skipped.
+        """
+        checkpoint = self.read_checkpoint(save_path, logtype)
+        if checkpoint["complete"]:
+            return checkpoint["records"]
+        compress = checkpoint["params"].get("compress")
+        data_file = rel_path(save_path, data_file_name(logtype, compress))
+        if os.path.exists(data_file):  # a previous merge was interrupted
+            os.truncate(data_file, checkpoint["offset"])
+
+        records = 0
+        boundary_ids = set()
+        with open(data_file, "ab") as out:
+            for index, (start, end) in enumerate(checkpoint["windows"]):
+                window_file = rel_path(self.shard_path(save_path, logtype, index), data_file_name(logtype, compress))
+                if not os.path.exists(window_file):
+                    boundary_ids = set()
+                    continue
+                end_time = pd.Timestamp(end)
+                start_time = pd.Timestamp(start)
+                start_ids = set()
+                with open_text(window_file) as f:
+                    while True:
+                        block = []
+                        for line in islice(f, self.LOAD_CHUNK_SIZE):
+                            time_, unique_id = self.__time_and_id(line)
+                            if time_ == end_time and unique_id in boundary_ids:
+                                continue
+                            if time_ == start_time:
+                                start_ids.add(unique_id)
+                            block.append(line)
+                        if not block:
+                            break
+                        out.write(compress_bytes("".join(block).encode(), compress))
+                        records += len(block)
+                boundary_ids = start_ids
+            out.flush()
+            os.fsync(out.fileno())
+
+        checkpoint.update(records=records, complete=True)
+        self.write_checkpoint(save_path, logtype, checkpoint)
+        shutil.rmtree(rel_path(save_path, self.SHARD_DIR, logtype), ignore_errors=True)
         try:
-            while req is not None:
-                if max_pages and page_index > max_pages:
-                    break
+            os.rmdir(rel_path(save_path, self.SHARD_DIR))  # only once no other logtype is sharded
+        except OSError:
+            pass
+        return records
 
-                with self._request_count_lock:
-                    self.request_count += 1
-                resp = self._execute_with_retry(req)
-                my_activities = resp.get("items", [])
-                result += len(my_activities)
-
-                if my_activities:
-                    if f is None:  # only create/open the file once there is data
-                        self.__create_path(save_path)
-                        f = open(rel_path(save_path, logtype + ".json"), "a")
-                    for activity in my_activities:
-                        f.write(json.dumps(activity) + "\n")
-
-                req = activities.list_next(req, resp)
-                page_index += 1
-        finally:
-            if f is not None:
-                f.close()
-        return result
+    def __time_and_id(self, line: str) -> tuple:
+        """(id.time as a Timestamp, id.uniqueQualifier) of a saved activity, None for the ones it does not have"""
+        activity_id = json.loads(line).get("id", {})
+        time_ = activity_id.get("time")
+        return pd.Timestamp(time_) if time_ else None, activity_id.get("uniqueQualifier")
 
     def query(
         self,
@@ -217,6 +510,12 @@ class Collector:
         path=None,
         return_as_df=True,
         num_threads: int = 10,
+        columnar: bool = False,
+        resume: bool = False,
+        shards=None,
+        shard_size: str = None,
+        compress: str = None,
+        pool_size: int = None,
         **kwargs,
     ) -> list:
         """
@@ -225,104 +524,206 @@ class Collector:
           logtype: 'all' or a logtype such as 'admin' or 'login'.
           user: 'all' (default) or a userId or user email address
           max_results: maximum results per page (default 1000, max)
-          max_pages: max number of pages (default: None, as many pages as available)
+          max_pages: max number of pages (default: None, as many pages as available), per window of a sharded logtype
           start_time: in rfc3339 format
           end_time: in rfc3339 format
           save: should this query be saved directly to storage
           path: directory to save under
-          num_threads: number of logtypes to fetch concurrently (default 10)
+          num_threads: number of logtypes (or windows of sharded logtypes) to fetch concurrently (default 10)
+          columnar: also write the columnar copy of each logtype, which Alfa.load reads about twice as fast, but which
+            takes longer to write than one load of the json files (see ColumnStore)
+          resume: continue each logtype from its checkpoint in path, see query_one
+          shards: split the time range of each logtype into this many windows, fetched concurrently.
+            "auto" chooses the number of windows from the volume of the first page. See plan_windows
+          shard_size: split the time range of each logtype into windows of at most this length, e.g. "1D" or "6h"
+          compress: 'gzip' or 'lzma' to save <logtype>.json.gz or <logtype>.json.xz. Loading reads them transparently
+          pool_size: send the requests of all threads through a pool of this many keep-alive connections (PooledHttp),
+            kept open for the next queries of this Collector, instead of a connection per thread. See use_pool
+        The windows of a logtype are merged in time order into <logtype>.json once all of them are fetched.
         """
+        if resume and not path:
+            raise ValueError("resume requires the path of the acquisition to continue")
+        check_compression(compress)
         if not self.api_ready:  # first initialize the api
             self.__init_api_creds()
+        if pool_size:
+            self.use_pool(pool_size)
+        self.throttle.concurrency.resize(num_threads)
+        throttle_before = self.throttle.stats()
 
-        if logtype == "all":
-            logtype = config["logs"]  # all logs
-        elif type(logtype) == str:
-            logtype = [logtype]  # convert to list of len 1
-
+        logtype = self._logtypes(logtype)
         start_time = normalize_datetime(start_time)
         end_time = normalize_datetime(end_time)
-
         results = {"activities": dict()}
         total_activity_count = 0
-        save_path = self.__default_path_name()
-        if path:
-            save_path = path
+        save_path = self._dataset_path(path)
+        date_ranges = {typ: self._date_range(typ, start_time, end_time, save_path, resume) for typ in logtype}
 
-        if not (save_path[0] == "/" or save_path.startswith("./")):
-            save_path = "./" + save_path
-        if not save_path.endswith("/"):
-            save_path = save_path + "/"
-        self.__create_path(save_path)
-
-        def date_range_for(typ):
-            if typ == "gmail" and not start_time and not end_time:
-                # no dates given: default to the maximum allowed 30-day window
-                start = (datetime.now(tz=timezone.utc) - pd.Timedelta(days=self.GMAIL_MAX_RANGE_DAYS)).isoformat()
-                end = datetime.now(tz=timezone.utc).isoformat()
-                return start, end
-
-            if typ == "gmail" and (not start_time or not end_time):
-                raise ValueError(
-                    "gmail logs require both start_time and end_time to be set "
-                    f"(max {self.GMAIL_MAX_RANGE_DAYS}-day range); only one was provided."
-                )
+        first_error = None
+        failed = set()
+        pending = dict()  # sharded logtype -> number of windows still being fetched
 
-            now = datetime.now(tz=timezone.utc)
-            for label, value in (("start_time", start_time), ("end_time", end_time)):
-                if not value:
-                    continue
-                lookback_seconds = (now - dateparser.parse(value)).total_seconds()
-                if lookback_seconds > self.MAX_LOOKBACK_DAYS * 86400:
-                    raise ValueError(
-                        f"{typ} logs only cover the last {self.MAX_LOOKBACK_DAYS} days; "
-                        f"requested {label} is {lookback_seconds / 86400:.1f} days in the past."
-                    )
-
-            if typ == "gmail":
-                span_seconds = (dateparser.parse(end_time) - dateparser.parse(start_time)).total_seconds()
-                if span_seconds < 0:
-                    raise ValueError("gmail logs require start_time to be before end_time.")
-                if span_seconds > self.GMAIL_MAX_RANGE_DAYS * 86400:
-                    raise ValueError(
-                        f"gmail logs support a maximum {self.GMAIL_MAX_RANGE_DAYS}-day range; "
-                        f"requested range is {span_seconds / 86400:.1f} days."
-                    )
-
-            return start_time, end_time
-
-        date_ranges = {typ: date_range_for(typ) for typ in logtype}
+        def finish(typ, res):
+            nonlocal total_activity_count
+            total_activity_count += self._logtype_saved(save_path, typ, res, columnar)
 
-        first_error = None
         with ThreadPoolExecutor(max_workers=num_threads) as executor:
-            futures = {
+            plans = {
                 executor.submit(
-                    self.query_one, save_path, save, typ, user, max_results,
-                    max_pages, *date_ranges[typ]
+                    self.plan_windows, save_path, typ, user, max_results,
+                    max_pages, *date_ranges[typ], shards, shard_size, resume, compress
                 ): typ
                 for typ in logtype
             }
+            futures = dict()
+            for future in as_completed(plans):
+                typ = plans[future]
+                try:
+                    windows = future.result()
+                except Exception as e:
+                    first_error = first_error or e
+                    failed.add(typ)
+                    print(f"{typ:>25}: FAILED - {e}")
+                    continue
+                if windows is None:
+                    futures[executor.submit(
+                        self.query_one, save_path, save, typ, user, max_results,
+                        max_pages, *date_ranges[typ], resume=resume, compress=compress
+                    )] = (typ, None)
+                    continue
+                pending[typ] = len(windows)
+                for index, (start, end) in enumerate(windows):
+                    futures[executor.submit(
+                        self.query_one, self.shard_path(save_path, typ, index), save, typ, user,
+                        max_results, max_pages, start, end, resume=resume, compress=compress
+                    )] = (typ, index)
+                if not windows:  # already merged by the run that is resumed
+                    finish(typ, self.merge_windows(save_path, typ))
+
             for future in as_completed(futures):
-                typ = futures[future]
+                typ, index = futures[future]
                 try:
                     res = future.result()
                 except Exception as e:
-                    if first_error is None:
-                        first_error = e
-                    print(f"{typ:>25}: FAILED - {e}")
+                    first_error = first_error or e
+                    if typ not in failed:
+                        print(f"{typ:>25}: FAILED - {e}")
+                    failed.add(typ)
+                    continue
+                if index is None:
+                    finish(typ, res)
                     continue
-                total_activity_count += res
-                print(f"{typ:>25}:", f"{res:>6}", "activities")
+                pending[typ] -= 1
+                if pending[typ] == 0 and typ not in failed:
+                    finish(typ, self.merge_windows(save_path, typ))
 
         if first_error is not None:
             raise first_error
 
         print("\n", total_activity_count, "activities saved to:", save_path)
+        self._print_throttle_stats(self.throttle, throttle_before)
 
         if return_as_df:
             return self.load_all(f"{save_path}")
         return results
 
+    def _logtypes(self, logtype) -> list:
+        if logtype == "all":
+            return config["logs"]  # all logs
+        if type(logtype) == str:
+            return [logtype]  # convert to list of len 1
+        return logtype
+
+    def _dataset_path(self, path: str = None) -> str:
+        """the directory an acquisition is saved to (created if needed): path, or a new directory under data/"""
+        save_path = self.__default_path_name()
+        if path:
+            save_path = path
+
+        if not (save_path[0] == "/" or save_path.startswith("./")):
+            save_path = "./" + save_path
+        if not save_path.endswith("/"):
+            save_path = save_path + "/"
+        self.__create_path(save_path)
+        return save_path
+
+    def date_range_for(self, typ: str, start_time: str = None, end_time: str = None) -> tuple:
+        """the (start_time, end_time) to query a logtype with, checked against the limits of the API"""
+        if typ == "gmail" and not start_time and not end_time:
+            # no dates given: default to the maximum allowed 30-day window
+            start = (datetime.now(tz=timezone.utc) - pd.Timedelta(days=self.GMAIL_MAX_RANGE_DAYS)).isoformat()
+            end = datetime.now(tz=timezone.utc).isoformat()
+            return start, end
+
+        if typ == "gmail" and (not start_time or not end_time):
+            raise ValueError(
+                "gmail logs require both start_time and end_time to be set "
+                f"(max {self.GMAIL_MAX_RANGE_DAYS}-day range); only one was provided."
+            )
+
+        now = datetime.now(tz=timezone.utc)
+        for label, value in (("start_time", start_time), ("end_time", end_time)):
+            if not value:
+                continue
+            lookback_seconds = (now - dateparser.parse(value)).total_seconds()
+            if lookback_seconds > self.MAX_LOOKBACK_DAYS * 86400:
+                raise ValueError(
+                    f"{typ} logs only cover the last {self.MAX_LOOKBACK_DAYS} days; "
+                    f"requested {label} is {lookback_seconds / 86400:.1f} days in the past."
+                )
+
+        if typ == "gmail":
+            # longer ranges are split in windows of GMAIL_MAX_RANGE_DAYS, see plan_windows
+            span_seconds = (dateparser.parse(end_time) - dateparser.parse(start_time)).total_seconds()
+            if span_seconds < 0:
+                raise ValueError("gmail logs require start_time to be before end_time.")
+
+        return start_time, end_time
+
+    def _date_range(self, typ: str, start_time: str, end_time: str, save_path: str, resume: bool) -> tuple:
+        # without explicit dates, a resumed logtype keeps the dates it was started with (e.g. the default gmail window)
+        checkpoint = self.read_checkpoint(save_path, typ) if resume else None
+        if checkpoint is not None and not start_time and not end_time:
+            return checkpoint["params"]["start_time"], checkpoint["params"]["end_time"]
+        return self.date_range_for(typ, start_time, end_time)
+
+    def _logtype_saved(self, save_path: str, typ: str, res: int, columnar: bool) -> int:
+        """
+        reports a logtype that has been saved, and (re)writes its columnar copy unless it is current.
+        Without columnar, a copy the data file no longer matches (e.g. appended to) is removed.
+        Returns its number of activities
+        """
+        print(f"{typ:>25}:", f"{res:>6}", "activities")
+        store = ColumnStore(save_path)
+        try:
+            data_file = self.data_file(save_path, typ)
+        except FileNotFoundError:
+            return res
+        if store.is_current(typ, data_file):
+            return res
+        if columnar:
+            self.write_columnar(save_path, typ)
+        else:
+            store.remove(typ)
+        return res
+
+    def _print_throttle_stats(self, throttle, before: dict):
+        stats = throttle.stats()
+        stats = {key: stats[key] - before[key] for key in before if key != "concurrency_limit"}
+        waited = stats["rate_wait"] + stats["concurrency_wait"] + stats["backoff_wait"]
+        if not stats["throttled"] and waited < 1:
+            return
+        print(
+            f" {stats['requests']} requests, {stats['throttled']} throttled by the API. Waited "
+            f"{stats['rate_wait']:.1f}s for the rate limit, {stats['concurrency_wait']:.1f}s for the concurrency limit "
+            f"and {stats['backoff_wait']:.1f}s in backoff (summed over threads)"
+        )
+
+    def write_columnar(self, save_path: str, logtype: str) -> int:
+        """converts the data file of a logtype in save_path to the columnar store of the dataset, see ColumnStore"""
+        data_file = self.data_file(save_path, logtype)
+        return ColumnStore(save_path).write_logtype(logtype, self.load_chunks(data_file), data_file)
+
     def compute_df(self, activities_json: dict) -> pd.DataFrame:
         return pd.json_normalize(activities_json)
 
@@ -366,42 +767,152 @@ class Collector:
                 json.dump(data, f)
         return data
 
-    def load(self, json_file: str, as_activities_df: bool = True):
+    def __is_ndjson(self, f) -> bool:
         """
-        loads a dataset from a json file. Expects to be normal JSON.
-        If it encounters a JSONDecodeError, assumes it is in NDJSON format (newline delimited)
-        and attempts to access each record separately.
+        detects the file format from its first bytes, without parsing it:
+        NDJSON files (as written by .query) have one JSON object per line, so both of the first 2 lines start with "{".
+        Anything else (a list, a single object, {"activities": ...} as written by .save, pretty printed JSON) is a JSON document.
         """
+        first_line = f.readline()
+        second_line = f.readline()
+        f.seek(0)
+        return first_line.lstrip().startswith("{") and second_line.lstrip().startswith("{")
+
+    def __document_activities(self, data):
+        """the activities of a JSON document, in the layouts accepted by get_activities_df"""
+        if isinstance(data, dict) and "activities" not in data:
+            return [data]
+        if isinstance(data, list):
+            return data
+        return data["activities"]
+
+    def __normalize(self, records: list, columns: list = None) -> pd.DataFrame:
+        """json_normalize, optionally keeping only the given (normalized) columns, e.g. ["events", "actor.email"]"""
+        if columns is None:
+            return pd.json_normalize(records)
+        roots = {column.split(".")[0] for column in columns}
+        records = [{k: v for k, v in record.items() if k in roots} for record in records]
+        df = pd.json_normalize(records)
+        return df[[column for column in columns if column in df.columns]]
+
+    def __concat(self, chunks) -> pd.DataFrame:
+        chunks = list(chunks)
+        if not chunks:
+            return pd.DataFrame()
+        with profile("concat") as stage:
+            df = pd.concat(chunks, ignore_index=True)
+            stage.rows = len(df)
+        return df
+
+    def load_chunks(self, json_file: str, chunk_size: int = None, columns: list = None, byte_range: tuple = None):
+        """
+        yields the activities of a json file as normalized DataFrames of at most chunk_size rows.
+        NDJSON is read line by line, so memory use depends on chunk_size and not on the size of the file.
+        columns: only keep these columns, e.g. ["id.uniqueQualifier", "id.time", "actor.email", "events"]
+        byte_range: (start, end), only load the lines that start in between, see split_file
+        """
+        chunk_size = chunk_size or self.LOAD_CHUNK_SIZE
+        if byte_range is not None:
+            with open(json_file, "rb") as f:
+                yield from self.__normalized_chunks([(None, self.__ndjson_range(f, *byte_range))], chunk_size, columns)
+            return
+        with open_text(json_file) as f:
+            if self.__is_ndjson(f):
+                groups = [(None, (json.loads(line) for line in f if line.strip()))]
+            else:
+                with profile("parse"):
+                    activities = self.__document_activities(json.load(f))
+                groups = activities.items() if isinstance(activities, dict) else [(None, activities)]
+            yield from self.__normalized_chunks(groups, chunk_size, columns)
+
+    def __normalized_chunks(self, groups, chunk_size: int, columns: list):
+        """groups: [(logtype or None, iterable of activities)], see load_chunks"""
+        for logtype, records in groups:
+            records = iter(records)
+            while True:
+                with profile("parse") as stage:
+                    chunk = list(islice(records, chunk_size))
+                    stage.rows = len(chunk)
+                if not chunk:
+                    break
+                with profile("normalize", len(chunk)):
+                    df = self.__normalize(chunk, columns)
+                if logtype is not None:
+                    df["logtype"] = logtype
+                yield df
+
+    def __ndjson_range(self, f, start: int, end: int):
+        """the activities of the lines of a NDJSON file (opened in binary mode) that start in [start, end)"""
+        position = start
+        if start > 0:
+            f.seek(start - 1)
+            position += len(f.readline()) - 1  # the rest of the line that started before start
+        while position < end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            if line.strip():
+                yield json.loads(line)
+
+    def split_file(self, json_file: str, split_bytes: int) -> list:
+        """
+        byte ranges of about split_bytes covering a NDJSON file, to load its parts in parallel with load_chunks.
+        Compressed files and JSON documents can't be split, for them (and small files) the list is [None]
+        """
+        size = os.path.getsize(json_file)
+        if size <= split_bytes or not json_file.endswith(".json"):
+            return [None]
         with open(json_file) as f:
-            try:
-                data = json.load(f)
-                if isinstance(data, dict) and "activities" not in data:
-                    data = {"activities": [data]}
-                elif isinstance(data, list):
-                    data = {"activities": data}
-            except JSONDecodeError:
-                f.seek(0)
-                activities = []
-                for line in f:
-                    if line.strip():
-                        activities.append(json.loads(line))
-                data = {"activities": activities}
+            if not self.__is_ndjson(f):
+                return [None]
+        bounds = list(range(0, size, split_bytes)) + [size]
+        return list(zip(bounds[:-1], bounds[1:]))
+
+    def load(self, json_file: str, as_activities_df: bool = True, chunk_size: int = None, columns: list = None):
+        """
+        loads a dataset from a json file, either NDJSON (newline delimited) or normal JSON.
+        See load_chunks, the DataFrame is built from chunks of chunk_size activities.
+        """
         if as_activities_df:
-            return self.get_activities_df(data)
-        return data
+            return self.__concat(self.load_chunks(json_file, chunk_size, columns))
+        with open_text(json_file) as f:
+            if self.__is_ndjson(f):
+                return {"activities": [json.loads(line) for line in f if line.strip()]}
+            data = json.load(f)
+        if isinstance(data, dict) and "activities" in data:
+            return data
+        return {"activities": self.__document_activities(data)}
+
+    def data_files(self, data_folder: str) -> list:
+        """the json files of a dataset directory, e.g. data/foo/admin.json or data/foo/admin.json.gz"""
+        all_files = [os.path.join(data_folder, x) for x in os.listdir(data_folder)]
+        return [x for x in all_files if os.path.isfile(x) and is_data_file(x)]
+
+    def data_file(self, data_folder: str, logtype: str) -> str:
+        """the json file of a logtype in a dataset directory, compressed or not"""
+        for compress in (None, "gzip", "lzma"):
+            path = os.path.join(data_folder, data_file_name(logtype, compress))
+            if os.path.isfile(path):
+                return path
+        raise FileNotFoundError(f"no {logtype} data in {data_folder}")
+
+    def load_all_chunks(self, data_folder: str, chunk_size: int = None, columns: list = None):
+        """
+        load_chunks for every json file in data_folder. Each chunk gets a "logtype" column (the filename).
+        """
+        for f in self.data_files(data_folder):
+            logtype = os.path.basename(f).split(".json")[0]
+            for df in self.load_chunks(f, chunk_size, columns):
+                df["logtype"] = logtype
+                yield df
 
-    def load_all(self, data_folder: str, as_activities_df: bool = True):
-        all_files = os.listdir(data_folder)
-        all_files = [os.path.join(data_folder, x) for x in all_files]
-        only_json = filter(
-            lambda x: os.path.isfile(x) and x.endswith(".json"), all_files
-        )
+    def load_all(self, data_folder: str, as_activities_df: bool = True, chunk_size: int = None, columns: list = None):
+        if as_activities_df:
+            return self.__concat(self.load_all_chunks(data_folder, chunk_size, columns))
         result = {"activities": {}}
-        for f in only_json:
+        for f in self.data_files(data_folder):
             data = self.load(f, as_activities_df=False)
             logtype = os.path.basename(f).split(".json")[0]
-            activities = data["activities"]
-            result["activities"][logtype] = activities
-        if as_activities_df:
-            return self.get_activities_df(result)
+            result["activities"][logtype] = data["activities"]
         return result
@@ -0,0 +1,53 @@
+#!/bin/python3
+'''
+compact in-memory representation of Activities and Events (Alfa(..., compact=True), see Activities.compact and Events.compact):
+    - low cardinality string columns (actor.email, id.applicationName, event name/type, ...) become categoricals
+    - times become datetime64
+    - attack.index becomes a small integer (Int8)
+    - repeated label lists (attack.label, attack.category) become one shared tuple per distinct list
+Missing values stay missing (NaN / NA) instead of being filled with ''.
+'''
+import numpy as np
+import pandas as pd
+
+CATEGORY_MAX_RATIO = 0.5  # a string column becomes categorical if it has at most this many distinct values per row
+
+
+def is_string_column(series: pd.Series) -> bool:
+    if series.dtype == object:
+        values = series.dropna()
+        return len(values) > 0 and values.map(type).eq(str).all()
+    return pd.api.types.is_string_dtype(series.dtype) and not isinstance(series.dtype, pd.CategoricalDtype)
+
+
+def categorize(df: pd.DataFrame, exclude=()) -> dict:
+    '''the string columns of df worth storing as categoricals, as {column: categorical Series}'''
+    columns = dict()
+    for column in df.columns:
+        if column in exclude:
+            continue
+        series = df[column]
+        if not is_string_column(series):
+            continue
+        if series.nunique() <= CATEGORY_MAX_RATIO * len(series):
+            columns[column] = series.astype('category')
+    return columns
+
+
+def intern_lists(series: pd.Series) -> pd.Series:
+    '''lists (e.g. attack.label) as tuples, equal lists share one tuple. Other values are kept'''
+    interned = dict()
+    values = [
+        interned.setdefault(tuple(value), tuple(value)) if isinstance(value, (list, tuple)) else value
+        for value in series.tolist()
+    ]
+    return pd.Series(values, index=series.index, dtype=object, name=series.name)
+
+
+def small_index(series: pd.Series) -> pd.Series:
+    '''attack.index as Int8 (NA for unlabelled events), or float32 if it is not integral (index_reducer: mean)'''
+    values = pd.to_numeric(series, errors='coerce').astype('Float64')
+    valid = values.dropna()
+    if len(valid) and not (valid == np.round(valid)).all():
+        return values.astype('float32')
+    return values.astype('Int8')
@@ -0,0 +1,120 @@
+#!/bin/python3
+'''
+the discovery document of the Reports API (admin reports_v1), read and parsed once per process, and the service
+objects of Collector built from it without network access.
+
+googleapiclient.discovery.build finds and parses the document again for every service it builds. Collector
+builds one service and shares it between its threads, which only need an http client of their own (see
+authorized_http). The document is:
+    1. the newest (by revision) valid document of: the copy persisted under config/ and the one bundled with
+       google-api-python-client
+    2. if there is neither, downloaded once and persisted under config/ (if the directory exists) for the next runs
+    3. kept for the rest of the process
+A document is valid if it describes admin reports_v1 and has activities.list.
+'''
+import json
+import os
+import pickle
+import threading
+import urllib.request
+
+import google_auth_httplib2
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import build_http
+
+from ..config.__internals__ import internals
+
+SERVICE_NAME = 'admin'
+SERVICE_VERSION = 'reports_v1'
+DISCOVERY_URL = 'https://admin.googleapis.com/$discovery/rest?version=reports_v1'
+DISCOVERY_DIR = internals['project']['dirs']['configs']  # relative to the project directory, like token.json
+DISCOVERY_FILE = f'{SERVICE_NAME}.{SERVICE_VERSION}.json'
+
+_document = None  # pickled: build_from_document modifies the document it is given, every service gets its own copy
+_lock = threading.Lock()
+
+
+def is_valid(document) -> bool:
+    if not isinstance(document, dict):
+        return False
+    if document.get('name') != SERVICE_NAME or document.get('version') != SERVICE_VERSION:
+        return False
+    methods = document.get('resources', {}).get('activities', {}).get('methods', {})
+    return 'list' in methods
+
+
+def discovery_path() -> str:
+    return os.path.join(DISCOVERY_DIR, DISCOVERY_FILE)
+
+
+def persisted_document():
+    '''the document persisted under config/, None if there is none or it can't be read'''
+    try:
+        with open(discovery_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def bundled_document():
+    '''the document bundled with google-api-python-client (2.0 and later), None if it has none'''
+    try:
+        from googleapiclient.discovery_cache import get_static_doc
+        document = get_static_doc(SERVICE_NAME, SERVICE_VERSION)
+        return json.loads(document) if document else None
+    except (ImportError, ValueError):
+        return None
+
+
+def fetch_document() -> dict:
+    '''downloads the document, and persists it if there is a config/ directory'''
+    with urllib.request.urlopen(DISCOVERY_URL, timeout=60) as resp:
+        document = json.loads(resp.read())
+    if not is_valid(document):
+        raise ValueError(f'{DISCOVERY_URL} is not the discovery document of {SERVICE_NAME} {SERVICE_VERSION}')
+    if os.path.isdir(DISCOVERY_DIR):
+        tmp_path = discovery_path() + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(document, f)
+        os.replace(tmp_path, discovery_path())
+    return document
+
+
+def discovery_document() -> dict:
+    '''a copy of the discovery document of the process, see above'''
+    global _document
+    if _document is None:
+        with _lock:
+            if _document is None:
+                documents = [d for d in (persisted_document(), bundled_document()) if is_valid(d)]
+                if documents:
+                    document = max(documents, key=lambda d: str(d.get('revision', '')))
+                else:
+                    document = fetch_document()
+                _document = pickle.dumps(document)
+    return pickle.loads(_document)
+
+
+def clear() -> None:
+    '''forgets the document, the next service reads it again (e.g. after updating the copy under config/)'''
+    global _document
+    _document = None
+
+
+def authorized_http(credentials):
+    '''
+    an http client that sends the credentials, and refreshes them when they expire. httplib2 is not thread-safe:
+    the requests of a service built by build_service can be sent by many threads with request.execute(http=...),
+    each thread with its own authorized_http
+    '''
+    return google_auth_httplib2.AuthorizedHttp(credentials, http=build_http())
+
+
+def build_service(credentials, api_endpoint: str = None):
+    '''
+    googleapiclient.discovery.build("admin", "reports_v1", credentials=credentials) from the document of the process
+    credentials: with the scopes of the Reports API, see Collector
+    api_endpoint: root url of the Reports API, see Collector
+    '''
+    client_options = {'api_endpoint': api_endpoint} if api_endpoint else None
+    return build_from_document(discovery_document(), http=authorized_http(credentials), client_options=client_options)
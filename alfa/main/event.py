@@ -1,6 +1,9 @@
+import numpy as np
+import pandas as pd
 from pandas.core.series import Series
 from pandas.core.frame import DataFrame
-from .activity import Activity
+from .activity import Activity, Activities
+from .compact import categorize, intern_lists, small_index
 
 
 class Events(DataFrame):
@@ -8,10 +11,11 @@ class Events(DataFrame):
     Events is a dataframe containing events. It has a custom property: parent, which references its Mitre parent.
 
     Each Event *class* is dynamically generated from the current Events instance. This is because each instance of the class needs a reference
-    to its parent (Events).
+    to its parent (Events). The class is generated once per Events instance, and reused for every row.
 
     Each event's Activity can be accessed through the .activity accessor. e.g. events.iloc[0].activity => Activity.
-    This is done by calling the Mitre.activity_by_id method.
+    This is done by calling the Mitre.activity_at method with the row position of the activity (activity_pos),
+    or Mitre.activity_by_id for events without one.
 
     When accessing an event's activity, the event passes the activity id up the chain, and then the mitre object passes it down:
 
@@ -23,7 +27,10 @@ class Events(DataFrame):
 
     @property
     def _constructor_sliced(self):
-        return EventConstructor(self)
+        event_class = self.__dict__.get('_event_class')
+        if event_class is None:
+            event_class = self.__dict__['_event_class'] = EventConstructor(self)
+        return event_class
 
     _metadata = ['parent']
 
@@ -33,9 +40,34 @@ class Events(DataFrame):
     def activity(self, uid: str) -> Activity:
         return self.parent.activity_by_id(uid)
 
-    def activities(self):
-        ids = self['activity_id'].unique()
-        activities = self.parent.activities.loc[ids] # for some reason returns duplicate rows
+    def compact(self) -> 'Events':
+        '''
+        returns a copy with attack.index as Int8, the attack.label / attack.category lists as shared tuples
+        and the low cardinality string columns (name, type, ...) as categoricals, see compact.py
+        '''
+        E = self.copy(deep=False)
+        for column in ('attack.label', 'attack.category'):
+            if column in E:
+                E[column] = intern_lists(E[column])
+        if 'attack.index' in E:
+            E['attack.index'] = small_index(E['attack.index'])
+        if 'activity_pos' in E and len(E) < 2**31:
+            E['activity_pos'] = E['activity_pos'].astype(np.int32)
+        for column, series in categorize(E, exclude=('attack.label', 'attack.category', 'parameters')).items():
+            E[column] = series
+        E.parent = getattr(self, 'parent', None)
+        return E
+
+    def activity_at(self, pos: int) -> Activity:
+        return self.parent.activity_at(pos)
+
+    def activities(self) -> Activities:
+        '''the activities of these events, in order of first appearance'''
+        if 'activity_pos' in self:
+            activities = self.parent.activities_at(pd.unique(self['activity_pos'].to_numpy()))
+        else:
+            ids = self['activity_id'].unique()
+            activities = self.parent.activities.loc[ids] # for some reason returns duplicate rows
         return activities[~activities.index.duplicated()]
 
 
@@ -53,6 +85,62 @@ class Events(DataFrame):
             out.append(self[s])
         return out
 
+    def interval_activities(self, intervals: list, concat: bool = True):
+        '''
+            intervals: as slices in get_event_slices, e.g. joined subchains [ [0,5], [7,22], ...], in any order
+            returns the activities of the events of each interval, like [e.activities() for e in get_event_slices(intervals)],
+            but with a single take on the activities instead of one lookup per slice.
+            concat: return the activities of all intervals as one frame (deduplicated), like pd.concat of the slices
+        '''
+        if 'activity_pos' not in self:
+            slices = [e.activities() for e in self.get_event_slices(intervals)]
+            if not concat or len(slices) == 0:
+                return slices
+            res = pd.concat(slices)
+            return res[~res.index.duplicated()]
+        if len(intervals) == 0:
+            return []
+        positions = self['activity_pos'].to_numpy()
+        bounds = np.array([slice(item[0], item[1]).indices(len(self))[:2] for item in intervals], dtype=np.intp)
+        if concat:
+            if np.all(bounds[1:, 0] >= bounds[:-1, 0]):
+                # sorted by start (e.g. joined subchains, see KillChain.join_close_subchains): merging them keeps
+                # the activities in order of first appearance, and reads every event once
+                bounds = merge_intervals(bounds)
+            else:
+                bounds = bounds[bounds[:, 1] > bounds[:, 0]]
+            activities = self.parent.activities_at(pd.unique(positions[interval_index(bounds)]))
+            return activities[~activities.index.duplicated()]
+        per_interval = [pd.unique(positions[start:end]) for start, end in bounds]
+        activities = self.parent.activities_at(np.concatenate(per_interval))
+        out = []
+        offset = 0
+        for interval_positions in per_interval:
+            slice_activities = activities.iloc[offset:offset + len(interval_positions)]
+            out.append(slice_activities[~slice_activities.index.duplicated()])
+            offset += len(interval_positions)
+        return out
+
+
+def merge_intervals(bounds: np.ndarray) -> np.ndarray:
+    '''merges the overlapping [start, end) intervals of an (n, 2) array, drops the empty ones. Sorted by start'''
+    bounds = bounds[bounds[:, 1] > bounds[:, 0]]
+    if len(bounds) == 0:
+        return bounds
+    bounds = bounds[np.argsort(bounds[:, 0], kind='stable')]
+    ends = np.maximum.accumulate(bounds[:, 1])
+    first = np.ones(len(bounds), dtype=bool)  # first interval of each merged run
+    first[1:] = bounds[1:, 0] > ends[:-1]
+    return np.column_stack([bounds[first, 0], np.maximum.reduceat(bounds[:, 1], np.flatnonzero(first))])
+
+
+def interval_index(bounds: np.ndarray) -> np.ndarray:
+    '''the positions covered by non empty [start, end) intervals, concatenated: [[0, 2], [5, 7]] -> [0, 1, 5, 6]'''
+    lengths = bounds[:, 1] - bounds[:, 0]
+    offsets = np.cumsum(lengths) - lengths
+    return np.repeat(bounds[:, 0] - offsets, lengths) + np.arange(lengths.sum(), dtype=np.intp)
+
+
 def EventConstructor(parent=None):
     class Event(Series):
         @property
@@ -70,6 +158,9 @@ def EventConstructor(parent=None):
 
         @property
         def activity(self):
-            return self.parent.activity(self['activity_id'])
+            # parent (the Events) of the closure: the parent attribute is overwritten by pandas' __finalize__
+            if 'activity_pos' in self.index:
+                return parent.activity_at(self['activity_pos'])
+            return parent.activity(self['activity_id'])
 
     return Event
@@ -0,0 +1,55 @@
+#!/bin/python3
+'''
+a pooled keep-alive http client for Collector, shared by all its threads instead of an httplib2 client per thread.
+
+    C = Collector(http=partial(PooledHttp, pool_size=20))  # or C.query(..., pool_size=20)
+
+googleapiclient sends a request with http.request(uri, method, body, headers) and reads (response, content) as
+httplib2 returns them. Any object doing the same, safely from many threads, can be plugged into Collector.
+
+The per thread clients of Collector (see Collector._get_thread_http) each keep their own connection, which ends
+with their thread: every query opens (and TLS handshakes) new connections. PooledHttp keeps at most pool_size
+connections per host open for the lifetime of the Collector, lent to one request at a time.
+'''
+import httplib2
+from google.auth.transport.requests import AuthorizedSession
+from requests.adapters import HTTPAdapter
+
+# requests decodes gzip bodies, their headers no longer describe the content that is returned
+DECODED_HEADERS = ('content-encoding', 'content-length', 'transfer-encoding')
+
+
+class PooledHttp:
+    '''
+    httplib2.Http look-alike on one requests session (urllib3 connection pools, thread-safe).
+    credentials: google.auth credentials, sent with every request and refreshed when they expire or the API
+        answers 401, as google_auth_httplib2.AuthorizedHttp does
+    pool_size: connections kept open per host. A request waits for a free connection rather than opening more
+    timeout: seconds to connect, and to wait for each read
+    verify: check the certificate of the server, or the path of the CA bundle to check it with
+    '''
+
+    def __init__(self, credentials, pool_size: int = 10, timeout: float = 120, verify=True) -> None:
+        self.credentials = credentials
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.verify = verify  # per request: REQUESTS_CA_BUNDLE would override session.verify
+        self.session = AuthorizedSession(credentials)
+        adapter = HTTPAdapter(pool_maxsize=pool_size, pool_block=True)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def request(self, uri: str, method: str = 'GET', body=None, headers: dict = None,
+                redirections: int = httplib2.DEFAULT_MAX_REDIRECTS, connection_type=None) -> tuple:
+        '''(httplib2.Response, content), see httplib2.Http.request. connection_type is ignored'''
+        resp = self.session.request(method, uri, data=body, headers=headers, timeout=self.timeout,
+                                    verify=self.verify, allow_redirects=redirections > 0)
+        info = {key.lower(): value for key, value in resp.headers.items() if key.lower() not in DECODED_HEADERS}
+        info['status'] = str(resp.status_code)
+        response = httplib2.Response(info)
+        response.reason = resp.reason
+        return response, resp.content
+
+    def close(self) -> None:
+        '''closes the connections of the pool'''
+        self.session.close()
@@ -1,6 +1,7 @@
 #!/bin/python3
 
-from pandas import isna
+import numpy as np
+from pandas import isna, Series
 from ..config import config
 kc_conf = config['kill_chain']
 
@@ -18,6 +19,8 @@ class KillChain:
         'min': min,
         'max': max
     }
+    # shorter windows are as fast to recompute as to update, see discern_subchains
+    INCREMENTAL_MIN_LENGTH = 16
 
     chain_dict = {
         "persistence": 1,
@@ -66,6 +69,95 @@ class KillChain:
             return 0
         return result / total_unique_indexes
 
+    @staticmethod
+    def index_array(chain_index_list) -> np.ndarray:
+        '''
+        returns the attack indexes as a float64 array. Missing values (None, NaN, pd.NA) become NaN.
+        '''
+        return Series(chain_index_list, dtype='Float64').to_numpy(dtype=np.float64, na_value=np.nan)
+
+    @staticmethod
+    def index_transitions(index_array: np.ndarray) -> tuple:
+        '''
+        compares every index to the last non NaN index before it.
+        returns two arrays of the same length as index_array:
+          sign: +1 if the index went up, -1 if it went down, else 0
+          equal: True if the index stayed the same
+        NaN values and the first non NaN value have neither.
+        '''
+        size = len(index_array)
+        is_valid = ~np.isnan(index_array)
+        last_valid = np.maximum.accumulate(np.where(is_valid, np.arange(size), -1))
+        prev = np.empty(size, dtype=np.intp)
+        prev[:1] = -1
+        prev[1:] = last_valid[:-1]
+        has_prev = is_valid & (prev >= 0)
+        prev_values = index_array[np.maximum(prev, 0)]
+        sign = np.zeros(size, dtype=np.int8)
+        sign[has_prev & (index_array > prev_values)] = 1
+        sign[has_prev & (index_array < prev_values)] = -1
+        equal = has_prev & (index_array == prev_values)
+        return sign, equal
+
+    @staticmethod
+    def kill_chain_statistics(chain_index_list, windows=None, window_length: int = None) -> np.ndarray:
+        '''
+        NumPy version of generate_kill_chain_statistic, for many windows of the same chain at once.
+        Returns the same values as calling generate_kill_chain_statistic(chain_index_list[start:end]) for each window.
+
+        windows: iterable of [start, end, ...] (only the first 2 items are regarded) e.g. the output of discern_subchains
+        window_length: all windows of this length, i.e. [0, window_length], [1, window_length+1], ...
+        if neither is given, the statistic is computed for the whole chain (a single window)
+        '''
+        index_array = KillChain.index_array(chain_index_list)
+        size = len(index_array)
+        if windows is not None:
+            windows = np.array([window[:2] for window in windows], dtype=np.intp).reshape(-1, 2)
+            starts, ends = windows[:, 0], windows[:, 1]
+        elif window_length is not None:
+            starts = np.arange(max(size - window_length + 1, 0), dtype=np.intp)
+            ends = starts + window_length
+        else:
+            starts, ends = np.array([0], dtype=np.intp), np.array([size], dtype=np.intp)
+        starts = np.clip(starts, 0, size)
+        ends = np.clip(ends, starts, size)
+        lengths = ends - starts
+
+        sign, equal = KillChain.index_transitions(index_array)
+        unique_cumsum = np.concatenate([[0], np.cumsum(sign != 0)])
+        first_step = np.minimum(starts + 1, size)
+        total_unique_indexes = unique_cumsum[np.maximum(ends, first_step)] - unique_cumsum[first_step]
+        starts_on_nan = np.ones(len(starts), dtype=bool)
+        non_empty = lengths > 0
+        starts_on_nan[non_empty] = np.isnan(index_array[starts[non_empty]])
+
+        # the result is accumulated sequentially, step by step in the same order as generate_kill_chain_statistic.
+        # This keeps the floating point rounding (and so the output) identical.
+        result = np.zeros(len(starts), dtype=np.float64)
+        max_length = int(lengths.max()) if len(lengths) else 0
+        if max_length > 1:
+            steps_per_block = max(1, 2**22 // max_length)
+            offsets = np.arange(1, max_length, dtype=np.intp)
+            for block in range(0, len(starts), steps_per_block):
+                block_starts = starts[block:block + steps_per_block, None]
+                block_lengths = lengths[block:block + steps_per_block, None]
+                positions = np.minimum(block_starts + offsets, size - 1)
+                inside = offsets < block_lengths
+                with np.errstate(divide='ignore'):
+                    equal_step = -(1 / block_lengths)
+                steps = np.where(equal[positions], equal_step, sign[positions])
+                steps = np.where(inside, steps, 0.0)
+                result[block:block + steps_per_block] = np.add.accumulate(steps, axis=1)[:, -1]
+
+        with np.errstate(divide='ignore', invalid='ignore'):
+            statistic = result / total_unique_indexes
+        return np.where((total_unique_indexes > 0) & ~starts_on_nan, statistic, 0.0)
+
+    @staticmethod
+    def kill_chain_statistic(chain_index_list) -> float:
+        '''NumPy version of generate_kill_chain_statistic for a single chain'''
+        return float(KillChain.kill_chain_statistics(chain_index_list)[0])
+
     @staticmethod
     def assign_index(category):
         return KillChain.chain_dict[category]
@@ -82,10 +174,13 @@ class KillChain:
         return KillChain.reductive_methods[kc_conf['index_reducer']](category_as_indexes)
 
     @staticmethod
-    def __discern_single_subchain(chain_index_list: list, start_index: int, min_length: int, min_stat: float, max_slack_width: int=kc_conf['max_slack_width'], max_slack_depth: int= kc_conf['max_slack_depth']) -> list:
+    def __discern_single_subchain(chain_index_list: list, start_index: int, min_length: int, min_stat: float, max_slack_width: int=kc_conf['max_slack_width'], max_slack_depth: int= kc_conf['max_slack_depth'], statistic=None) -> list:
         '''
         Output: [start_index, end_index, statistic]
 
+        statistic: callable (start, end) -> kill chain statistic of chain_index_list[start:end].
+                   Defaults to recomputing generate_kill_chain_statistic on the slice, see KillChainWindow for the incremental version.
+
         growing phase: Not shrinking phase
         while True
           growing phase:
@@ -122,6 +217,8 @@ class KillChain:
             stat no longer increasing
             length of slice is min_length
       '''
+        if statistic is None:
+            statistic = lambda start, end: KillChain.generate_kill_chain_statistic(chain_index_list[start:end])
         end_index = min(start_index + min_length, len(chain_index_list))
 
         prev_stat = 0
@@ -136,8 +233,7 @@ class KillChain:
             if shrinking_phase:
                 shrink_amount += 1
             SI = start_index + shrink_amount
-            subchain = chain_index_list[SI:end_index]
-            stat = KillChain.generate_kill_chain_statistic(subchain)
+            stat = statistic(SI, end_index)
 
             if stat > min_stat:
                 if not shrinking_phase:  # First phase "Growing" phase
@@ -210,27 +306,306 @@ class KillChain:
         return jsc
 
     @staticmethod
-    def discern_subchains(chain_index_list: list, min_length: int = None, min_stat: int = None) -> list:
+    def search_subchains(chain_index_list: list, min_length: int, min_stat: float, start_index: int = 0, statistic=None,
+                         max_slack_width: int = kc_conf['max_slack_width'], max_slack_depth: int = kc_conf['max_slack_depth']):
+        '''
+        The scan of discern_subchains, one search at a time: yields (start_index, candidate) for every start index
+        tried, candidate being [start_index, end_index, statistic] or None. The next search starts at the end of the
+        candidate, or at the next index if there is none. Lazy, see KillChainStream.
+        '''
+        while start_index < (len(chain_index_list) - min_length):
+            candidate = KillChain.__discern_single_subchain(
+                chain_index_list, start_index, min_length, min_stat, max_slack_width, max_slack_depth, statistic=statistic)
+            yield start_index, candidate
+            if candidate:
+                start_index = candidate[1]  # end_index
+            else:
+                start_index += 1
+
+    @staticmethod
+    def discern_subchains(chain_index_list: list, min_length: int = None, min_stat: int = None, incremental: bool = None) -> list:
         '''
         Takes in a list of attack_indexes, outputs subchains within it. Output in the form -> [ [start_index, end_index, statistic], ...]
         Discover subchains within a series. Uses the configs in the config.yaml file if not defined:
           - min_chain_length
           - min_chain_statistic
+        incremental: if True, the statistic of each candidate window is updated in O(1) as the
+                     window grows or shrinks (see KillChainWindow), else it is recomputed from the slice every time.
+                     Both give the same subchains. Default: True if min_length >= INCREMENTAL_MIN_LENGTH
         '''
         if min_length == None:
             min_length = kc_conf['min_chain_length']
         if min_stat == None:
             min_stat = kc_conf['min_chain_statistic']
+        if incremental is None:
+            incremental = min_length >= KillChain.INCREMENTAL_MIN_LENGTH
+
+        if incremental:
+            window = KillChainWindow(chain_index_list)
+            chain_index_list = window.value_list
+            statistic = window.statistic
+        else:
+            chain_index_list = list(chain_index_list)
+            statistic = None
+        subchains = [
+            candidate for _, candidate in
+            KillChain.search_subchains(chain_index_list, min_length, min_stat, statistic=statistic)
+            if candidate
+        ]
+        if incremental and subchains:
+            # the running statistic can differ from generate_kill_chain_statistic in the last bits (rounding order),
+            # report the exact values for the chosen subchains
+            for subchain, stat in zip(subchains, KillChain.kill_chain_statistics(chain_index_list, subchains)):
+                subchain[2] = float(stat)
+        return subchains
+
+
+class KillChainWindow:
+    '''
+    Running kill chain statistic of a window [start, end) over a chain of attack indexes.
+
+    The transition of each index to the previous non NaN index (up, down or equal, see KillChain.index_transitions)
+    is computed once for the whole chain. The window keeps the running sum, number of unique transitions and
+    number of equal steps, so growing or shrinking it by one index is O(1). A window that jumps further than its
+    length (e.g. to the next search, see KillChain.search_subchains) is summed again instead.
+
+    The statistic is (sum - equal_steps / length) / unique_transitions, which is what generate_kill_chain_statistic
+    computes, up to floating point rounding. See KillChainStatistic for how comparisons stay identical.
+    '''
+
+    def __init__(self, chain_index_list) -> None:
+        self.values = KillChain.index_array(chain_index_list)
+        self.value_list = self.values.tolist()
+        sign, equal = KillChain.index_transitions(self.values)
+        self.sign = sign.tolist()
+        self.equal = equal.tolist()
+        self.transitions = (sign != 0).tolist()
+        self.is_nan = np.isnan(self.values).tolist()
+        self.start = 0
+        self.end = 0
+        self.sum = 0
+        self.unique_transitions = 0
+        self.equal_steps = 0
+
+    def __len__(self) -> int:
+        return len(self.values)
+
+    def __add(self, i: int, amount: int) -> None:
+        '''add (amount=1) or remove (amount=-1) the transition into index i'''
+        self.sum += amount * self.sign[i]
+        self.unique_transitions += amount * (self.sign[i] != 0)
+        self.equal_steps += amount * self.equal[i]
+
+    def grow(self) -> None:
+        '''end += 1'''
+        if self.end > self.start:
+            self.__add(self.end, 1)
+        self.end += 1
+
+    def trim(self) -> None:
+        '''end -= 1'''
+        self.end -= 1
+        if self.end > self.start:
+            self.__add(self.end, -1)
+
+    def shrink(self) -> None:
+        '''start += 1'''
+        self.start += 1
+        if self.start < self.end:
+            self.__add(self.start, -1)
 
-        chain_index_list = list(chain_index_list)
+    def extend(self) -> None:
+        '''start -= 1'''
+        if self.start < self.end:
+            self.__add(self.start, 1)
+        self.start -= 1
+
+    def __reset(self, start: int, end: int) -> None:
+        '''the window [start, end), summing its transitions'''
+        self.start = start
+        self.end = end
+        self.sum = sum(self.sign[start + 1:end])
+        self.unique_transitions = sum(self.transitions[start + 1:end])
+        self.equal_steps = sum(self.equal[start + 1:end])
+
+    def move(self, start: int, end: int) -> None:
+        '''moves the window to [start, end), one index at a time if that is shorter than summing it again'''
+        end = min(end, len(self.values))
+        if abs(start - self.start) + abs(end - self.end) > end - start:
+            self.__reset(start, end)
+            return
+        while self.end < end:
+            self.grow()
+        while self.start > start:
+            self.extend()
+        while self.start < start:
+            self.shrink()
+        while self.end > end:
+            self.trim()
+
+    def statistic(self, start: int, end: int) -> float:
+        '''kill chain statistic of chain_index_list[start:end]'''
+        if start >= min(end, len(self.values)):
+            return 0
+        self.move(start, end)
+        if self.unique_transitions == 0 or self.is_nan[self.start]:
+            return 0
+        length = self.end - self.start
+        stat = (self.sum - self.equal_steps / length) / self.unique_transitions
+        if not self.equal_steps:  # only integers were added, no rounding error
+            return stat
+        return KillChainStatistic(stat, self.value_list, self.start, self.end)
+
+
+class KillChainStatistic(float):
+    '''
+    A statistic returned by KillChainWindow, that remembers the window it was computed for.
+
+    generate_kill_chain_statistic adds the -1/length steps one by one, so its rounding differs from the
+    closed form used by KillChainWindow by up to ~length**2 units in the last place. When two statistics
+    (or a statistic and a threshold such as min_stat) are that close, the comparison is decided on the values
+    generate_kill_chain_statistic gives. Subchain discovery therefore makes the same decisions either way.
+    == and != are decided the same way, and the hash is that of the exact value, so equal statistics hash equal.
+    '''
+
+    def __new__(cls, value: float, value_list: list, start: int, end: int) -> 'KillChainStatistic':
+        stat = super().__new__(cls, value)
+        stat.value_list = value_list
+        stat.start = start
+        stat.end = end
+        stat.tolerance = (end - start) ** 2 * 2.3e-16 + 1e-15
+        stat._exact = None
+        return stat
+
+    def exact(self) -> float:
+        if self._exact is None:
+            self._exact = float(KillChain.generate_kill_chain_statistic(self.value_list[self.start:self.end]))
+        return self._exact
+
+    def __resolve(self, other) -> tuple:
+        other_tolerance = getattr(other, 'tolerance', 0)
+        if abs(float(self) - float(other)) > self.tolerance + other_tolerance:
+            return float(self), float(other)
+        other_exact = other.exact() if isinstance(other, KillChainStatistic) else float(other)
+        return self.exact(), other_exact
+
+    def __gt__(self, other) -> bool:
+        a, b = self.__resolve(other)
+        return a > b
+
+    def __ge__(self, other) -> bool:
+        a, b = self.__resolve(other)
+        return a >= b
+
+    def __lt__(self, other) -> bool:
+        a, b = self.__resolve(other)
+        return a < b
+
+    def __le__(self, other) -> bool:
+        a, b = self.__resolve(other)
+        return a <= b
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, (int, float)):
+            return NotImplemented
+        a, b = self.__resolve(other)
+        return a == b
+
+    def __ne__(self, other) -> bool:
+        if not isinstance(other, (int, float)):
+            return NotImplemented
+        a, b = self.__resolve(other)
+        return a != b
+
+    def __hash__(self) -> int:
+        return hash(self.exact())
+
+
+class KillChainStream:
+    '''
+    KillChain.discern_subchains on a chain that arrives in batches, e.g. the events of a tenant being watched.
+
+        stream = KillChainStream()
+        for events in batches:  # labelled events in time order, see Watcher
+            for start, end, stat in stream.feed(events['attack.index']):
+                ...
+        stream.flush()  # the end of the chain: the subchains that were waiting for more events
+
+    Subchains are [start_index, end_index, statistic] with positions in the whole chain (all the events fed).
+    A subchain is emitted as soon as it is final: when its search (see search_subchains) stopped growing before
+    the last event received, so that no later event can change it. Only the attack indexes from the start of the
+    pending search are kept. Fed all at once or in batches, the subchains are the ones discern_subchains finds,
+    in the same order.
+
+    max_pending: a search that is still growing this many events after its start is decided on the events
+        received so far, which bounds the memory (and time per batch) of the stream. Only then can the
+        subchains differ from discern_subchains, which would have grown that subchain further.
+    '''
+    MAX_PENDING = 10000
+
+    def __init__(self, min_length: int = None, min_stat: float = None, max_slack_width: int = None,
+                 max_slack_depth: int = None, max_pending: int = None) -> None:
+        self.min_length = kc_conf['min_chain_length'] if min_length is None else min_length
+        self.min_stat = kc_conf['min_chain_statistic'] if min_stat is None else min_stat
+        self.max_slack_width = kc_conf['max_slack_width'] if max_slack_width is None else max_slack_width
+        self.max_slack_depth = kc_conf['max_slack_depth'] if max_slack_depth is None else max_slack_depth
+        self.max_pending = max_pending or self.MAX_PENDING
+        self.offset = 0  # position in the chain of pending[0], the start of the next search
+        self.pending = []  # attack indexes from offset on, NaN if none
+
+    def __len__(self) -> int:
+        '''the number of events fed so far'''
+        return self.offset + len(self.pending)
+
+    def feed(self, chain_index_list) -> list:
+        '''adds the next attack indexes of the chain, returns the subchains that became final'''
+        self.pending.extend(KillChain.index_array(chain_index_list).tolist())
+        return self.__scan(final=False)
+
+    def flush(self) -> list:
+        '''the chain is complete: returns the remaining subchains'''
+        subchains = self.__scan(final=True)
+        self.offset += len(self.pending)
+        self.pending = []
+        return subchains
+
+    def __scan(self, final: bool) -> list:
+        window = KillChainWindow(self.pending)
+        values = window.value_list
+        statistic = _FurthestEnd(window.statistic)
+        searches = KillChain.search_subchains(
+            values, self.min_length, self.min_stat, statistic=statistic,
+            max_slack_width=self.max_slack_width, max_slack_depth=self.max_slack_depth)
         subchains = []
-        start_index = 0
-        while start_index < (len(chain_index_list) - min_length):
-            candidate = KillChain.__discern_single_subchain(
-                chain_index_list, start_index, min_length, min_stat)
+        next_start = 0
+        for start, candidate in searches:
+            if statistic.end >= len(values) and not final and len(values) - start < self.max_pending:
+                break  # the search reached the last event received, the next events can change it
+            statistic.end = 0
+            next_start = candidate[1] if candidate else start + 1
             if candidate:
                 subchains.append(candidate)
-                start_index = candidate[1]  # end_index
-            else:
-                start_index += 1
+        else:
+            # no more searches fit: the next one starts where the last one left off, once there are enough events
+            if final:
+                next_start = len(values)
+        if subchains:
+            for subchain, stat in zip(subchains, KillChain.kill_chain_statistics(values, subchains)):
+                subchain[0] += self.offset
+                subchain[1] += self.offset
+                subchain[2] = float(stat)
+        self.offset += next_start
+        del self.pending[:next_start]
         return subchains
+
+
+class _FurthestEnd:
+    '''a statistic (start, end) -> float, that records the furthest end it was asked for'''
+
+    def __init__(self, statistic) -> None:
+        self.statistic = statistic
+        self.end = 0
+
+    def __call__(self, start: int, end: int) -> float:
+        self.end = max(self.end, end)
+        return self.statistic(start, end)
@@ -0,0 +1,193 @@
+#!/bin/python3
+"""
+Pagination and checkpoint state of the activities.list query of one logtype (or one window of a sharded logtype).
+Shared by Collector.query_one and AsyncCollector.query_one_async, which only differ in how the requests are sent.
+"""
+import json
+import os
+
+import pandas as pd
+
+from ..utils.compression import compress_bytes, data_file_name
+from ..utils.path import rel_path
+
+
+class Listing:
+    """
+    appends the pages of a query to <save_path>/<logtype>.json, and checkpoints after each page, see Collector.query_one.
+
+        listing = Listing(collector, save_path, logtype, ...)
+        try:
+            while not listing.done:
+                try:
+                    resp = <send activities.list(**listing.request_params())>
+                except HttpError as e:
+                    if not listing.restart(e):
+                        raise
+                    continue
+                listing.save_page(resp)
+        finally:
+            listing.close()
+        return listing.finish()
+    """
+
+    def __init__(
+        self,
+        collector,
+        save_path: str,
+        logtype: str,
+        user: str = "all",
+        max_results: int = 1000,
+        max_pages: int = None,
+        start_time: str = None,
+        end_time: str = None,
+        resume: bool = False,
+        compress: str = None,
+    ) -> None:
+        if not (save_path[0] == "/" or save_path.startswith("./")):
+            save_path = "./" + save_path
+        if not save_path.endswith("/"):
+            save_path = save_path + "/"
+        self.collector = collector
+        self.save_path = save_path
+        self.logtype = logtype
+        self.user = user
+        self.max_results = max_results
+        self.max_pages = max_pages
+        self.start_time = start_time
+        self.end_time = end_time
+        self.compress = compress
+        self.data_file = rel_path(save_path, data_file_name(logtype, compress))
+        self.file = None
+
+        params = collector._checkpoint_params(user, max_results, max_pages, start_time, end_time, compress)
+        checkpoint = collector.read_checkpoint(save_path, logtype) if resume else None
+        if checkpoint is not None and checkpoint["params"] != params:
+            raise ValueError(
+                f"cannot resume {logtype}: the query parameters differ from the checkpoint ({checkpoint['params']})"
+            )
+        fresh = checkpoint is None
+        if fresh:
+            # data already in the file (e.g. acquired without checkpoints) is kept, a resume only truncates
+            # what a checkpoint describes
+            offset = os.path.getsize(self.data_file) if os.path.exists(self.data_file) else 0
+            checkpoint = {
+                "logtype": logtype,
+                "params": params,
+                "page_token": None,
+                "pages": 0,
+                "records": 0,
+                "last_time": None,
+                "last_ids": [],
+                "offset": offset,
+                "complete": False,
+            }
+        if resume and not checkpoint["complete"] and os.path.exists(self.data_file):
+            os.truncate(self.data_file, checkpoint["offset"])
+        os.makedirs(save_path, exist_ok=True)
+        if fresh:  # a run interrupted before its first page resumes from this offset too
+            collector.write_checkpoint(save_path, logtype, checkpoint)
+
+        self.checkpoint = checkpoint
+        self.page_token = checkpoint["page_token"]
+        self.resumed_token = self.page_token  # the page token comes from a checkpoint, and may have expired
+        self.has_next = checkpoint["pages"] == 0 or self.page_token is not None
+        self.skip_written = False
+
+    @property
+    def done(self) -> bool:
+        if self.checkpoint["complete"] or not self.has_next:
+            return True
+        return bool(self.max_pages) and self.checkpoint["pages"] > self.max_pages
+
+    def request_params(self) -> dict:
+        """the keyword arguments of activities.list for the next page"""
+        return {
+            "userKey": self.user,
+            "applicationName": self.logtype,
+            "maxResults": self.max_results,
+            "startTime": self.start_time,
+            "endTime": self.end_time,
+            "pageToken": self.page_token,
+        }
+
+    def restart(self, error) -> bool:
+        """
+        called with the HttpError of a request. If it rejected the page token of the checkpoint (expired),
+        the query is listed again up to the last id.time written, skipping the activities already written.
+        Returns False if the error can't be recovered from.
+        """
+        if not self.resumed_token or error.resp.status not in (400, 410):
+            return False
+        self.resumed_token = None
+        self.page_token = None
+        self.skip_written = True
+        if self.checkpoint["last_time"] is not None:
+            last_time = pd.Timestamp(self.checkpoint["last_time"]) + pd.Timedelta(milliseconds=1)
+            self.end_time = last_time.isoformat()
+        return True
+
+    def save_page(self, resp: dict) -> int:
+        """appends the activities of a response to the data file and writes the checkpoint. Returns the activities written"""
+        checkpoint = self.checkpoint
+        self.resumed_token = None
+        activities = resp.get("items", [])
+        if self.skip_written:
+            activities = [a for a in activities if not self.__already_written(a)]
+
+        if activities:
+            if self.file is None:  # only create/open the file once there is data
+                self.file = open(self.data_file, "ab")
+            page = "".join(json.dumps(activity) + "\n" for activity in activities)
+            self.file.write(compress_bytes(page.encode(), self.compress))
+            for activity in activities:
+                self.__track_last_time(activity)
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            checkpoint["offset"] = self.file.tell()
+
+        self.page_token = resp.get("nextPageToken")
+        self.has_next = self.page_token is not None
+        checkpoint.update(
+            page_token=self.page_token,
+            pages=checkpoint["pages"] + 1,
+            records=checkpoint["records"] + len(activities),
+        )
+        self.collector.write_checkpoint(self.save_path, self.logtype, checkpoint)
+        return len(activities)
+
+    def close(self) -> None:
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def finish(self) -> int:
+        """marks the checkpoint complete, returns the number of activities of the query"""
+        self.close()
+        if not self.checkpoint["complete"]:
+            self.checkpoint["complete"] = True
+            self.collector.write_checkpoint(self.save_path, self.logtype, self.checkpoint)
+        return self.checkpoint["records"]
+
+    def __track_last_time(self, activity: dict) -> None:
+        """keeps the oldest id.time written so far, and the ids of the activities at that time"""
+        checkpoint = self.checkpoint
+        activity_id = activity.get("id", {})
+        time_, unique_id = activity_id.get("time"), activity_id.get("uniqueQualifier")
+        if time_ is None:
+            return
+        if checkpoint["last_time"] is None or time_ < checkpoint["last_time"]:
+            checkpoint["last_time"] = time_
+            checkpoint["last_ids"] = [unique_id]
+        elif time_ == checkpoint["last_time"]:
+            checkpoint["last_ids"].append(unique_id)
+
+    def __already_written(self, activity: dict) -> bool:
+        checkpoint = self.checkpoint
+        activity_id = activity.get("id", {})
+        time_ = activity_id.get("time")
+        if time_ is None or checkpoint["last_time"] is None:
+            return False
+        if time_ == checkpoint["last_time"]:
+            return activity_id.get("uniqueQualifier") in checkpoint["last_ids"]
+        return time_ > checkpoint["last_time"]
@@ -0,0 +1,112 @@
+#!/bin/python3
+import hashlib
+import os
+import os.path
+import pickle
+import threading
+import yaml
+
+from ..utils.path import rel_path, CONFIG_DIR
+from ..config import config
+from .kill_chain import KillChain
+
+MAPPING_FILE = rel_path(CONFIG_DIR, 'event_to_mitre.yml')
+CACHE_DIR = os.path.join(
+    os.environ.get('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'alfa')
+
+
+class MitreMapping:
+    '''
+    Compiled form of config/event_to_mitre.yml.
+
+    For every event name, the attack labels, the attack categories (last part of each label)
+    and the reduced kill chain index (see KillChain.reduce_category_list) are computed once.
+
+    Use MitreMapping.load() rather than the constructor. The compiled mapping is built once per process,
+    and persisted as a pickle under CACHE_DIR. The cache is keyed on the content hash of the yml file and the
+    kill_chain.index_reducer setting, so changing either rebuilds it automatically.
+
+    The labels and categories are tuples: they are shared by every event with that name.
+    '''
+    _compiled = dict()  # cache key -> MitreMapping, shared by every Analyser in the process
+    _lock = threading.Lock()
+    CACHE_VERSION = 2  # changes with the compiled form, so caches written by older versions are rebuilt
+
+    def __init__(self, labels: dict, key: str = None) -> None:
+        self.key = key
+        self.labels = {name: tuple(attack_labels) for name, attack_labels in labels.items()}
+        self.categories = {
+            name: tuple(label.split('.')[-1] for label in attack_labels)
+            for name, attack_labels in self.labels.items()
+        }
+        self.indexes = {
+            name: KillChain.reduce_category_list(categories)
+            for name, categories in self.categories.items()
+        }
+
+    def __contains__(self, event_name: str) -> bool:
+        return event_name in self.labels
+
+    def __getitem__(self, event_name: str) -> tuple:
+        return self.labels[event_name]
+
+    def __len__(self) -> int:
+        return len(self.labels)
+
+    @classmethod
+    def cache_key(cls, raw: bytes, index_reducer: str) -> str:
+        digest = hashlib.sha256(raw)
+        digest.update(f'{index_reducer}:{cls.CACHE_VERSION}'.encode())
+        return digest.hexdigest()
+
+    @staticmethod
+    def cache_path() -> str:
+        return os.path.join(CACHE_DIR, 'event_to_mitre.pkl')
+
+    @classmethod
+    def load(cls, mapping_file: str = MAPPING_FILE, index_reducer: str = None) -> 'MitreMapping':
+        '''
+        returns the compiled mapping for mapping_file, in order of preference:
+          1. the process-wide instance
+          2. the on-disk cache, if its key matches
+          3. a freshly compiled mapping (which is then written to the on-disk cache)
+        '''
+        if index_reducer is None:
+            index_reducer = config['kill_chain']['index_reducer']
+        with open(mapping_file, 'rb') as f:
+            raw = f.read()
+        key = cls.cache_key(raw, index_reducer)
+
+        with cls._lock:
+            if key in cls._compiled:
+                return cls._compiled[key]
+            mapping = cls.__read_cache(key)
+            if mapping is None:
+                mapping = cls(yaml.safe_load(raw) or dict(), key=key)
+                cls.__write_cache(mapping)
+            cls._compiled[key] = mapping
+            return mapping
+
+    @classmethod
+    def __read_cache(cls, key: str) -> 'MitreMapping':
+        try:
+            with open(cls.cache_path(), 'rb') as f:
+                cached = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+        if not isinstance(cached, cls) or cached.key != key:
+            return None
+        return cached
+
+    @classmethod
+    def __write_cache(cls, mapping: 'MitreMapping') -> None:
+        '''the cache is an optimisation only, an unwritable cache dir is ignored'''
+        path = cls.cache_path()
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                pickle.dump(mapping, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
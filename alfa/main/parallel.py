@@ -0,0 +1,140 @@
+#!/bin/python3
+'''
+loading and labelling in a process pool, for Alfa.load(..., workers=N), Analyser.analyse_all_files and Analyser.analyse_all.
+
+Every logtype is parsed, normalized and labelled independently, so each one is a task of its own. NDJSON files
+much larger than the others are also split in byte ranges (see Collector.split_file), so a single large logtype
+(e.g. drive) does not leave the other workers idle. The labelled frames are concatenated in the order of the
+tasks, which gives the same frame as loading without workers.
+
+The subchain discovery of Alfa.subchains_by runs here too: the chains of the groups (e.g. actors) are
+independent, so each one is a task (see group_subchains).
+'''
+import os
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+
+import pandas as pd
+
+from .collector import Collector
+from .kill_chain import KillChain
+from .store import ColumnStore, select_days
+
+MIN_SPLIT_BYTES = 16 * 2**20  # files are not split in parts smaller than this
+TASKS_PER_WORKER = 4  # aim for about this many tasks per worker, so that the workers finish at about the same time
+
+
+def default_workers() -> int:
+    return len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity') else os.cpu_count() or 1
+
+
+def map_parallel(fn, items: list, workers: int = None) -> list:
+    '''[fn(item) for item in items] in a process pool of `workers` processes (default: one per CPU)'''
+    workers = min(workers or default_workers(), len(items))
+    if workers <= 1:
+        return [fn(item) for item in items]
+    chunksize = max(1, len(items) // (workers * TASKS_PER_WORKER))  # many small items (e.g. groups) are sent in batches
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(fn, items, chunksize=chunksize))
+
+
+def group_subchains(chain: list, min_length: int = None, min_stat: float = None, subchains: bool = True) -> tuple:
+    '''(kill chain statistic, subchains or None) of the chain of attack indexes of one group, see Alfa.subchains_by'''
+    return (KillChain.kill_chain_statistic(chain),
+            KillChain.discern_subchains(chain, min_length, min_stat) if subchains else None)
+
+
+def dataset_sources(path: str, logtype='all') -> list:
+    '''
+    [(logtype, data file)] of a dataset, the data file is None for the logtypes with a current columnar copy (see
+    ColumnStore.is_current), which is read instead. A dataset can have both kinds, e.g. a logtype that failed
+    during the acquisition only has its json file, one acquired again without --columnar has an outdated copy.
+    '''
+    C = Collector()
+    store = ColumnStore(path)
+    if logtype == 'all':
+        files = {os.path.basename(f).split('.json')[0]: f for f in C.data_files(path)}
+        logtypes = sorted(set(files) | set(store.logtypes()))
+    else:
+        logtypes = [logtype]
+        try:
+            files = {logtype: C.data_file(path, logtype)}
+        except FileNotFoundError:
+            if store.source(logtype) is None:
+                raise
+            files = dict()  # only the copy is left
+    sources = []
+    for typ in logtypes:
+        current = store.is_current(typ, files.get(typ))
+        if not current and store.source(typ):
+            print(f'{typ}: the columnar copy does not match {files[typ]} (written to since), reading {files[typ]}')
+        sources.append((typ, None if current else files[typ]))
+    return sources
+
+
+def logtype_chunks(path: str, logtype: str, json_file: str = None, columns: list = None, start_time: str = None,
+                   end_time: str = None, byte_range: tuple = None):
+    '''
+    the activities of one logtype of a dataset, in chunks: from its columnar copy if json_file is None, otherwise
+    from json_file (or byte_range of it). Either way only the days between start_time and end_time are kept
+    '''
+    if json_file is None:
+        yield from ColumnStore(path).read_chunks(logtype, columns, start_time, end_time)
+        return
+    for df in Collector().load_chunks(json_file, columns=columns, byte_range=byte_range):
+        df = select_days(df, start_time, end_time)
+        if df.shape[0]:
+            yield df
+
+
+def dataset_chunks(path: str, logtype='all', columns: list = None, start_time: str = None, end_time: str = None):
+    '''the activities of a dataset in chunks (see dataset_sources). With 'all', each chunk gets a "logtype" column'''
+    for typ, json_file in dataset_sources(path, logtype):
+        chunks = logtype_chunks(path, typ, json_file, columns, start_time, end_time)
+        yield from with_logtype(chunks, typ) if logtype == 'all' else chunks
+
+
+def load_tasks(path: str, logtype: str, workers: int) -> list:
+    '''
+    [(logtype, data file, byte range)] to load a dataset with Alfa.load. Tasks without a data file read the
+    columnar copy of their logtype instead, see dataset_sources.
+    '''
+    C = Collector()
+    sources = dataset_sources(path, logtype)
+    total = sum(os.path.getsize(f) for _, f in sources if f is not None)
+    split_bytes = max(MIN_SPLIT_BYTES, total // (workers * TASKS_PER_WORKER))
+    return [
+        (typ, f, byte_range)
+        for typ, f in sources
+        for byte_range in (C.split_file(f, split_bytes) if f is not None else [None])
+    ]
+
+
+def load_task(task: tuple, path: str, add_logtype: bool, columns: list = None, start_time: str = None,
+              end_time: str = None, email: list = None, filter: bool = True) -> pd.DataFrame:
+    '''loads and labels one task of load_tasks, in a worker process'''
+    from .analyser import Analyser  # analyser imports this module
+    logtype, json_file, byte_range = task
+    chunks = logtype_chunks(path, logtype, json_file, columns, start_time, end_time, byte_range)
+    if add_logtype:
+        chunks = with_logtype(chunks, logtype)
+    return Analyser().analyse_chunks(chunks, email, filter=filter)
+
+
+def with_logtype(chunks, logtype: str):
+    '''adds the "logtype" column, as Collector.load_all_chunks and ColumnStore.read_chunks('all') do'''
+    for df in chunks:
+        df['logtype'] = logtype
+        yield df
+
+
+def load_parallel(path: str, logtype: str = 'all', workers: int = None, **options) -> pd.DataFrame:
+    '''
+    Alfa.load without the Alfa object: the labelled activities of a dataset, loaded by `workers` processes.
+    options: columns, start_time, end_time, email, filter, see load_task
+    '''
+    workers = workers or default_workers()
+    tasks = load_tasks(path, logtype, workers)
+    frames = map_parallel(partial(load_task, path=path, add_logtype=logtype == 'all', **options), tasks, workers)
+    frames = [df for df in frames if df.shape[1]]
+    return pd.concat(frames, ignore_index=True) if frames else pd.DataFrame()
@@ -0,0 +1,160 @@
+#!/bin/python3
+'''
+per stage instrumentation of the analysis pipeline: wall time, CPU time, rows and peak memory.
+
+The stages (parse, normalize, label, events, sort, subchains, join, ...) are marked in the code with
+
+    with profile('normalize') as stage:
+        df = pd.json_normalize(chunk)
+        stage.rows += len(df)
+
+which costs next to nothing unless a Profiler is active:
+
+    with Profiler() as P:
+        A = Alfa.load('all', path='data/foo')
+    P.stats()       # or A.stats, Alfa.load(..., profiler=P) keeps the profiler on the Alfa object
+    P.report('profile.json')
+
+A stage entered several times (e.g. once per chunk) adds up. Stages can be nested, e.g. label runs inside load.
+'''
+import cProfile
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+from tabulate import tabulate
+
+STAT_KEYS = ('calls', 'wall', 'cpu', 'rows', 'peak_memory')
+
+
+class Stage:
+    '''what a `with profile(...) as stage` block gets, count the rows it produced in stage.rows'''
+    __slots__ = ('rows',)
+
+    def __init__(self) -> None:
+        self.rows = 0
+
+
+class Profiler:
+    '''
+    memory: track the peak memory of every stage with tracemalloc. This slows the pipeline down noticeably
+    cprofile: the name of a stage to run under cProfile, e.g. "label". Its profile is written to cprofile_path
+        (default <stage>.prof, open it with pstats or snakeviz)
+    '''
+
+    def __init__(self, memory: bool = True, cprofile: str = None, cprofile_path: str = None) -> None:
+        self.memory = memory
+        self.cprofile = cprofile
+        self.cprofile_path = cprofile_path or (f'{cprofile}.prof' if cprofile else None)
+        self._stats = dict()  # stage -> {calls, wall, cpu, rows, peak_memory}
+        self._stack = []  # [name, absolute peak memory so far] of the stages currently entered
+        self._cprofile = cProfile.Profile() if cprofile else None
+        self._started_tracemalloc = False
+        self._previous = None
+
+    def __enter__(self) -> 'Profiler':
+        global _active
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._previous, _active = _active, self
+        return self
+
+    def __exit__(self, *exc) -> None:
+        global _active
+        _active = self._previous
+        if self._started_tracemalloc:
+            tracemalloc.stop()
+            self._started_tracemalloc = False
+        if self._cprofile is not None and self._stats.get(self.cprofile):
+            self._cprofile.dump_stats(self.cprofile_path)
+
+    @contextmanager
+    def stage(self, name: str, rows: int = 0):
+        stage = Stage()
+        stage.rows = rows
+        if threading.current_thread() is not threading.main_thread():
+            yield stage  # stages of worker threads would overlap, only the main thread is profiled
+            return
+        tracing = self.memory and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:  # keep the peak of the enclosing stage before resetting it
+                self._stack[-1][1] = max(self._stack[-1][1], peak)
+            tracemalloc.reset_peak()
+        else:
+            current = 0
+        frame = [name, current]
+        self._stack.append(frame)
+        cprofiled = self._cprofile is not None and name == self.cprofile and \
+            not any(f[0] == name for f in self._stack[:-1])
+        if cprofiled:
+            self._cprofile.enable()
+        wall, cpu = time.perf_counter(), time.process_time()
+        try:
+            yield stage
+        finally:
+            wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+            if cprofiled:
+                self._cprofile.disable()
+            self._stack.pop()
+            peak = max(frame[1], tracemalloc.get_traced_memory()[1]) if tracing else 0
+            if self._stack:
+                self._stack[-1][1] = max(self._stack[-1][1], peak)
+            stats = self._stats.setdefault(name, dict.fromkeys(STAT_KEYS, 0))
+            stats['calls'] += 1
+            stats['wall'] += wall
+            stats['cpu'] += cpu
+            stats['rows'] += stage.rows
+            if tracing:
+                stats['peak_memory'] = max(stats['peak_memory'], peak - current)
+
+    def stats(self) -> dict:
+        '''stage -> {calls, wall (s), cpu (s), rows, peak_memory (bytes, above the memory in use when it started)}'''
+        return {name: dict(stats) for name, stats in self._stats.items()}
+
+    def table(self) -> str:
+        rows = [
+            [name, s['calls'], f"{s['wall']:.3f}", f"{s['cpu']:.3f}", s['rows'],
+             f"{s['peak_memory'] / 2**20:.1f}" if self.memory else '']
+            for name, s in self._stats.items()
+        ]
+        return tabulate(rows, headers=['stage', 'calls', 'wall (s)', 'cpu (s)', 'rows', 'peak (MiB)'])
+
+    def report(self, path: str) -> None:
+        '''writes the stats as JSON'''
+        report = {'stages': self.stats(), 'memory': self.memory}
+        if self._cprofile is not None:
+            report['cprofile'] = {'stage': self.cprofile, 'path': os.path.abspath(self.cprofile_path)}
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+class _NotProfiling(Stage):
+    '''the stage of profile() when no Profiler is active, a reusable no-op context manager'''
+    __slots__ = ()
+
+    def __enter__(self) -> Stage:
+        return self
+
+    def __exit__(self, *exc) -> None:
+        pass
+
+
+_active = None
+_NOT_PROFILING = _NotProfiling()
+
+
+def profile(name: str, rows: int = 0):
+    '''a stage of the active Profiler (see Profiler.stage), or nothing if none is active'''
+    if _active is None:
+        _NOT_PROFILING.rows = rows
+        return _NOT_PROFILING
+    return _active.stage(name, rows)
+
+
+def active_profiler() -> Profiler:
+    return _active
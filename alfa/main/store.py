@@ -0,0 +1,236 @@
+#!/bin/python3
+'''
+On-disk columnar copy of an acquired dataset, written next to the raw json files (alfa acquire --columnar):
+
+    <dataset>/columnar/<logtype>/<YYYY-MM-DD>/part-<n>/<column>.json
+    <dataset>/columnar/<logtype>/source.json    the data file the copy was made from, and its size
+
+Each column of a partition is a json list, so a load only reads the logtypes, days and columns it needs, and
+skips parsing and normalizing the activities. Low cardinality activity_defaults columns are stored as categories
+and codes. Nothing is unpickled: reading a dataset directory from elsewhere (e.g. alfa batch) can't run code.
+
+A copy is only read while its data file has the size it was made from (see ColumnStore.is_current): a data file
+appended to afterwards (e.g. by an acquire without --columnar, or --resume) is read instead.
+'''
+import gc
+import json
+import os
+import os.path
+import shutil
+from contextlib import contextmanager
+from urllib.parse import quote
+
+import pandas as pd
+
+from ..config import config
+from ..utils.dates import normalize_datetime
+from .profiler import profile
+
+STORE_DIR = 'columnar'
+UNKNOWN_DAY = 'unknown'
+COLUMNS_FILE = 'columns.json'  # column -> dtype
+SOURCE_FILE = 'source.json'
+TIME_COLUMN = 'id.time'
+EVENTS_COLUMN = 'events'
+# activity_defaults columns that are not unique per activity
+CATEGORICAL_COLUMNS = [
+    column for column in config['activity_defaults']['columns']
+    if column not in (EVENTS_COLUMN, TIME_COLUMN, 'etag')
+]
+
+
+def day_bounds(start_time=None, end_time=None) -> tuple:
+    '''(first day, last day) between start_time and end_time as "YYYY-MM-DD", None for an open end'''
+    start_day = normalize_datetime(start_time)[:10] if start_time else None
+    end_day = normalize_datetime(end_time)[:10] if end_time else None
+    return start_day, end_day
+
+
+def select_days(df: pd.DataFrame, start_time=None, end_time=None) -> pd.DataFrame:
+    '''
+    the activities of df on the days between start_time and end_time, the rows ColumnStore.read_chunks reads for
+    the same times (whole days, activities without id.time are left out)
+    '''
+    if start_time is None and end_time is None:
+        return df
+    start_day, end_day = day_bounds(start_time, end_time)
+    if TIME_COLUMN not in df:
+        return df.iloc[0:0]
+    days = df[TIME_COLUMN].str[:10]
+    keep = days.notna()
+    if start_day is not None:
+        keep &= days >= start_day
+    if end_day is not None:
+        keep &= days <= end_day
+    return df[keep.to_numpy()].reset_index(drop=True)
+
+
+@contextmanager
+def gc_paused():
+    '''
+    decoding the events creates millions of small containers, each allocation can trigger a (useless) garbage collection.
+    Pausing the collector while a partition is read makes that several times faster.
+    '''
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+class ColumnStore:
+    '''
+    Writes and reads the columnar copy of a dataset directory (e.g. data/230101.120000).
+    Collector.query writes it at acquire time, Alfa.load reads it when it exists.
+    '''
+
+    def __init__(self, dataset_path: str) -> None:
+        self.dataset_path = dataset_path
+        self.root = os.path.join(dataset_path, STORE_DIR)
+
+    def exists(self) -> bool:
+        return os.path.isdir(self.root)
+
+    def logtypes(self) -> list:
+        '''the logtypes with a complete copy'''
+        if not self.exists():
+            return []
+        return sorted(typ for typ in os.listdir(self.root) if self.source(typ) is not None)
+
+    def days(self, logtype: str) -> list:
+        '''the days of a logtype with a complete copy'''
+        if self.source(logtype) is None:
+            return []
+        logtype_dir = os.path.join(self.root, logtype)
+        return sorted(day for day in os.listdir(logtype_dir) if os.path.isdir(os.path.join(logtype_dir, day)))
+
+    def source(self, logtype: str):
+        '''{"file": name of the data file, "size": its size} the copy of logtype was made from, None without a copy'''
+        try:
+            with open(os.path.join(self.root, logtype, SOURCE_FILE)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def is_current(self, logtype: str, data_file: str = None) -> bool:
+        '''
+        whether the copy of logtype has the activities of data_file, its data file in the dataset: the file it was
+        made from, with the same size. Without data_file (e.g. the json files were removed) any complete copy is
+        '''
+        source = self.source(logtype)
+        if source is None or data_file is None:
+            return source is not None
+        if os.path.basename(data_file) != source['file']:
+            return False
+        return os.path.getsize(data_file) == source['size']
+
+    def remove(self, logtype: str) -> None:
+        '''removes the copy of logtype, e.g. when its data file is appended to without updating the copy'''
+        shutil.rmtree(os.path.join(self.root, logtype), ignore_errors=True)
+
+    def write_logtype(self, logtype: str, chunks, data_file: str = None) -> int:
+        '''
+        (re)writes the partitions of a logtype from an iterable of normalized DataFrames,
+        e.g. Collector.load_chunks of data_file. Returns the number of activities written.
+        data_file: the file the chunks are read from, its size is recorded (see is_current)
+        '''
+        size = os.path.getsize(data_file) if data_file else None
+        self.remove(logtype)
+        logtype_dir = os.path.join(self.root, logtype)
+        total = 0
+        for part, df in enumerate(chunks):
+            if TIME_COLUMN in df:
+                days = df[TIME_COLUMN].str[:10].fillna(UNKNOWN_DAY)
+            else:
+                days = pd.Series(UNKNOWN_DAY, index=df.index)
+            for day, day_df in df.groupby(days, sort=False):
+                self.__write_part(os.path.join(logtype_dir, day, f'part-{part:05d}'), day_df)
+            total += df.shape[0]
+        os.makedirs(logtype_dir, exist_ok=True)
+        source = {'file': os.path.basename(data_file) if data_file else None, 'size': size, 'activities': total}
+        with open(os.path.join(logtype_dir, SOURCE_FILE), 'w') as f:  # last: a copy without it is incomplete
+            json.dump(source, f)
+        return total
+
+    def __write_part(self, part_dir: str, df: pd.DataFrame) -> None:
+        os.makedirs(part_dir, exist_ok=True)
+        df = df.reset_index(drop=True)
+        with open(os.path.join(part_dir, COLUMNS_FILE), 'w') as f:
+            json.dump({column: str(dtype) for column, dtype in df.dtypes.items()}, f)
+        for column in df.columns:
+            series = df[column]
+            if column in CATEGORICAL_COLUMNS:
+                codes, categories = pd.factorize(series)
+                data = {'categories': categories.tolist(), 'codes': codes.tolist()}
+            else:
+                data = series.astype(object).where(series.notna(), None).tolist()
+            with open(os.path.join(part_dir, quote(column, safe='.') + '.json'), 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+
+    def __selected_days(self, logtype: str, start_time, end_time) -> list:
+        days = self.days(logtype)
+        if start_time is None and end_time is None:
+            return days
+        start_day, end_day = day_bounds(start_time, end_time)
+        return [
+            day for day in days
+            if day != UNKNOWN_DAY
+            and (start_day is None or day >= start_day)
+            and (end_day is None or day <= end_day)
+        ]
+
+    def __read_part(self, part_dir: str, columns: list = None) -> pd.DataFrame:
+        with open(os.path.join(part_dir, COLUMNS_FILE)) as f:
+            dtypes = json.load(f)
+        if columns is None:
+            columns = list(dtypes)
+        data = dict()
+        for column in columns:
+            if column not in dtypes:
+                continue
+            with open(os.path.join(part_dir, quote(column, safe='.') + '.json')) as f:
+                values = json.load(f)  # one call: the decoder shares the repeated keys of the events
+            if isinstance(values, dict):  # categories and codes
+                series = pd.Series(pd.Categorical.from_codes(values['codes'], values['categories']))
+                series = series.astype(dtypes[column])
+            elif dtypes[column] == 'object':
+                series = pd.Series(values, dtype=object)
+                series = series.where(series.notna(), float('nan'))  # missing as in the json files
+            else:
+                series = pd.Series(values, dtype=dtypes[column])
+            data[column] = series
+        return pd.DataFrame(data)
+
+    def read_chunks(self, logtype='all', columns: list = None, start_time: str = None, end_time: str = None):
+        '''
+        yields one DataFrame per partition part.
+        logtype: 'all', a logtype, or a list of logtypes. With 'all' or a list, a "logtype" column is added
+        columns: only read these columns (default: all stored columns)
+        start_time, end_time: only read the days in between. Rows are not filtered on time within a day.
+        '''
+        if logtype == 'all':
+            logtypes = self.logtypes()
+        elif isinstance(logtype, str):
+            logtypes = [logtype]
+        else:
+            logtypes = list(logtype)
+        add_logtype = not isinstance(logtype, str) or logtype == 'all'
+        for typ in logtypes:
+            for day in self.__selected_days(typ, start_time, end_time):
+                day_dir = os.path.join(self.root, typ, day)
+                for part in sorted(os.listdir(day_dir)):
+                    with gc_paused(), profile('read_columnar') as stage:
+                        df = self.__read_part(os.path.join(day_dir, part), columns)
+                        stage.rows = len(df)
+                    if add_logtype:
+                        df['logtype'] = typ
+                    yield df
+
+    def read(self, logtype='all', columns: list = None, start_time: str = None, end_time: str = None) -> pd.DataFrame:
+        '''see read_chunks'''
+        chunks = list(self.read_chunks(logtype, columns, start_time, end_time))
+        if not chunks:
+            return pd.DataFrame()
+        return pd.concat(chunks, ignore_index=True)
@@ -0,0 +1,198 @@
+#!/bin/python3
+'''
+Client side throttling of the Reports API requests, shared by every worker thread of the collector.
+
+    TokenBucket: at most `rate` requests per second, in bursts of at most `capacity`
+    ConcurrencyLimit: at most `limit` requests in flight. The limit is adjusted AIMD style (like TCP congestion control):
+        it grows by about one per round of successful requests, and is halved when the API throttles (429) or fails (5xx)
+
+Throttle combines both, and counts the requests and the time workers spent waiting.
+Collector uses the process-wide instance, see shared_throttle. AsyncThrottle is the same for coroutines (AsyncCollector).
+'''
+import asyncio
+import threading
+import time
+
+STAT_KEYS = ('requests', 'throttled', 'rate_wait', 'concurrency_wait', 'backoff_wait')
+
+
+class TokenBucket:
+    def __init__(self, rate: float, capacity: float = None) -> None:
+        self.rate = rate
+        self.capacity = capacity or rate
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def reserve(self) -> float:
+        '''
+        takes a token, returns how long to wait before it is due.
+        Tokens are reserved in order (the count goes negative), so waiting threads are served first come first served
+        instead of all waking up and competing for the next token.
+        '''
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= 1
+            return -self.tokens / self.rate if self.tokens < 0 else 0.0
+
+    def acquire(self) -> float:
+        '''takes a token, and sleeps until it is due. Returns the time slept'''
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+        return delay
+
+
+class ConcurrencyLimit:
+    DECREASE_FACTOR = 0.5
+
+    def __init__(self, max_limit: int, min_limit: int = 1) -> None:
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max_limit)
+        self.in_flight = 0
+        self._decreased_at = 0.0
+        self._cond = threading.Condition()
+
+    def resize(self, max_limit: int) -> None:
+        with self._cond:
+            self.max_limit = max(max_limit, self.min_limit)
+            self.limit = min(self.limit, self.max_limit)
+            self._cond.notify_all()
+
+    def acquire(self) -> float:
+        '''waits for a free slot, returns the time at which it was taken (pass it to release)'''
+        with self._cond:
+            while self.in_flight >= int(self.limit):
+                self._cond.wait()
+            self.in_flight += 1
+        return time.monotonic()
+
+    def release(self, started: float, throttled: bool = False) -> None:
+        with self._cond:
+            self._adjust(started, throttled)
+            self._cond.notify_all()
+
+    def _adjust(self, started: float, throttled: bool) -> None:
+        '''the AIMD step, called with the lock held'''
+        self.in_flight -= 1
+        if throttled:
+            # requests sent before the last decrease were sent at the old limit, they don't count again
+            if started >= self._decreased_at:
+                self.limit = max(self.min_limit, self.limit * self.DECREASE_FACTOR)
+                self._decreased_at = time.monotonic()
+        else:
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+
+class AsyncConcurrencyLimit(ConcurrencyLimit):
+    '''ConcurrencyLimit for the coroutines of one event loop'''
+
+    def __init__(self, max_limit: int, min_limit: int = 1) -> None:
+        super().__init__(max_limit, min_limit)
+        self._cond = asyncio.Condition()
+
+    async def acquire(self) -> float:
+        async with self._cond:
+            await self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            self.in_flight += 1
+        return time.monotonic()
+
+    async def release(self, started: float, throttled: bool = False) -> None:
+        async with self._cond:
+            self._adjust(started, throttled)
+            self._cond.notify_all()
+
+
+class Throttle:
+    '''
+    wraps every API request:
+        started = throttle.acquire()
+        ... send the request ...
+        throttle.release(started, throttled=<429 or 5xx>)
+    and throttle.backoff(seconds) before a retry.
+    '''
+
+    def __init__(self, rate: float, max_concurrency: int, burst: float = None) -> None:
+        self.bucket = TokenBucket(rate, burst)
+        self.concurrency = ConcurrencyLimit(max_concurrency)
+        self._stats = dict.fromkeys(STAT_KEYS, 0)
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        waiting_since = time.monotonic()
+        started = self.concurrency.acquire()
+        rate_wait = self.bucket.acquire()
+        self._count(requests=1, concurrency_wait=started - waiting_since, rate_wait=rate_wait)
+        return started
+
+    def release(self, started: float, throttled: bool = False) -> None:
+        self.concurrency.release(started, throttled)
+        if throttled:
+            self._count(throttled=1)
+
+    def backoff(self, delay: float) -> None:
+        time.sleep(delay)
+        self._count(backoff_wait=delay)
+
+    def _count(self, **amounts) -> None:
+        with self._lock:
+            for key, amount in amounts.items():
+                self._stats[key] += amount
+
+    def stats(self) -> dict:
+        '''the counters since the throttle was created (wait times in seconds), and the current concurrency limit'''
+        with self._lock:
+            stats = dict(self._stats)
+        stats['concurrency_limit'] = int(self.concurrency.limit)
+        return stats
+
+
+class AsyncThrottle(Throttle):
+    '''
+    Throttle for the coroutines of one event loop, the methods are coroutines.
+    The token bucket can be shared with the threads of a Throttle, as they use the same API quota.
+    '''
+
+    def __init__(self, max_concurrency: int, bucket: TokenBucket) -> None:
+        self.bucket = bucket
+        self.concurrency = AsyncConcurrencyLimit(max_concurrency)
+        self._stats = dict.fromkeys(STAT_KEYS, 0)
+        self._lock = threading.Lock()
+
+    async def acquire(self) -> float:
+        waiting_since = time.monotonic()
+        started = await self.concurrency.acquire()
+        rate_wait = self.bucket.reserve()
+        if rate_wait:
+            await asyncio.sleep(rate_wait)
+        self._count(requests=1, concurrency_wait=started - waiting_since, rate_wait=rate_wait)
+        return started
+
+    async def release(self, started: float, throttled: bool = False) -> None:
+        await self.concurrency.release(started, throttled)
+        if throttled:
+            self._count(throttled=1)
+
+    async def backoff(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        self._count(backoff_wait=delay)
+
+
+_shared = None
+_shared_lock = threading.Lock()
+
+
+def shared_throttle(rate: float, max_concurrency: int, burst: float = None) -> Throttle:
+    '''
+    the process-wide Throttle, created on first use: the API quota is per project, not per Collector.
+    The arguments only apply to that first call, later calls return it unchanged (Collector.query resizes its
+    concurrency to num_threads, a new Collector must not clamp the limit of a query already running).
+    '''
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            _shared = Throttle(rate, max_concurrency, burst)
+        return _shared
@@ -0,0 +1,108 @@
+#!/bin/python3
+'''
+HTTP transports of AsyncCollector. A transport is any object with the coroutines:
+
+    get(url: str, headers: dict) -> (status: int, headers: dict, body: bytes)
+    close()
+
+StreamsTransport is the default. Tests and benchmarks can pass their own, or point the collector at a local server.
+'''
+import asyncio
+import gzip
+import ssl
+from urllib.parse import urlsplit
+
+
+class StreamsTransport:
+    '''
+    minimal HTTP/1.1 client on asyncio streams, as much as the Reports API needs: GET requests,
+    keep-alive connections reused per host, Content-Length and chunked bodies, and gzip responses.
+    The number of connections is not limited here, but by the requests in flight (see AsyncThrottle).
+    '''
+
+    def __init__(self, timeout: float = 120, max_idle: int = 100, ssl_context: ssl.SSLContext = None) -> None:
+        self.timeout = timeout
+        self.max_idle = max_idle  # idle connections kept open per host
+        self.ssl_context = ssl_context
+        self._idle = dict()  # (host, port, tls) -> [(reader, writer)]
+
+    async def get(self, url: str, headers: dict = None) -> tuple:
+        return await asyncio.wait_for(self.__get(url, headers or dict()), self.timeout)
+
+    async def __get(self, url: str, headers: dict) -> tuple:
+        parts = urlsplit(url)
+        tls = parts.scheme == 'https'
+        key = (parts.hostname, parts.port or (443 if tls else 80), tls)
+        target = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        lines = [f'GET {target} HTTP/1.1', f'Host: {parts.netloc}', 'Accept-Encoding: gzip']
+        lines += [f'{name}: {value}' for name, value in headers.items()]
+        request = ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+        while True:
+            idle = self._idle.get(key)
+            reused = bool(idle)
+            reader, writer = idle.pop() if reused else await self.__connect(key)
+            try:
+                writer.write(request)
+                await writer.drain()
+                status, response_headers, body, keep_alive = await self.__read_response(reader)
+            except (ConnectionError, asyncio.IncompleteReadError):
+                writer.close()
+                if reused:  # the server closed the idle connection, retry on a new one
+                    continue
+                raise
+            except BaseException:
+                writer.close()
+                raise
+            break
+
+        if keep_alive and len(self._idle.setdefault(key, [])) < self.max_idle:
+            self._idle[key].append((reader, writer))
+        else:
+            writer.close()
+        if response_headers.get('content-encoding') == 'gzip':
+            body = gzip.decompress(body)
+        return status, response_headers, body
+
+    async def __connect(self, key: tuple):
+        host, port, tls = key
+        ssl_context = (self.ssl_context or ssl.create_default_context()) if tls else None
+        return await asyncio.open_connection(host, port, ssl=ssl_context)
+
+    async def __read_response(self, reader: asyncio.StreamReader) -> tuple:
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError('connection closed by the server')
+        version, status = status_line.decode('latin-1').split()[:2]
+        headers = dict()
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        keep_alive = version == 'HTTP/1.1' and headers.get('connection', '').lower() != 'close'
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b';')[0], 16)
+                if size == 0:
+                    while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+                        pass  # trailers
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            body = b''.join(chunks)
+        elif 'content-length' in headers:
+            body = await reader.readexactly(int(headers['content-length']))
+        else:
+            body = await reader.read()
+            keep_alive = False
+        return int(status), headers, body, keep_alive
+
+    async def close(self) -> None:
+        idle, self._idle = self._idle, dict()
+        for connections in idle.values():
+            for _, writer in connections:
+                writer.close()
@@ -0,0 +1,122 @@
+#!/bin/python3
+'''
+live monitoring: polls the Reports API for new activities and reports kill chain subchains as they form.
+
+    W = Watcher('all', interval=60)
+    for subchain, events in W.run():  # until interrupted
+        print(subchain, events['actor.email'].unique())
+
+Every poll lists the activities of each logtype since the last id.time seen, labels them as Alfa.query does
+(see Analyser) and feeds their events, in time order, to a KillChainStream. Only the events of the subchain
+search in progress are kept, so memory does not grow with the time watched.
+
+The Reports API can list an activity minutes after newer ones. overlap lists the last seconds again on every
+poll to pick those up. They are fed when they are received, after the events already fed.
+'''
+import time
+
+import numpy as np
+import pandas as pd
+
+from ..utils.dates import normalize_datetime
+from .activity import Activities
+from .alfa import Alfa
+from .analyser import Analyser
+from .collector import Collector
+from .kill_chain import KillChainStream
+
+EVENT_COLUMNS = ['activity_time', 'activity_id', 'actor.email', 'logtype', 'type', 'name',
+                 'attack.label', 'attack.category', 'attack.index']
+
+
+class Watcher:
+    '''
+    logtype: 'all', a logtype or a list of logtypes, see Collector.query
+    start_time: watch from this time (default: now)
+    interval: seconds between polls, see run
+    overlap: seconds listed again on every poll, for the activities the API lists late
+    filter: drop the benign activities, as Alfa.query does
+    collector: the Collector to poll with, e.g. Collector(api_endpoint=...) (default: a new Collector)
+    stream: the KillChainStream the events are fed to (default: one with the kill_chain settings of config.yml)
+    '''
+
+    def __init__(self, logtype='all', user: str = 'all', start_time: str = None, interval: float = 60,
+                 overlap: float = 0, filter: bool = True, max_results: int = 1000, collector: Collector = None,
+                 stream: KillChainStream = None) -> None:
+        self.collector = collector or Collector()
+        self.logtypes = self.collector._logtypes(logtype)
+        self.user = user
+        self.interval = interval
+        self.overlap = pd.Timedelta(seconds=overlap)
+        self.filter = filter
+        self.max_results = max_results
+        self.stream = stream or KillChainStream()
+        self.last_time = pd.Timestamp(normalize_datetime(start_time) or pd.Timestamp.now(tz='UTC'))
+        self.seen = dict()  # (logtype, id) -> id.time of the activities already fed, since last_time - overlap
+        self.events = pd.DataFrame(columns=EVENT_COLUMNS)  # the events not consumed by the stream, by position
+        self.polls = 0
+
+    def poll(self) -> list:
+        '''lists the new activities once, returns the subchains that became final as [(subchain, events)]'''
+        since = self.last_time - self.overlap
+        new = []
+        for logtype in self.logtypes:
+            for page in self.collector.iter_pages(logtype, self.user, self.max_results, start_time=since.isoformat()):
+                new += [
+                    (logtype, activity) for activity in page
+                    if (logtype, activity['id']['uniqueQualifier']) not in self.seen
+                ]
+        self.polls += 1
+        if not new:
+            return []
+        df = pd.json_normalize([activity for _, activity in new])
+        df['logtype'] = [logtype for logtype, _ in new]
+        self.__remember(df)
+        return self.__feed(self.__events(df))
+
+    def __remember(self, df: pd.DataFrame) -> None:
+        times = pd.to_datetime(df['id.time'], format='ISO8601')
+        self.last_time = max(self.last_time, times.max())
+        self.seen.update(zip(zip(df['logtype'], df['id.uniqueQualifier']), times))
+        since = self.last_time - self.overlap
+        self.seen = {key: t for key, t in self.seen.items() if t >= since}
+
+    def __events(self, df: pd.DataFrame) -> pd.DataFrame:
+        '''the labelled events of the new activities, in time order, with the actor and logtype of their activity'''
+        records = Analyser().analyse(df, filter=self.filter)
+        if records.shape[0] == 0:
+            return self.events.iloc[0:0]
+        A = Alfa(Activities(records))
+        E = A.events
+        if E.shape[0] == 0:
+            return self.events.iloc[0:0]
+        positions = E['activity_pos'].to_numpy()
+        for column in ('actor.email', 'logtype'):
+            E[column] = A.activities[column].to_numpy()[positions]
+        return pd.DataFrame(E).reindex(columns=EVENT_COLUMNS)
+
+    def __feed(self, E: pd.DataFrame) -> list:
+        E.index = np.arange(len(self.stream), len(self.stream) + len(E))
+        self.events = pd.concat([self.events, E]) if len(self.events) else E
+        return self.__emit(self.stream.feed(E['attack.index']))
+
+    def __emit(self, subchains: list) -> list:
+        res = [(subchain, self.events.loc[subchain[0]:subchain[1] - 1]) for subchain in subchains]
+        self.events = self.events.loc[self.stream.offset:]
+        return res
+
+    def flush(self) -> list:
+        '''the subchains still waiting for more events, as [(subchain, events)], see KillChainStream.flush'''
+        return self.__emit(self.stream.flush())
+
+    def run(self, polls: int = None):
+        '''
+        polls every `interval` seconds, yields (subchain, events) as the subchains become final.
+        polls: stop after this many polls (and flush), default: never
+        '''
+        while True:
+            yield from self.poll()
+            if polls is not None and self.polls >= polls:
+                yield from self.flush()
+                return
+            time.sleep(self.interval)
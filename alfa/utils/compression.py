@@ -0,0 +1,45 @@
+#!/bin/python3
+'''
+compressed data files, written by Collector.query with compress='gzip' or 'lzma':
+    <logtype>.json.gz, <logtype>.json.xz
+'''
+import gzip
+import lzma
+
+SUFFIXES = {None: '', 'gzip': '.gz', 'lzma': '.xz'}
+DATA_SUFFIXES = ('.json', '.json.gz', '.json.xz')
+
+
+def check_compression(compress: str) -> str:
+    if compress not in SUFFIXES:
+        raise ValueError(f"unknown compression '{compress}', use one of: gzip, lzma")
+    return compress
+
+
+def data_file_name(logtype: str, compress: str = None) -> str:
+    return logtype + '.json' + SUFFIXES[check_compression(compress)]
+
+
+def is_data_file(filename: str) -> bool:
+    return filename.endswith(DATA_SUFFIXES) and not filename.endswith('.checkpoint.json')
+
+
+def compress_bytes(data: bytes, compress: str = None) -> bytes:
+    '''
+    data as one complete gzip member or xz stream. Concatenated members decompress as a single file,
+    so a compressed data file can still be appended to (and truncated) a block at a time.
+    '''
+    if compress == 'gzip':
+        return gzip.compress(data, compresslevel=6)
+    if compress == 'lzma':
+        return lzma.compress(data)
+    return data
+
+
+def open_text(path: str):
+    '''opens a data file for reading, decompressing it while it is read if it is compressed'''
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rt')
+    if path.endswith('.xz'):
+        return lzma.open(path, 'rt')
+    return open(path)
@@ -0,0 +1,129 @@
+#!/bin/python3
+'''
+seeded generator of synthetic Workspace audit activities, shaped like the Reports API returns them.
+Used by the benchmarks and the local stand-in of the API (benchmarks/), and handy to try ALFA without a tenant.
+
+Every activity belongs to one of `actors` users and one of `logtypes`. Most events are benign, a fraction
+(mitre_rate) are drawn from config/event_to_mitre.yml, and `attacks` attack sequences are embedded: a
+compromised actor walking the kill chain (persistence -> ... -> collection) within a short time, which is
+what Alfa.subchains and Alfa.aoi should find.
+
+    activities = generate_activities(100_000, seed=1)       # list of dicts, newest first
+    write_dataset('data/synthetic', 100_000, seed=1)        # <logtype>.json files, like Collector.query saves
+'''
+import json
+import os
+import random
+from datetime import datetime, timezone
+
+from ..main.mapping import MitreMapping
+
+LOGTYPES = ['admin', 'drive', 'login', 'token']
+BENIGN_EVENTS = ['view', 'edit', 'create', 'upload', 'rename', 'move', 'preview', 'print', 'logout']  # not in event_to_mitre.yml
+END_TIME = '2024-02-01T00:00:00Z'  # the default end, so that a seed always gives the same dataset
+ATTACK_SPAN = 3600  # an attack sequence spans at most this many seconds
+ACTIVITIES_PER_ATTACK = 10000  # default number of attacks: one per this many activities
+
+
+def attack_events() -> dict:
+    '''kill chain index -> the names of the events of event_to_mitre.yml with that index'''
+    mapping = MitreMapping.load()
+    events = dict()
+    for name, index in mapping.indexes.items():
+        events.setdefault(int(index), []).append(name)
+    return {index: sorted(names) for index, names in sorted(events.items())}
+
+
+def format_time(ms: int) -> str:
+    '''milliseconds since the epoch -> id.time as the API returns it, e.g. 2024-01-31T23:59:59.123Z'''
+    return datetime.fromtimestamp(ms / 1000, timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z'
+
+
+def iter_activities(n: int, logtypes: list = None, actors: int = 200, days: float = 30, end: str = None,
+                    attacks: int = None, mitre_rate: float = 0.05, seed: int = 0):
+    '''
+    yields (logtype, activity) for n activities, newest first. Same seed and options, same activities.
+        logtypes: the applicationName of the activities (default LOGTYPES), picked uniformly
+        actors: number of distinct actor.email
+        days, end: the activities are spread over the `days` days before `end` (default END_TIME)
+        attacks: number of embedded attack sequences (default 1 per ACTIVITIES_PER_ATTACK activities)
+        mitre_rate: fraction of the other events whose name is in event_to_mitre.yml
+    '''
+    rng = random.Random(seed)
+    logtypes = logtypes or LOGTYPES
+    end_ms = int(datetime.fromisoformat((end or END_TIME).replace('Z', '+00:00')).timestamp() * 1000)
+    span_ms = int(days * 86400 * 1000)
+    if attacks is None:
+        attacks = n // ACTIVITIES_PER_ATTACK if n >= ACTIVITIES_PER_ATTACK else int(n >= 1000)
+    chain = attack_events()
+    mitre_list = [name for names in chain.values() for name in names]
+    mitre_events = set(mitre_list)
+    benign_events = [name for name in BENIGN_EVENTS if name not in mitre_events]
+
+    # (time, actor, event names) of the attack sequences: each one climbs the kill chain on one actor
+    slots = []
+    for _ in range(attacks):
+        if len(slots) >= n:
+            break
+        actor = rng.randrange(actors)
+        t = end_ms - rng.randrange(span_ms)
+        step = ATTACK_SPAN * 1000 // (2 * len(chain))
+        for index in chain:
+            for _ in range(rng.randint(1, 2)):
+                slots.append((t, actor, [rng.choice(chain[index])]))
+                t = min(end_ms, t + rng.randint(1000, step))
+    slots = slots[:n]
+    slots += [(end_ms - rng.randrange(span_ms), None, None) for _ in range(n - len(slots))]
+    slots.sort(key=lambda slot: slot[0], reverse=True)
+
+    for t, actor, names in slots:
+        if actor is None:
+            actor = rng.randrange(actors)
+            names = [
+                rng.choice(mitre_list) if rng.random() < mitre_rate else rng.choice(benign_events)
+                for _ in range(rng.randint(1, 3))
+            ]
+        logtype = 'admin' if names[0] in mitre_events and 'admin' in logtypes else rng.choice(logtypes)
+        yield logtype, {
+            'kind': 'admin#reports#activity',
+            'id': {
+                'time': format_time(t),
+                'uniqueQualifier': str(rng.getrandbits(63)),
+                'applicationName': logtype,
+                'customerId': 'C01234567',
+            },
+            'etag': f'"{rng.getrandbits(64):016x}"',
+            'actor': {'callerType': 'USER', 'email': f'user{actor}@example.com', 'profileId': str(10**20 + actor)},
+            'ipAddress': f'10.0.{rng.randint(0, 255)}.{rng.randint(0, 255)}',
+            'events': [{
+                'type': 'synthetic',
+                'name': name,
+                'parameters': [{'name': 'doc_id', 'value': str(rng.getrandbits(32))}],
+            } for name in names],
+        }
+
+
+def generate_activities(n: int, **options) -> list:
+    '''n activities (dicts) of all logtypes, newest first, see iter_activities for the options'''
+    return [activity for _, activity in iter_activities(n, **options)]
+
+
+def write_dataset(path: str, n: int, **options) -> dict:
+    '''
+    writes n activities to <path>/<logtype>.json (NDJSON, newest first, like Collector.query saves them).
+    Returns the number of activities per logtype. See iter_activities for the options
+    '''
+    os.makedirs(path, exist_ok=True)
+    files = dict()
+    counts = dict()
+    try:
+        for logtype, activity in iter_activities(n, **options):
+            if logtype not in files:
+                files[logtype] = open(os.path.join(path, logtype + '.json'), 'w')
+                counts[logtype] = 0
+            files[logtype].write(json.dumps(activity) + '\n')
+            counts[logtype] += 1
+    finally:
+        for f in files.values():
+            f.close()
+    return counts
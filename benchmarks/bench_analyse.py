@@ -0,0 +1,47 @@
+#!/bin/python3
+'''
+compares Analyser.analyse_rows (row by row) with Analyser.analyse_vectorized
+on a synthetic dataset and checks that both produce the same output.
+
+usage (from the repository root): python -m benchmarks.bench_analyse [num_activities]
+'''
+import copy
+import sys
+import time
+
+import pandas as pd
+
+from alfa.main.analyser import Analyser
+from alfa.utils.synthetic import generate_activities
+
+
+def make_activities(n: int, seed: int = 0) -> pd.DataFrame:
+    return pd.json_normalize(generate_activities(n, seed=seed))
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    res = fn(*args, **kwargs)
+    return res, time.perf_counter() - start
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    df = make_activities(n)
+    A = Analyser()
+
+    rows, t_rows = timed(A.analyse_rows, copy.deepcopy(df))
+    vect, t_vect = timed(A.analyse_vectorized, copy.deepcopy(df))
+
+    assert rows.index.equals(vect.index), 'labelled activities differ'
+    assert rows['events'].tolist() == vect['events'].tolist(), 'labelled events differ'
+
+    print(f'activities:      {n}')
+    print(f'labelled:        {vect.shape[0]}')
+    print(f'analyse_rows:       {t_rows:8.3f}s')
+    print(f'analyse_vectorized: {t_vect:8.3f}s')
+    print(f'speedup:            {t_rows / t_vect:8.1f}x')
+
+
+if __name__ == '__main__':
+    main()
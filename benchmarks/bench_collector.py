@@ -0,0 +1,81 @@
+#!/bin/python3
+'''
+acquisition throughput of Collector.query (threads) and AsyncCollector.query (asyncio) against the
+local stand-in of the Reports API (fake_reports_api.py), for several thread counts and page sizes.
+Reports pages/s, records/s and the retry overhead (requests throttled by the server, time spent in backoff).
+
+usage (from the repository root):
+    python -m benchmarks.bench_collector [--activities N] [--latency S] [--error-rate F] [--server-error-rate F]
+'''
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+
+from google.auth.credentials import AnonymousCredentials
+
+from alfa.main.async_collector import AsyncCollector
+from alfa.main.collector import Collector
+from alfa.main.throttle import Throttle
+
+from .bench_store import timed
+from .fake_reports_api import FakeReportsAPI
+
+LOGTYPES = ['admin', 'drive', 'login', 'token']
+
+
+def run(api: FakeReportsAPI, collector: Collector, threads: int, page_size: int, shards: int, rate: float) -> dict:
+    '''one acquisition of LOGTYPES, with a fresh throttle so runs don't share their AIMD state'''
+    collector.throttle = Throttle(rate, threads, rate)
+    collector.RETRY_INITIAL_DELAY = 0.1
+    before = api.stats()
+    with tempfile.TemporaryDirectory() as path, contextlib.redirect_stdout(io.StringIO()):
+        _, elapsed = timed(
+            collector.query, LOGTYPES, path=path, max_results=page_size, num_threads=threads,
+            shards=shards, return_as_df=False, columnar=False,
+        )
+        records = sum(1 for logtype in LOGTYPES for _ in open(os.path.join(path, logtype + '.json')))
+    served = {key: value - before[key] for key, value in api.stats().items()}
+    throttle = collector.throttle if not isinstance(collector, AsyncCollector) else collector._async_throttle
+    return dict(
+        elapsed=elapsed, records=records, pages=served['pages'],
+        retries=served['throttled'] + served['server_errors'], backoff=throttle.stats()['backoff_wait'],
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description='acquisition throughput against a local Reports API stand-in')
+    parser.add_argument('--activities', type=int, default=20000, help='activities per logtype')
+    parser.add_argument('--latency', type=float, default=0.05, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.02)
+    parser.add_argument('--error-rate', type=float, default=0.02, help='fraction of 429 responses')
+    parser.add_argument('--server-error-rate', type=float, default=0.01, help='fraction of 503 responses')
+    parser.add_argument('--rate', type=float, default=1000, help='client side request rate limit (requests/s)')
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 4, 10, 20])
+    parser.add_argument('--page-sizes', type=int, nargs='+', default=[100, 1000])
+    args = parser.parse_args()
+
+    credentials = AnonymousCredentials()
+    api = FakeReportsAPI(args.activities, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate,
+                         server_error_rate=args.server_error_rate, process=True)
+    with api:
+        print(f'{len(LOGTYPES)} logtypes x {args.activities} activities, latency {args.latency}s '
+              f'(+{args.jitter}s), {args.error_rate:.0%} 429, {args.server_error_rate:.0%} 503')
+        print(f'{"engine":>8} {"threads":>7} {"page":>5} {"time":>8} {"pages/s":>8} {"records/s":>10} '
+              f'{"retries":>8} {"backoff":>8}')
+        for page_size in args.page_sizes:
+            runs = [('threads', threads, Collector(credentials, api.url)) for threads in args.threads]
+            # the async engine has no threads, its requests in flight are capped like the threads
+            async_collector = AsyncCollector(max_in_flight=max(args.threads), credentials=credentials, api_endpoint=api.url)
+            runs.append(('async', max(args.threads), async_collector))
+            for engine, threads, collector in runs:
+                # shard so a single logtype can use more than one thread
+                res = run(api, collector, threads, page_size, max(1, threads // len(LOGTYPES)), args.rate)
+                print(f'{engine:>8} {threads:7} {page_size:5} {res["elapsed"]:7.2f}s '
+                      f'{res["pages"] / res["elapsed"]:8.1f} {res["records"] / res["elapsed"]:10.0f} '
+                      f'{res["retries"]:8} {res["backoff"]:7.2f}s')
+
+
+if __name__ == '__main__':
+    main()
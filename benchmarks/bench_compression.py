@@ -0,0 +1,61 @@
+#!/bin/python3
+'''
+compares the disk footprint and load time (Collector.load_all) of a dataset saved as
+plain NDJSON, gzip and lzma (Collector.query(compress=...)).
+
+usage (from the repository root): python -m benchmarks.bench_compression [num_activities]
+'''
+import os
+import sys
+import tempfile
+from itertools import islice
+
+from alfa.main.collector import Collector
+from alfa.utils.compression import compress_bytes, data_file_name
+
+from .bench_store import LOGTYPES, timed, write_dataset
+
+PAGE_SIZE = 1000  # activities per compressed block, as written by query_one with max_results=1000
+
+
+def compress_dataset(source: str, path: str, compress: str) -> None:
+    '''copies the data files of source to path, compressed one page at a time like query_one does'''
+    for logtype in LOGTYPES:
+        with open(os.path.join(source, logtype + '.json')) as f, \
+                open(os.path.join(path, data_file_name(logtype, compress)), 'wb') as out:
+            while True:
+                page = list(islice(f, PAGE_SIZE))
+                if not page:
+                    break
+                out.write(compress_bytes(''.join(page).encode(), compress))
+
+
+def dataset_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    C = Collector()
+    with tempfile.TemporaryDirectory() as root:
+        plain = os.path.join(root, 'plain')
+        os.makedirs(plain)
+        write_dataset(plain, n)
+        reference, t_plain = timed(C.load_all, plain)
+        size_plain = dataset_size(plain)
+
+        print(f'activities: {n}')
+        print(f'{"":6} {"size (MB)":>10} {"ratio":>6} {"write":>8} {"load":>8}')
+        print(f'{"plain":6} {size_plain / 1e6:10.1f} {1:6.1f} {"":>8} {t_plain:7.3f}s')
+        for compress in ('gzip', 'lzma'):
+            path = os.path.join(root, compress)
+            os.makedirs(path)
+            _, t_write = timed(compress_dataset, plain, path, compress)
+            df, t_load = timed(C.load_all, path)
+            assert df.shape == reference.shape
+            size = dataset_size(path)
+            print(f'{compress:6} {size / 1e6:10.1f} {size_plain / size:6.1f} {t_write:7.3f}s {t_load:7.3f}s')
+
+
+if __name__ == '__main__':
+    main()
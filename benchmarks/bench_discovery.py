@@ -0,0 +1,64 @@
+#!/bin/python3
+'''
+setup cost of the Reports API clients of the Collector threads:
+    build          googleapiclient.discovery.build for every thread, which finds and parses the discovery
+                   document again and creates the activities resource (what Collector did before)
+    thread_http    one service for the Collector (build_service, from the document parsed once per process,
+                   see alfa/main/discovery.py) shared by the threads, each thread only creates an http client
+Collector sets up one client per thread and per Collector, e.g. every Alfa.query.
+
+usage (from the repository root):
+    python -m benchmarks.bench_discovery [--threads 200]
+'''
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from google.auth.credentials import AnonymousCredentials
+from googleapiclient.discovery import build
+
+from alfa.main import discovery
+
+
+def build_default(credentials):
+    '''a service and its activities resource per thread'''
+    return build('admin', 'reports_v1', credentials=credentials).activities()
+
+
+def thread_http(credentials):
+    '''an http client per thread, the service is built once before the threads start (see main)'''
+    return discovery.authorized_http(credentials)
+
+
+def run(setup, threads: int, credentials) -> float:
+    '''seconds per thread, for `threads` threads setting up their client'''
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=10) as executor:
+        list(executor.map(lambda _: setup(credentials), range(threads)))
+    return (time.perf_counter() - start) / threads
+
+
+def main():
+    parser = argparse.ArgumentParser(description='setup cost of the Reports API clients of the Collector threads')
+    parser.add_argument('--threads', type=int, default=200)
+    args = parser.parse_args()
+
+    discovery.clear()
+    start = time.perf_counter()
+    discovery.discovery_document()
+    first = time.perf_counter() - start
+
+    credentials = AnonymousCredentials()
+    default = run(build_default, args.threads, credentials)
+    start = time.perf_counter()
+    discovery.build_service(credentials).activities()  # once per Collector, before its threads start
+    service = time.perf_counter() - start
+    shared = run(thread_http, args.threads, credentials) + service / args.threads
+    print(f'discovery document: {first * 1000:.2f} ms, once per process')
+    print(f'{"":>12} {"ms/thread":>10}')
+    print(f'{"build":>12} {default * 1000:10.3f}')
+    print(f'{"thread_http":>12} {shared * 1000:10.3f}  {default / shared:.0f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,85 @@
+#!/bin/python3
+'''
+regression check and timing for KillChain.discern_subchains.
+
+compares the incremental subchain search (KillChainWindow) with the reference search, which
+recomputes generate_kill_chain_statistic for every window, on randomized attack index sequences.
+Both must return exactly the same subchains.
+
+usage (from the repository root): python -m benchmarks.bench_kill_chain [num_sequences] [timing_length]
+'''
+import random
+import sys
+import time
+
+from alfa.main.kill_chain import KillChain, KillChainStatistic, KillChainWindow
+
+INDEXES = [1, 2, 3, 4, 5, 6, 7, float('nan')]
+
+
+def random_chain(rng: random.Random, length: int) -> list:
+    '''attack indexes that mostly increase, with noise and unlabelled (NaN) events mixed in'''
+    chain = []
+    value = rng.randint(1, 7)
+    for _ in range(length):
+        if rng.random() < 0.3:
+            chain.append(rng.choice(INDEXES))
+            continue
+        value = min(7, max(1, value + rng.choice([-1, 0, 1, 1, 2])))
+        if value == 7 and rng.random() < 0.2:
+            value = 1
+        chain.append(value)
+    return chain
+
+
+def check(num_sequences: int, seed: int = 0) -> None:
+    rng = random.Random(seed)
+    for i in range(num_sequences):
+        chain = random_chain(rng, rng.randint(1, 400))
+        min_length = rng.randint(2, 10)
+        min_stat = rng.choice([0.2, 0.4, 0.6, 0.8])
+        expected = KillChain.discern_subchains(chain, min_length, min_stat, incremental=False)
+        result = KillChain.discern_subchains(chain, min_length, min_stat, incremental=True)
+        assert result == expected, f'sequence {i}: {result} != {expected}\nchain: {chain}'
+    print(f'{num_sequences} random sequences: incremental and reference subchains are identical')
+
+
+def check_statistics(num_sequences: int, seed: int = 0) -> None:
+    '''a KillChainStatistic compares (<, ==, ...) and hashes as its exact value'''
+    rng = random.Random(seed)
+    compared = 0
+    for i in range(num_sequences):
+        window = KillChainWindow(random_chain(rng, rng.randint(1, 400)))
+        for _ in range(20):
+            start = rng.randrange(len(window))
+            stat = window.statistic(start, rng.randint(start, len(window)))
+            if not isinstance(stat, KillChainStatistic):
+                continue
+            exact = stat.exact()
+            assert stat == exact and not stat != exact and hash(stat) == hash(exact), f'sequence {i}: {stat!r}'
+            assert stat <= exact and stat >= exact and not stat < exact and not stat > exact, f'sequence {i}: {stat!r}'
+            compared += 1
+    print(f'{compared} statistics compare and hash as their exact value')
+
+
+def timing(length: int, seed: int = 0) -> None:
+    '''the reference search grows with the window length, the incremental one should not'''
+    chain = random_chain(random.Random(seed), length)
+    for min_length in (7, KillChain.INCREMENTAL_MIN_LENGTH, 25, 100):
+        for incremental in (False, True):
+            start = time.perf_counter()
+            subchains = KillChain.discern_subchains(chain, min_length, 0.3, incremental=incremental)
+            elapsed = time.perf_counter() - start
+            print(f'min_length={min_length:<4} incremental={incremental!s:<5} subchains={len(subchains):<6} {elapsed:8.3f}s')
+
+
+def main():
+    num_sequences = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    length = int(sys.argv[2]) if len(sys.argv) > 2 else 20_000
+    check(num_sequences)
+    check_statistics(num_sequences)
+    timing(length)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,139 @@
+#!/bin/python3
+'''
+end-to-end timing of the analysis pipeline on synthetic datasets (alfa/utils/synthetic.py), stage by stage:
+    load               Collector.load_all (JSON parsing, json_normalize)
+    analyse            Analyser.analyse (labelling and filtering)
+    alfa_init          Alfa.__init__ (events table)
+    discern_subchains  KillChain.discern_subchains
+    subchains          Alfa.subchains
+    aoi                Alfa.aoi (with its JSON export)
+For every dataset size, reports the time and the peak memory (tracemalloc, measured in a second run, as
+tracing slows the pipeline down) of each stage. --output saves the results as JSON so that runs can be compared.
+
+usage (from the repository root):
+    python -m benchmarks.bench_pipeline [--sizes 10000 100000 1000000] [--output results.json] [--compare old.json]
+'''
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import alfa
+from alfa.main.activity import Activities
+from alfa.main.alfa import Alfa
+from alfa.main.analyser import Analyser
+from alfa.main.collector import Collector
+from alfa.main.kill_chain import KillChain
+from alfa.utils.synthetic import LOGTYPES, write_dataset
+
+STAGES = ['load', 'analyse', 'alfa_init', 'discern_subchains', 'subchains', 'aoi']
+
+
+def timed(fn, *args):
+    start = time.perf_counter()
+    res = fn(*args)
+    return res, time.perf_counter() - start, None
+
+
+def traced(fn, *args):
+    '''runs fn under tracemalloc, returns the peak memory allocated on top of what was allocated before'''
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    try:
+        res = fn(*args)
+        peak = tracemalloc.get_traced_memory()[1] - before
+    finally:
+        tracemalloc.stop()
+    return res, None, peak
+
+
+def run_pipeline(path: str, export: str, measure) -> dict:
+    '''runs every stage on the dataset in path (aoi exported to `export`), returns stage -> (seconds or peak bytes, rows out)'''
+    results = dict()
+
+    def stage(name, fn, *args):
+        res, seconds, peak = measure(fn, *args)
+        rows = len(res.events) if isinstance(res, Alfa) else len(res) if res is not None else 0
+        results[name] = (seconds if peak is None else peak, rows)
+        return res
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        df = stage('load', Collector().load_all, path)
+        records = stage('analyse', Analyser().analyse, df)
+        A = stage('alfa_init', lambda: Alfa(Activities(records)))
+        stage('discern_subchains', KillChain.discern_subchains, A.events['attack.index'])
+        stage('subchains', A.subchains)
+        stage('aoi', A.aoi, export)
+    return results
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='stage by stage timing of the analysis pipeline')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10_000, 100_000, 1_000_000], help='activities')
+    parser.add_argument('--actors', type=int, default=200)
+    parser.add_argument('--logtypes', nargs='+', default=LOGTYPES)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--no-memory', action='store_true', help='skip the peak memory run')
+    parser.add_argument('--output', default=None, help='save the results (JSON) to this file')
+    parser.add_argument('--compare', help='results of an earlier run (JSON), to print the speedup of this one')
+    args = parser.parse_args()
+
+    previous = dict()
+    if args.compare:
+        with open(args.compare) as f:
+            previous = {(r['activities'], r['stage']): r for r in json.load(f)['results']}
+
+    results = []
+    print(f'{"activities":>10} {"stage":>18} {"rows":>8} {"time":>9} {"peak (MB)":>10}' +
+          (f' {"before":>9} {"speedup":>8}' if previous else ''))
+    for n in args.sizes:
+        with tempfile.TemporaryDirectory() as root:
+            path, export = os.path.join(root, 'dataset'), os.path.join(root, 'aoi.json')
+            write_dataset(path, n, logtypes=args.logtypes, actors=args.actors, seed=args.seed)
+            times = run_pipeline(path, export, timed)
+            peaks = dict() if args.no_memory else run_pipeline(path, export, traced)
+        for stage in STAGES:
+            seconds, rows = times[stage]
+            peak = peaks[stage][0] if stage in peaks else None
+            results.append(dict(activities=n, stage=stage, rows=rows, seconds=seconds, peak_bytes=peak))
+            line = (f'{n:10} {stage:>18} {rows:8} {seconds:8.3f}s ' +
+                    (f'{peak / 1e6:10.1f}' if peak is not None else f'{"":>10}'))
+            if (n, stage) in previous:
+                before = previous[(n, stage)]['seconds']
+                line += f' {before:8.3f}s {before / seconds:7.2f}x'
+            print(line)
+
+    report = dict(
+        meta=dict(
+            time=pd.Timestamp.now(tz='UTC').isoformat(), revision=git_revision(), alfa=alfa.__version__,
+            python=platform.python_version(), pandas=pd.__version__, numpy=np.__version__,
+            machine=platform.machine(), cpus=os.cpu_count(),
+            options=dict(actors=args.actors, logtypes=args.logtypes, seed=args.seed),
+        ),
+        results=results,
+    )
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print('saved to', args.output)
+
+
+if __name__ == '__main__':
+    main()
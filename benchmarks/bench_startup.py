@@ -0,0 +1,91 @@
+#!/bin/python3
+'''
+startup time of the alfa command: the commands that do not analyse anything should not wait for pandas, the
+Google API client or IPython to import. Every command runs in a fresh interpreter, several times, and the
+median is compared to its budget.
+    import    python -c "import alfa"
+    help      alfa --help
+    init      alfa init <new directory>
+Exits with 1 if a command is over its budget, so it can run in CI. --imports prints the slowest packages each
+command imports (python -X importtime), to see what to defer.
+
+usage (from the repository root):
+    python -m benchmarks.bench_startup [--repeat 10] [--budget-help 0.25] [--budget-init 0.3] [--imports]
+'''
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def commands(workdir: str) -> dict:
+    '''name -> argv, init gets a new project directory in workdir every run'''
+    return {
+        'import': lambda run: [sys.executable, '-c', 'import alfa'],
+        'help': lambda run: [sys.executable, '-m', 'alfa', '--help'],
+        'init': lambda run: [sys.executable, '-m', 'alfa', 'init', os.path.join(workdir, f'project{run}')],
+    }
+
+
+def run_once(argv: list, importtime: bool = False) -> tuple:
+    '''(seconds, stderr) of one run of argv from the repository root'''
+    if importtime:
+        argv = [argv[0], '-X', 'importtime'] + argv[1:]
+    start = time.perf_counter()
+    res = subprocess.run(argv, cwd=ROOT, capture_output=True, text=True, stdin=subprocess.DEVNULL)
+    seconds = time.perf_counter() - start
+    if res.returncode != 0:
+        raise RuntimeError(f'{" ".join(argv)} failed:\n{res.stderr}')
+    return seconds, res.stderr
+
+
+def slowest_imports(stderr: str, top: int) -> list:
+    '''[(cumulative µs, package)] of the slowest packages imported, from the output of python -X importtime'''
+    packages = dict()
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, module = line[len('import time:'):].split('|')
+        package = module.strip().split('.')[0]
+        if package not in ('alfa', 'site', 'encodings'):
+            packages[package] = max(packages.get(package, 0), int(cumulative))
+    return sorted(((cumulative, package) for package, cumulative in packages.items()), reverse=True)[:top]
+
+
+def main():
+    parser = argparse.ArgumentParser(description='startup time of the alfa command')
+    parser.add_argument('--repeat', type=int, default=10)
+    parser.add_argument('--budget-import', type=float, default=0.15, help='seconds (median)')
+    parser.add_argument('--budget-help', type=float, default=0.25, help='seconds (median)')
+    parser.add_argument('--budget-init', type=float, default=0.3, help='seconds (median)')
+    parser.add_argument('--imports', action='store_true', help='print the slowest imports of each command')
+    args = parser.parse_args()
+    budgets = {'import': args.budget_import, 'help': args.budget_help, 'init': args.budget_init}
+
+    over = []
+    print(f'{"command":>8} {"median":>8} {"min":>8} {"budget":>8}')
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, argv in commands(workdir).items():
+            run_once(argv('warmup'))  # the first run compiles the bytecode
+            times = [run_once(argv(run))[0] for run in range(args.repeat)]
+            median = statistics.median(times)
+            status = '' if median <= budgets[name] else 'OVER BUDGET'
+            print(f'{name:>8} {median:7.3f}s {min(times):7.3f}s {budgets[name]:7.3f}s {status}')
+            if status:
+                over.append(name)
+            if args.imports:
+                _, stderr = run_once(argv('imports'), importtime=True)
+                for cumulative, module in slowest_imports(stderr, 8):
+                    print(f'{"":>8} {cumulative / 1e6:7.3f}s {module}')
+    if over:
+        print('over budget:', ', '.join(over))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,42 @@
+#!/bin/python3
+'''
+compares reloading a dataset from the raw NDJSON files (Collector.load_all)
+with reloading it from its columnar copy (ColumnStore.read), and the cost of writing the copy (alfa acquire --columnar).
+
+usage (from the repository root): python -m benchmarks.bench_store [num_activities]
+'''
+import sys
+import tempfile
+import time
+
+from alfa.main.collector import Collector
+from alfa.main.store import ColumnStore
+from alfa.utils.synthetic import LOGTYPES, write_dataset
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    res = fn(*args, **kwargs)
+    return res, time.perf_counter() - start
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    C = Collector()
+    with tempfile.TemporaryDirectory() as path:
+        write_dataset(path, n)
+        _, t_write = timed(lambda: [C.write_columnar(path, logtype) for logtype in LOGTYPES])
+        from_json, t_json = timed(C.load_all, path)
+        from_store, t_store = timed(ColumnStore(path).read)
+        _, t_projected = timed(ColumnStore(path).read, columns=['id.uniqueQualifier', 'id.time', 'events'])
+
+        assert from_json.shape == from_store.shape
+        print(f'activities:               {n}')
+        print(f'write columnar (acquire): {t_write:8.3f}s')
+        print(f'load json:                {t_json:8.3f}s')
+        print(f'load columnar:            {t_store:8.3f}s  ({t_json / t_store:.1f}x)')
+        print(f'load columnar, 3 columns: {t_projected:8.3f}s  ({t_json / t_projected:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
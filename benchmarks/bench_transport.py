@@ -0,0 +1,91 @@
+#!/bin/python3
+'''
+connections (TLS handshakes) opened by Collector.query against the local stand-in of the Reports API served over
+https (fake_reports_api.py, with a self-signed certificate made by openssl), for:
+    per_thread    an httplib2 client per thread (the default), whose connection ends with its thread
+    pooled        one PooledHttp shared by the threads (pool_size=threads), kept open between the queries
+Every run is `queries` acquisitions of LOGTYPES with the same Collector, e.g. one per logtype or per day.
+connect_latency adds the round trips of a handshake with a remote server to every new connection.
+
+usage (from the repository root):
+    python -m benchmarks.bench_transport [--queries 5] [--threads 4 10] [--connect-latency 0.05]
+'''
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import tempfile
+from functools import partial
+
+import httplib2
+from google.auth.credentials import AnonymousCredentials
+
+from alfa.main.collector import Collector
+from alfa.main.http_pool import PooledHttp
+
+from .bench_store import timed
+from .fake_reports_api import FakeReportsAPI
+
+LOGTYPES = ['admin', 'drive', 'login', 'token']
+
+
+def self_signed_certificate(directory: str) -> str:
+    '''path of a PEM file with a certificate for 127.0.0.1 and its key'''
+    certfile = os.path.join(directory, 'localhost.pem')
+    subprocess.run(
+        ['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=127.0.0.1',
+         '-addext', 'subjectAltName=IP:127.0.0.1', '-keyout', certfile, '-out', certfile],
+        check=True, capture_output=True,
+    )
+    return certfile
+
+
+def run(api: FakeReportsAPI, collector: Collector, queries: int, threads: int, page_size: int) -> dict:
+    '''`queries` acquisitions of LOGTYPES with collector'''
+    before = api.stats()
+    elapsed = 0
+    for _ in range(queries):
+        with tempfile.TemporaryDirectory() as path, contextlib.redirect_stdout(io.StringIO()):
+            _, seconds = timed(
+                collector.query, LOGTYPES, path=path, max_results=page_size, num_threads=threads,
+                shards=max(1, threads // len(LOGTYPES)), return_as_df=False, columnar=False,
+            )
+        elapsed += seconds
+    served = {key: value - before[key] for key, value in api.stats().items()}
+    return dict(elapsed=elapsed, requests=served['requests'], connections=served['connections'])
+
+
+def main():
+    parser = argparse.ArgumentParser(description='connections opened by the http clients of Collector over https')
+    parser.add_argument('--activities', type=int, default=5000, help='activities per logtype')
+    parser.add_argument('--latency', type=float, default=0.01, help='seconds added to every response')
+    parser.add_argument('--connect-latency', type=float, default=0.05, help='seconds added to every new connection')
+    parser.add_argument('--queries', type=int, default=5, help='queries per run, with the same Collector')
+    parser.add_argument('--threads', type=int, nargs='+', default=[4, 10])
+    parser.add_argument('--page-size', type=int, default=500)
+    args = parser.parse_args()
+
+    credentials = AnonymousCredentials()
+    with tempfile.TemporaryDirectory() as directory:
+        certfile = self_signed_certificate(directory)
+        httplib2.CA_CERTS = certfile  # trusted by the per thread clients (build_http), PooledHttp gets verify=
+        api = FakeReportsAPI(args.activities, latency=args.latency, process=True, certfile=certfile,
+                             connect_latency=args.connect_latency)
+        with api:
+            print(f'{len(LOGTYPES)} logtypes x {args.activities} activities over https, {args.queries} queries, '
+                  f'latency {args.latency}s, connect latency {args.connect_latency}s')
+            print(f'{"client":>10} {"threads":>7} {"time":>8} {"requests":>8} {"handshakes":>10} {"req/conn":>8}')
+            for threads in args.threads:
+                runs = [
+                    ('per_thread', Collector(credentials, api.url)),
+                    ('pooled', Collector(credentials, api.url, http=partial(PooledHttp, pool_size=threads, verify=certfile))),
+                ]
+                for client, collector in runs:
+                    res = run(api, collector, args.queries, threads, args.page_size)
+                    print(f'{client:>10} {threads:7} {res["elapsed"]:7.2f}s {res["requests"]:8} '
+                          f'{res["connections"]:10} {res["requests"] / max(res["connections"], 1):8.1f}')
+
+
+if __name__ == '__main__':
+    main()
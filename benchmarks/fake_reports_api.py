@@ -0,0 +1,253 @@
+#!/bin/python3
+'''
+Local stand-in for the Reports API activities.list endpoint, to run the collectors without a Google tenant.
+Serves synthetic activities paginated like the API (newest first, maxResults, pageToken, startTime/endTime, userKey),
+and can inject latency, 429s and 5xx errors. Serves https with the certificate of certfile.
+
+    with FakeReportsAPI(activities=10000, latency=0.05, error_rate=0.02) as api:
+        C = Collector(credentials=AnonymousCredentials(), api_endpoint=api.url)
+        C.query('admin', ...)
+
+standalone (from the repository root): python -m benchmarks.fake_reports_api --port 8080 --latency 0.05
+'''
+import argparse
+import bisect
+import json
+import multiprocessing
+import random
+import re
+import ssl
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import pandas as pd
+
+from alfa.utils.synthetic import iter_activities
+
+BASE_PATH = '/admin/reports/v1/'
+LIST_PATH = re.compile(r'activity/users/([^/]+)/applications/([^/]+)$')
+STATS = ('requests', 'pages', 'records', 'throttled', 'server_errors', 'connections')
+
+
+def make_activities(logtype: str, n: int, days: float, seed: int) -> list:
+    '''n synthetic activities of a logtype over the last `days`, newest first: [(time in ns, email, json), ...]'''
+    end = pd.Timestamp.now(tz='UTC').floor('s').isoformat()
+    activities = [
+        activity for _, activity in
+        iter_activities(n, logtypes=[logtype], days=days, end=end, seed=seed ^ zlib.crc32(logtype.encode()))
+    ]
+    times = pd.to_datetime([activity['id']['time'] for activity in activities], format='ISO8601').as_unit('ns').asi8
+    return [(int(t), activity['actor']['email'], json.dumps(activity)) for t, activity in zip(times, activities)]
+
+
+class FakeReportsAPI:
+    '''
+    activities: number of activities per logtype (any applicationName is served)
+    days: the activities are spread over the last `days` days
+    latency, jitter: seconds added to every response (uniformly random up to jitter on top)
+    error_rate: fraction of requests answered with 429
+    server_error_rate: fraction of requests answered with 503
+    max_concurrency: requests in flight above this are answered with 429, like a per-project quota
+    process: serve from a separate process, so the server does not compete with the collector for the GIL
+    certfile, keyfile: serve https with this certificate (PEM) and its key (default: in certfile), instead of http.
+        Every connection accepted is a TLS handshake, counted in stats()['connections']
+    connect_latency: seconds added to every new connection, like the round trips of a handshake with a remote server
+    '''
+
+    def __init__(self, activities: int = 10000, days: float = 30, latency: float = 0.0, jitter: float = 0.0,
+                 error_rate: float = 0.0, server_error_rate: float = 0.0, max_concurrency: int = None,
+                 seed: int = 0, host: str = '127.0.0.1', port: int = 0, process: bool = False,
+                 certfile: str = None, keyfile: str = None, connect_latency: float = 0.0) -> None:
+        self.options = dict(
+            activities=activities, days=days, latency=latency, jitter=jitter, error_rate=error_rate,
+            server_error_rate=server_error_rate, max_concurrency=max_concurrency, seed=seed,
+            certfile=certfile, keyfile=keyfile, connect_latency=connect_latency,
+        )
+        self.host = host
+        self.port = port
+        self.process = process
+        self.counters = {name: multiprocessing.Value('q', 0) for name in STATS}
+        self._server = None
+        self._worker = None
+
+    @property
+    def url(self) -> str:
+        '''the api_endpoint of Collector and AsyncCollector'''
+        scheme = 'https' if self.options['certfile'] else 'http'
+        return f'{scheme}://{self.host}:{self.port}/'
+
+    def start(self) -> 'FakeReportsAPI':
+        if self.process:
+            ready = multiprocessing.Queue()
+            self._worker = multiprocessing.Process(
+                target=_serve_forever, args=(self.host, self.port, self.options, self.counters, ready), daemon=True)
+            self._worker.start()
+            self.port = ready.get(timeout=60)
+        else:
+            self._server = make_server(self.host, self.port, self.options, self.counters)
+            self.port = self._server.server_address[1]
+            self._worker = threading.Thread(target=self._server.serve_forever, daemon=True)
+            self._worker.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+        elif self._worker is not None:
+            self._worker.terminate()
+            self._worker.join()
+        self._worker = None
+
+    def stats(self) -> dict:
+        '''requests, pages and records served, errors injected and connections accepted, since the server started'''
+        return {name: counter.value for name, counter in self.counters.items()}
+
+    def __enter__(self) -> 'FakeReportsAPI':
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+
+def _serve_forever(host, port, options, counters, ready) -> None:
+    server = make_server(host, port, options, counters)
+    ready.put(server.server_address[1])
+    server.serve_forever()
+
+
+def make_server(host: str, port: int, options: dict, counters: dict) -> ThreadingHTTPServer:
+    datasets = dict()  # logtype -> (activities, negated times for bisect)
+    datasets_lock = threading.Lock()
+    rng = random.Random(options['seed'])
+    state = {'in_flight': 0}
+    state_lock = threading.Lock()
+
+    def count(name, amount=1):
+        with counters[name].get_lock():
+            counters[name].value += amount
+
+    def dataset(logtype):
+        with datasets_lock:
+            if logtype not in datasets:
+                activities = make_activities(logtype, options['activities'], options['days'], options['seed'])
+                datasets[logtype] = (activities, [-t for t, _, _ in activities])
+            return datasets[logtype]
+
+    def injected_error():
+        with state_lock:
+            over_quota = options['max_concurrency'] and state['in_flight'] > options['max_concurrency']
+            draw = rng.random()
+        if over_quota or draw < options['error_rate']:
+            return 429, 'RESOURCE_EXHAUSTED', 'rateLimitExceeded'
+        if draw < options['error_rate'] + options['server_error_rate']:
+            return 503, 'UNAVAILABLE', 'backendError'
+        return None
+
+    def list_activities(user, logtype, params):
+        activities, neg_times = dataset(logtype)
+        first, last = 0, len(activities)
+        if 'endTime' in params:  # exclusive
+            first = bisect.bisect_right(neg_times, -pd.Timestamp(params['endTime']).value)
+        if 'startTime' in params:  # inclusive
+            last = bisect.bisect_right(neg_times, -pd.Timestamp(params['startTime']).value)
+        selected = activities[first:last]
+        if user != 'all':
+            selected = [a for a in selected if a[1] == user]
+        offset = int(params.get('pageToken', 0))
+        max_results = min(int(params.get('maxResults', 1000)), 1000)
+        page = [a[2] for a in selected[offset:offset + max_results]]
+        body = '{"kind": "admin#reports#activities", "items": [' + ', '.join(page) + ']'
+        if offset + max_results < len(selected):
+            body += f', "nextPageToken": "{offset + max_results}"'
+        return body + '}', len(page)
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def setup(self):
+            count('connections')
+            if options['connect_latency']:
+                time.sleep(options['connect_latency'])
+            super().setup()
+
+        def do_GET(self):
+            with state_lock:
+                state['in_flight'] += 1
+            try:
+                self.handle_list()
+            finally:
+                with state_lock:
+                    state['in_flight'] -= 1
+
+        def handle_list(self):
+            count('requests')
+            delay = options['latency'] + (rng.random() * options['jitter'] if options['jitter'] else 0)
+            if delay:
+                time.sleep(delay)
+            url = urlsplit(self.path)
+            match = LIST_PATH.match(url.path[len(BASE_PATH):]) if url.path.startswith(BASE_PATH) else None
+            if match is None:
+                return self.respond(404, self.error_body(404, 'NOT_FOUND', 'notFound'))
+            error = injected_error()
+            if error is not None:
+                count('throttled' if error[0] == 429 else 'server_errors')
+                return self.respond(error[0], self.error_body(*error))
+            params = {name: values[0] for name, values in parse_qs(url.query).items()}
+            body, records = list_activities(unquote(match.group(1)), unquote(match.group(2)), params)
+            count('pages')
+            count('records', records)
+            self.respond(200, body)
+
+        def error_body(self, code, status, reason):
+            return json.dumps({'error': {'code': code, 'message': reason, 'status': status,
+                                         'errors': [{'reason': reason, 'message': reason}]}})
+
+        def respond(self, code, body):
+            body = body.encode()
+            self.send_response(code)
+            self.send_header('Content-Type', 'application/json; charset=UTF-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    server.daemon_threads = True
+    if options['certfile']:
+        context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        context.load_cert_chain(options['certfile'], options['keyfile'])
+        # the handshake runs on the first read, in the thread of the connection rather than the one accepting
+        server.socket = context.wrap_socket(server.socket, server_side=True, do_handshake_on_connect=False)
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description='local stand-in for the Reports API activities.list endpoint')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--activities', type=int, default=10000, help='activities per logtype')
+    parser.add_argument('--days', type=float, default=30)
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds added to every response')
+    parser.add_argument('--jitter', type=float, default=0.0)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='fraction of 429 responses')
+    parser.add_argument('--server-error-rate', type=float, default=0.0, help='fraction of 503 responses')
+    parser.add_argument('--max-concurrency', type=int, default=None)
+    parser.add_argument('--certfile', type=str, default=None, help='serve https with this certificate (PEM)')
+    parser.add_argument('--keyfile', type=str, default=None, help='its key, if not in the certificate file')
+    args = parser.parse_args()
+    api = FakeReportsAPI(args.activities, args.days, args.latency, args.jitter, args.error_rate,
+                         args.server_error_rate, args.max_concurrency, port=args.port,
+                         certfile=args.certfile, keyfile=args.keyfile)
+    server = make_server(api.host, api.port, api.options, api.counters)
+    print(f'serving on {api.url} (api_endpoint)')
+    server.serve_forever()
+
+
+if __name__ == '__main__':
+    main()